@@ -4,9 +4,10 @@ import logging
 import threading
 import csv
 import sys
-import concurrent.futures
-import queue
-from flask import Flask, render_template, redirect, url_for, flash, jsonify, request
+import io
+import json
+import base64
+from flask import Flask, Response, render_template, redirect, url_for, flash, jsonify, request, stream_with_context
 from dotenv import load_dotenv
 from plexapi.server import PlexServer
 from plexapi.exceptions import NotFound
@@ -51,6 +52,12 @@ from plex_playlist_sync.utils.helperClasses import UserInputs
 from plex_playlist_sync.utils.database import (
     initialize_db,
     get_missing_tracks,
+    query_missing_tracks,
+    get_missing_track_counts,
+    get_missing_track_playlists,
+    iter_missing_tracks_export,
+    iter_library_index_export,
+    EXPORT_COLUMNS,
     update_track_status,
     get_missing_track_by_id,
     add_managed_ai_playlist,
@@ -66,11 +73,17 @@ from plex_playlist_sync.utils.database import (
     clean_resolved_missing_tracks
 )
 from plex_playlist_sync.utils.downloader import DeezerLinkFinder, download_single_track_with_streamrip
+from plex_playlist_sync.utils.download_scheduler import DownloadScheduler
+from plex_playlist_sync.utils.bulk_download import start_bulk_download, get_bulk_download
 from plex_playlist_sync.utils.i18n import init_i18n_for_app, translate_status
+from plex_playlist_sync.utils.http_fixtures import start_fixture_mode_from_env
 
 # Initialize database
 initialize_db()
 
+# Optional HTTP record/replay mode (HTTP_FIXTURE_MODE=record|replay)
+start_fixture_mode_from_env()
+
 app = Flask(__name__, template_folder='templates')
 app.secret_key = os.getenv("FLASK_SECRET_KEY", "a-random-strong-secret-key")
 
@@ -80,25 +93,8 @@ init_i18n_for_app(app)
 # Shared application state
 app_state = {"status": "Idle", "last_sync": "Never", "is_running": False}
 
-# Download queue and executor
-download_queue = queue.Queue()
-download_executor = concurrent.futures.ThreadPoolExecutor(max_workers=2)
-
-def download_worker():
-    while True:
-        item = download_queue.get()
-        if item is None:
-            break
-        link, track_id = item
-        try:
-            logger.info(f"Starting download for {link} (Track ID: {track_id})")
-            download_single_track_with_streamrip(link)
-            update_track_status(track_id, 'downloaded')
-            logger.info(f"Download completed for {link} (Track ID: {track_id})")
-        except Exception as e:
-            logger.error(f"Error downloading {link} (Track ID: {track_id}): {e}", exc_info=True)
-        finally:
-            download_queue.task_done()
+# Download scheduler: parallel workers over the durable download_jobs queue
+download_scheduler = DownloadScheduler(download_single_track_with_streamrip)
 
 
 def run_task_in_background(trigger_label, target_function, *args):
@@ -141,21 +137,151 @@ def index():
 
 @app.route('/missing_tracks')
 def missing_tracks():
+    # Rows are loaded page by page from /api/missing_tracks as the user scrolls
     try:
-        tracks = get_missing_tracks()
-        logger.info(f"Retrieved {len(tracks)} missing tracks")
-        return render_template('missing_tracks.html', tracks=tracks)
+        counts = get_missing_track_counts()
     except Exception as e:
         logger.error(f"Error in missing_tracks view: {e}", exc_info=True)
         flash(f"Error retrieving missing tracks: {e}", "error")
-        return render_template('missing_tracks.html', tracks=[])
+        counts = {}
+    return render_template('missing_tracks.html', counts=counts)
+
+def _encode_cursor(after):
+    return base64.urlsafe_b64encode(json.dumps(after).encode()).decode() if after else None
+
+def _decode_cursor(cursor):
+    """The [sort value, id] pair encoded by _encode_cursor, or None; ValueError if it is malformed."""
+    if not cursor:
+        return None
+    after = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+    if not (isinstance(after, list) and len(after) == 2
+            and (after[0] is None or isinstance(after[0], (str, int, float))) and not isinstance(after[0], bool)
+            and isinstance(after[1], int) and not isinstance(after[1], bool)):
+        raise ValueError('Invalid cursor')
+    return after
+
+@app.route('/api/missing_tracks')
+def api_missing_tracks():
+    """
+    Keyset-paginated missing tracks. Query parameters: status (default 'missing', 'all' for any),
+    playlist, q (text in title/artist/album), sort (added|title|artist), order (asc|desc), cursor, limit.
+    The first page (no cursor) also carries the counts by status and the playlists for the filters.
+    """
+    status = request.args.get('status', 'missing')
+    status = None if status == 'all' else status
+    try:
+        after = _decode_cursor(request.args.get('cursor'))
+        limit = max(1, min(int(request.args.get('limit', 100)), 500))
+    except (ValueError, TypeError):
+        return jsonify({'error': 'Invalid cursor or limit'}), 400
+    tracks, next_after = query_missing_tracks(
+        status=status,
+        playlist=request.args.get('playlist') or None,
+        text=(request.args.get('q') or '').strip() or None,
+        sort=request.args.get('sort', 'added'),
+        descending=request.args.get('order', 'desc') != 'asc',
+        after=after,
+        limit=limit,
+    )
+    response = {'tracks': tracks, 'next_cursor': _encode_cursor(next_after)}
+    if after is None:
+        response['counts'] = get_missing_track_counts()
+        response['playlists'] = get_missing_track_playlists(status)
+    return jsonify(response)
+
+@app.route('/download_track', methods=['POST'])
+def download_track():
+    data = request.get_json(silent=True) or {}
+    track_id = data.get('track_id')
+    link = data.get('album_url') or data.get('link')
+    if not link:
+        return jsonify({'success': False, 'error': 'Missing download link'}), 400
+    queued = download_scheduler.submit(link, [int(track_id)] if track_id else [])
+    message = "Download added to queue" if queued else "Download already queued"
+    return jsonify({'success': True, 'message': message, 'queue': download_scheduler.stats()})
+
+@app.route('/api/download_queue')
+def download_queue_status():
+    return jsonify(download_scheduler.stats())
+
+@app.route('/api/download_queue/<int:job_id>/cancel', methods=['POST'])
+def cancel_download(job_id):
+    if not download_scheduler.cancel(job_id):
+        return jsonify({'success': False, 'error': 'Job is not queued, or is running in a batch download that cannot be stopped'}), 404
+    return jsonify({'success': True, 'queue': download_scheduler.stats()})
+
+@app.route('/api/bulk_download', methods=['POST'])
+def bulk_download():
+    """
+    Find and download many missing tracks server-side. Body: {"track_ids": [...]} or, without
+    track_ids, {"playlist": ..., "q": ...} to take every missing track matching those filters.
+    """
+    data = request.get_json(silent=True) or {}
+    track_ids = data.get('track_ids')
+    try:
+        track_ids = [int(t) for t in track_ids] if track_ids is not None else None
+    except (ValueError, TypeError):
+        return jsonify({'success': False, 'error': 'Invalid track_ids'}), 400
+    job = start_bulk_download(download_scheduler, track_ids, data.get('playlist') or None, (data.get('q') or '').strip() or None)
+    return jsonify({'success': True, 'job_id': job.id, 'events_url': url_for('bulk_download_events', job_id=job.id)})
+
+@app.route('/api/bulk_download/<int:job_id>/events')
+def bulk_download_events(job_id):
+    """Server-Sent Events stream of a bulk download's progress, closed once it has finished."""
+    job = get_bulk_download(job_id)
+    if job is None:
+        return jsonify({'success': False, 'error': 'Unknown bulk download'}), 404
+
+    def stream():
+        for progress in job.events():
+            yield f"data: {json.dumps(progress)}\n\n" if progress else ": keep-alive\n\n"
+
+    return Response(stream_with_context(stream()), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+def _stream_export(name, row_chunks):
+    """
+    Stream chunks of rows as CSV (default) or NDJSON (?format=ndjson). Each chunk is encoded
+    and sent as soon as it is read, so the first bytes go out before the export is complete.
+    """
+    columns = EXPORT_COLUMNS[name]
+    if request.args.get('format', 'csv') == 'ndjson':
+        def generate():
+            for rows in row_chunks:
+                yield ''.join(json.dumps(dict(zip(columns, row)), ensure_ascii=False, default=str) + '\n' for row in rows)
+        mimetype, extension = 'application/x-ndjson', 'ndjson'
+    else:
+        def generate():
+            buffer = io.StringIO()
+            writer = csv.writer(buffer)
+            writer.writerow(columns)
+            for rows in row_chunks:
+                writer.writerows(rows)
+                yield buffer.getvalue()
+                buffer.seek(0)
+                buffer.truncate()
+            yield buffer.getvalue()
+        mimetype, extension = 'text/csv', 'csv'
+    return Response(stream_with_context(generate()), mimetype=mimetype,
+                    headers={'Content-Disposition': f'attachment; filename={name}.{extension}'})
+
+@app.route('/export/missing_tracks')
+def export_missing_tracks():
+    """Missing tracks as CSV or NDJSON; optional status ('all' for any) and playlist filters."""
+    status = request.args.get('status', 'all')
+    return _stream_export('missing_tracks', iter_missing_tracks_export(
+        status=None if status == 'all' else status, playlist=request.args.get('playlist') or None))
+
+@app.route('/export/library_index')
+def export_library_index():
+    return _stream_export('library_index', iter_library_index_export())
 
 # ... REST OF ROUTES TRANSLATED TO ENGLISH ...
 
 if __name__ == '__main__':
     logger.info("Starting Flask application...")
-    # Start background download worker
-    threading.Thread(target=download_worker, daemon=True).start()
+    # Start background download workers
+    download_scheduler.start()
     # Start scheduled syncs
     def scheduler():
         time.sleep(10)
@@ -0,0 +1,100 @@
+#!/usr/bin/env python3
+"""Benchmark a full sync cycle offline by recording and replaying every outbound HTTP exchange.
+
+Record once against the live services:
+    python benchmark_sync.py record state_data/bench/cycle.jsonl.gz
+
+Replay as often as needed on an isolated box (or in CI):
+    python benchmark_sync.py replay state_data/bench/cycle.jsonl.gz --latency-ms 20 --profile cycle.prof
+
+The database is snapshotted next to the archive when recording and restored into a
+temporary copy before each replay, so both runs start from the same state.
+
+Only traffic through requests sessions can be recorded, so the Gemini AI playlists
+(the google client has its own transport) are always off, and the downloader (streamrip
+subprocess) is off unless --with-downloader is given, in which case the run is not offline.
+"""
+
+import argparse
+import cProfile
+import logging
+import os
+import shutil
+import sqlite3
+import sys
+import tempfile
+import time
+
+from dotenv import load_dotenv
+load_dotenv()
+
+logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(name)s -[%(levelname)s] - %(message)s", stream=sys.stdout)
+logging.getLogger("urllib3").setLevel(logging.WARNING)
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Record/replay benchmark of run_full_sync_cycle")
+    parser.add_argument("mode", choices=["record", "replay"])
+    parser.add_argument("archive", help="Path of the gzip JSON-lines HTTP archive")
+    parser.add_argument("--latency-ms", type=float, default=0.0, help="Fixed latency added to every replayed response")
+    parser.add_argument("--latency-scale", type=float, default=0.0, help="Multiplier of the recorded latency added on replay")
+    parser.add_argument("--profile", help="Write cProfile stats of the cycle to this file")
+    parser.add_argument("--with-downloader", action="store_true", help="Also run the downloader (spawns streamrip; off by default)")
+    args = parser.parse_args()
+
+    if not args.with_downloader:
+        os.environ["RUN_DOWNLOADER"] = "0"
+    # Gemini requests bypass the HTTP adapters, so they could neither be recorded nor replayed
+    os.environ["RUN_GEMINI_PLAYLIST_CREATION"] = "0"
+
+    from plex_playlist_sync.utils import database
+    db_snapshot = args.archive + ".db"
+    if args.mode == "record":
+        os.makedirs(os.path.dirname(os.path.abspath(args.archive)), exist_ok=True)
+        if os.path.exists(args.archive):
+            os.remove(args.archive)
+        if os.path.exists(database.DB_PATH):
+            # Backup API rather than a file copy, so pages still in the WAL are included
+            with sqlite3.connect(database.DB_PATH) as src, sqlite3.connect(db_snapshot) as dst:
+                src.backup(dst)
+    # Both modes run against a throwaway copy of the snapshot, never the live database
+    work_dir = tempfile.mkdtemp(prefix="plex_sync_bench_")
+    if os.path.exists(db_snapshot):
+        shutil.copyfile(db_snapshot, os.path.join(work_dir, "sync_database.db"))
+    database.DB_PATH = os.path.join(work_dir, "sync_database.db")
+    database.initialize_db()
+    # Likewise the saved Tidal session: the run neither reuses nor overwrites the live tokens
+    from plex_playlist_sync.utils import tidal
+    tidal.TIDAL_STATE_DIR = work_dir
+    tidal.TIDAL_SESSION_FILE = os.path.join(work_dir, "tidal_session.json")
+
+    from plex_playlist_sync.sync_logic import run_full_sync_cycle
+    from plex_playlist_sync.utils.http_fixtures import fixture_mode
+
+    profiler = cProfile.Profile() if args.profile else None
+    with fixture_mode(args.mode, args.archive, args.latency_ms, args.latency_scale) as adapter:
+        start = time.perf_counter()
+        if profiler:
+            profiler.enable()
+        try:
+            run_full_sync_cycle()
+        finally:
+            if profiler:
+                profiler.disable()
+        elapsed = time.perf_counter() - start
+
+    print("\n=== SYNC BENCHMARK ===")
+    print(f"Mode: {args.mode}")
+    print(f"Archive: {args.archive}")
+    print(f"Elapsed: {elapsed:.2f}s")
+    if args.mode == "replay":
+        print(f"Replay misses: {adapter.misses}")
+    if profiler:
+        profiler.dump_stats(args.profile)
+        print(f"Profile written to: {args.profile}")
+    shutil.rmtree(work_dir, ignore_errors=True)
+    return 1 if args.mode == "replay" and adapter.misses else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -3,7 +3,7 @@ import time
 import sys
 import logging
 import concurrent.futures
-from typing import List, Dict
+from typing import List, Dict, Tuple
 from datetime import datetime, timedelta
 
 from plexapi.server import PlexServer
@@ -14,19 +14,44 @@ logger = logging.getLogger(__name__)
 from .utils.cleanup import delete_old_playlists, delete_previous_week_playlist
 from .utils.deezer import deezer_playlist_sync
 from .utils.helperClasses import UserInputs, Playlist as PlexPlaylist, Track as PlexTrack
-from .utils.spotify import spotify_playlist_sync
-from .utils.downloader import download_single_track_with_streamrip, DeezerLinkFinder
+from .utils.spotify import spotify_playlist_sync, create_spotify_client
+from .utils.downloader import (
+    download_links_with_streamrip, DeezerLinkFinder, plan_download_jobs, get_changed_download_folders,
+    classify_links_by_streamrip_history
+)
+from .utils.download_scheduler import queue_download, record_job_outcome, refresh_priorities
 from .utils.gemini_ai import configure_gemini, get_plex_favorites_by_id, generate_playlist_prompt, get_gemini_playlist_data
 from .utils.weekly_ai_manager import manage_weekly_ai_playlist
-from .utils.plex import update_or_create_plex_playlist, search_plex_track
+from .utils.plex import update_or_create_plex_playlist, search_plex_track, connect_plex, request_partial_scan, wait_for_new_tracks
 from .utils.state_manager import load_playlist_state, save_playlist_state
 from .utils.database import (
     initialize_db, clear_library_index, add_track_to_index, bulk_add_tracks_to_index, get_missing_tracks,
-    check_track_in_index, check_track_in_index_smart, update_track_status
+    check_track_in_index, check_track_in_index_smart,
+    get_missing_tracks_without_download_job, claim_download_jobs, reconcile_provisional_index_entries,
+    get_download_jobs_with_tracks_downloaded,
+    get_missing_songs, set_missing_songs_status, reconcile_missing_songs_exact, match_missing_songs_fuzzy,
+    match_missing_songs_against_new_index, get_max_index_id, get_max_missing_song_id, get_sync_state, set_sync_state,
+    find_plex_playlist
 )
+from .utils.playlist_mirror import sync_playlist_mirror
 
 load_dotenv()
 
+# Maximum number of download jobs handed to a single streamrip invocation per cycle
+DOWNLOAD_BATCH_SIZE = int(os.getenv("DOWNLOAD_BATCH_SIZE", "200"))
+# Provisional index rows (from downloaded file tags) that Plex has not confirmed by then are dropped,
+# and the missing tracks they marked downloaded go back to missing
+PROVISIONAL_INDEX_TTL_DAYS = float(os.getenv("PROVISIONAL_INDEX_TTL_DAYS", "7"))
+# Upper bound on the wait for Plex to import downloaded files (the wait ends as soon as they appear)
+PLEX_SCAN_MAX_WAIT = int(os.getenv("PLEX_SCAN_MAX_WAIT", "1800"))
+# Songs per candidate query when fuzzy-matching the missing list against the index
+FUZZY_MATCH_BATCH_SIZE = 100
+# sync_state keys of the last verification run's watermarks (highest index row / missing song checked)
+VERIFIED_INDEX_ID_KEY = "verification_index_id"
+VERIFIED_SONG_ID_KEY = "verification_song_id"
+# The playlist scan runs with the main PLEX_TOKEN
+PLAYLIST_SCAN_USER = "main"
+
 def build_library_index(app_state: Dict):
     """
     Performs a complete scan of the Plex library and populates the local index.
@@ -55,7 +80,7 @@ def build_library_index(app_state: Dict):
         
         # Connessione con timeout esteso
         app_state['status'] = "Connecting to Plex Server..."
-        plex = PlexServer(plex_url, plex_token, timeout=120)
+        plex = connect_plex(plex_url, plex_token, timeout=120)
         
         try:
             music_library = plex.library.section(library_name)
@@ -164,8 +189,12 @@ def build_library_index(app_state: Dict):
 def sync_playlists_for_user(plex: PlexServer, user_inputs: UserInputs):
     """Performs Spotify and Deezer synchronization for a single user."""
     if not (os.getenv("SKIP_SPOTIFY_SYNC", "0") == "1"):
-        logger.info(f"--- Starting Spotify sync for user {user_inputs.plex_token[:4]}... ---")
-        spotify_playlist_sync(plex, user_inputs)
+        if user_inputs.spotipy_client_id and user_inputs.spotipy_client_secret:
+            logger.info(f"--- Starting Spotify sync for user {user_inputs.plex_token[:4]}... ---")
+            sp = create_spotify_client(user_inputs.spotipy_client_id, user_inputs.spotipy_client_secret)
+            spotify_playlist_sync(sp, plex, user_inputs)
+        else:
+            logger.warning("Spotify credentials not configured; skipping Spotify sync.")
     
     if not (os.getenv("SKIP_DEEZER_SYNC", "0") == "1"):
         logger.info(f"--- Starting Deezer sync for user {user_inputs.plex_token[:4]}... ---")
@@ -195,18 +224,13 @@ def force_playlist_scan_and_missing_detection():
         return
     
     try:
-        plex = PlexServer(plex_url, plex_token, timeout=60)
-        
-        # Ottieni tutte le playlist dell'utente e filtra quelle musicali
-        all_playlists = plex.playlists()
-        logger.info(f"Found {len(all_playlists)} total playlists")
+        plex = connect_plex(plex_url, plex_token, timeout=60)
         
         # Filter playlists that should not be scanned
         tv_keywords = ['simpsons', 'simpson', 'family guy', 'american dad', 'king of the hill', 
                       'episode', 'tv', 'show', 'serie', 'film', 'movie', 'cinema']
         
-        music_playlists = []
-        for playlist in all_playlists:
+        def is_music_playlist(playlist) -> bool:
             playlist_name_lower = playlist.title.lower()
             
             # Skip TV/Movie playlists
@@ -219,49 +243,48 @@ def force_playlist_scan_and_missing_detection():
                 logger.info(f"🎭 Skipped TV/Movie playlist: '{playlist.title}'")
             elif is_no_delete:
                 logger.info(f"🚫 Skipped NO_DELETE playlist: '{playlist.title}' (created by Plex)")
-            else:
-                music_playlists.append(playlist)
-        
-        logger.info(f"🎵 Scanning {len(music_playlists)} music playlists (skipped {len(all_playlists) - len(music_playlists)} TV/Movie)")
+            return not (is_tv_playlist or is_no_delete)
         
         total_missing_found = 0
-        
-        for playlist in music_playlists:
-            try:
-                logger.info(f"Scanning playlist: {playlist.title}")
-                
-                # Get playlist tracks
-                playlist_tracks = playlist.items()
-                missing_count = 0
-                
-                for track in playlist_tracks:
-                    try:
-                        # Use new smart matching system
-                        if not check_track_in_index_smart(track.title, track.grandparentTitle):
-                            # Potentially missing track, add to DB
-                            track_data = {
-                                'title': track.title,
-                                'artist': track.grandparentTitle,
-                                'album': track.parentTitle if hasattr(track, 'parentTitle') else '',
-                                'source_playlist_title': playlist.title,
-                                'source_playlist_id': playlist.ratingKey
-                            }
-                            
-                            from .utils.database import add_missing_track
-                            add_missing_track(track_data)
-                            missing_count += 1
-                            total_missing_found += 1
-                            
-                    except Exception as track_error:
-                        logger.warning(f"Error processing track {track.title}: {track_error}")
-                        continue
-                
-                if missing_count > 0:
-                    logger.info(f"Playlist '{playlist.title}': {missing_count} missing tracks detected")
-                    
-            except Exception as playlist_error:
-                logger.warning(f"Error processing playlist {playlist.title}: {playlist_error}")
-                continue
+        # The same song often appears in several playlists: check it against the index once
+        in_index: Dict[Tuple[str, str], bool] = {}
+
+        def check_new_items(playlist, items, new_items):
+            # Only items added since the last scan can be new missing tracks
+            nonlocal total_missing_found
+            logger.info(f"Scanning playlist: {playlist.title} ({len(new_items)} new of {len(items)} items)")
+            missing_count = 0
+            
+            for track in new_items:
+                try:
+                    # Use new smart matching system
+                    key = (track.title, track.grandparentTitle)
+                    if key not in in_index:
+                        in_index[key] = check_track_in_index_smart(track.title, track.grandparentTitle)
+                    if not in_index[key]:
+                        # Potentially missing track, add to DB
+                        track_data = {
+                            'title': track.title,
+                            'artist': track.grandparentTitle,
+                            'album': track.parentTitle if hasattr(track, 'parentTitle') else '',
+                            'source_playlist_title': playlist.title,
+                            'source_playlist_id': playlist.ratingKey
+                        }
+                        
+                        from .utils.database import add_missing_track
+                        add_missing_track(track_data)
+                        missing_count += 1
+                        total_missing_found += 1
+                        
+                except Exception as track_error:
+                    logger.warning(f"Error processing track {track.title}: {track_error}")
+                    continue
+            
+            if missing_count > 0:
+                logger.info(f"Playlist '{playlist.title}': {missing_count} missing tracks detected")
+
+        # Music playlists whose updatedAt and leafCount are unchanged since the last scan are skipped
+        sync_playlist_mirror(plex, PLAYLIST_SCAN_USER, on_changed=check_new_items, include=is_music_playlist)
         
         logger.info(f"--- Scan completed: {total_missing_found} total missing tracks detected ---")
         
@@ -270,65 +293,130 @@ def force_playlist_scan_and_missing_detection():
 
 
 def run_downloader_only():
-    """Reads missing tracks from DB, searches for links in parallel and starts download."""
+    """
+    Resolves links for missing tracks not yet in the download queue, enqueues them in the
+    durable download_jobs table, then downloads every due job in one streamrip batch.
+    Returns the number of jobs downloaded successfully.
+    """
     logger.info("--- Starting automatic search and download for missing tracks from DB ---")
-    missing_tracks_from_db = get_missing_tracks()
+    missing_tracks_from_db = get_missing_tracks_without_download_job()
     
-    if not missing_tracks_from_db:
-        logger.info("No missing tracks in database to process.")
-        return False
-
-    logger.info(f"Found {len(missing_tracks_from_db)} missing tracks. Starting parallel link search...")
-    tracks_with_links = []  # Lista di (track_id, link) per mantenere associazione
-    
-    # Use ThreadPoolExecutor to parallelize network requests
-    with concurrent.futures.ThreadPoolExecutor(max_workers=3) as executor:
-        # Create a future for each API call
-        future_to_track = {executor.submit(DeezerLinkFinder.find_track_link, {'title': track[1], 'artist': track[2]}): track for track in missing_tracks_from_db}
-        
-        for future in concurrent.futures.as_completed(future_to_track):
-            track = future_to_track[future]
-            link = future.result()
-            if link:
-                track_id = track[0]  # ID della traccia dal database
-                tracks_with_links.append((track_id, link))
-                logger.info(f"Link found for '{track[1]}' by '{track[2]}': {link}")
-
-    if tracks_with_links:
-        logger.info(f"Found {len(tracks_with_links)} links to download.")
-        
-        # Group by unique links to avoid duplicate downloads
-        unique_links = {}
-        for track_id, link in tracks_with_links:
-            if link not in unique_links:
-                unique_links[link] = []
-            unique_links[link].append(track_id)
-        
-        # Download each unique link and update all associated tracks
+    if missing_tracks_from_db:
+        logger.info(f"Found {len(missing_tracks_from_db)} missing tracks without a download job. Planning downloads...")
+        # Album links for albums with several missing tracks, track links otherwise (cached lookups skip the network)
+        unique_links = plan_download_jobs(missing_tracks_from_db)
         for link, track_ids in unique_links.items():
-            try:
-                logger.info(f"Starting download: {link} (for {len(track_ids)} tracks)")
-                download_single_track_with_streamrip(link)
-                
-                # Update status of all tracks associated with this link
-                for track_id in track_ids:
-                    update_track_status(track_id, 'downloaded')
-                    logger.info(f"Status updated to 'downloaded' for track ID {track_id}")
-                    
-            except Exception as e:
-                logger.error(f"Error during download of {link}: {e}")
-                # Mark tracks as error instead of downloaded
-                for track_id in track_ids:
-                    logger.warning(f"Download failed for track ID {track_id}")
-        
-        return True
+            queue_download(link, track_ids)
+        logger.info(f"Queued {len(unique_links)} download jobs for {sum(len(ids) for ids in unique_links.values())} tracks.")
     else:
-        logger.info("No download links found for missing tracks.")
-        return False
+        logger.info("No new missing tracks to search links for.")
+
+    # Claim due jobs (new ones and retries whose backoff has expired), those completing the most playlists first
+    refresh_priorities()
+    jobs = claim_download_jobs(limit=DOWNLOAD_BATCH_SIZE)
+    if not jobs:
+        logger.info("No download jobs due.")
+        return 0
+
+    # streamrip's own databases: skip what it already downloaded, hold back its known failures
+    # on their first claim so they only get retried once the job's backoff has expired
+    already_downloaded, known_failed, _ = classify_links_by_streamrip_history([job['link'] for job in jobs])
+    already_downloaded, known_failed = set(already_downloaded), set(known_failed)
+    downloaded = 0
+    to_download = []
+    for job in jobs:
+        if job['link'] in already_downloaded:
+            # Nothing new lands on disk, so these do not count towards the Plex import wait
+            record_job_outcome(job, True)
+        elif job['link'] in known_failed and job['attempts'] == 1:
+            record_job_outcome(job, False, "listed in streamrip failed_downloads database")
+        else:
+            to_download.append(job)
+    if len(to_download) < len(jobs):
+        logger.info(f"streamrip history: {len(already_downloaded)} jobs already downloaded, "
+                    f"{len(jobs) - len(to_download) - len(already_downloaded)} known failures held back")
+    jobs = to_download
+    if not jobs:
+        return downloaded
+
+    # Download every claimed link with a single streamrip invocation
+    logger.info(f"Starting batch download of {len(jobs)} jobs")
+    outcomes = download_links_with_streamrip([job['link'] for job in jobs])
+
+    # Success is decided per job: streamrip's per-link outcome, or files of all its tracks found in the
+    # download folder (their tags marked them downloaded); failures are retried with backoff
+    on_disk = set(get_download_jobs_with_tracks_downloaded([job['id'] for job in jobs if not outcomes.get(job['link'])]))
+    for job in jobs:
+        ok = outcomes.get(job['link'], False) or job['id'] in on_disk
+        record_job_outcome(job, ok, "" if ok else "streamrip batch reported failure")
+        downloaded += ok
+    
+    return downloaded
+
+
+def wait_for_plex_import(since: datetime, expected_tracks: int):
+    """
+    Asks Plex to scan only the folders streamrip wrote to since `since`, then polls the
+    recently added tracks with backoff until they show up (at most PLEX_SCAN_MAX_WAIT seconds).
+    """
+    plex_url, plex_token = os.getenv("PLEX_URL"), os.getenv("PLEX_TOKEN")
+    if not (plex_url and plex_token):
+        logger.error("Main Plex URL or Token not configured.")
+        return
+    try:
+        plex = connect_plex(plex_url, plex_token)
+        music_library = plex.library.section(os.getenv("LIBRARY_NAME", "Musica"))
+        request_partial_scan(plex, music_library, get_changed_download_folders(since.timestamp()))
+        found = wait_for_new_tracks(plex, music_library, since, expected_tracks, PLEX_SCAN_MAX_WAIT)
+        logger.info(f"Plex imported {found} new tracks after the download batch")
+    except Exception as e:
+        logger.error(f"Error while waiting for Plex to import downloads: {e}", exc_info=True)
+
 
+def verify_missing_songs() -> List[tuple]:
+    """
+    Mark the missing songs now present in the library index as downloaded. Returns the missing_tracks rows updated.
 
-def rescan_and_update_missing():
-    """Scans recently added tracks to Plex and updates the missing list."""
+    Exact matches are resolved in one join on the normalised keys and the leftovers are fuzzy-matched.
+    After the first run only what changed since the previous run is tested: index rows above the stored
+    index watermark against the whole missing list (with the same fuzzy candidate rule as the full match),
+    and songs above the stored song watermark against the whole index; nothing at all when neither
+    changed. Each song is verified once, however many playlists are missing it.
+    """
+    index_watermark, song_watermark = get_sync_state(VERIFIED_INDEX_ID_KEY), get_sync_state(VERIFIED_SONG_ID_KEY)
+    # Captured before matching: rows added meanwhile are picked up by the next run
+    max_index_id, max_song_id = get_max_index_id(), get_max_missing_song_id()
+
+    if index_watermark is None or song_watermark is None:
+        updated_tracks = reconcile_missing_songs_exact()
+        songs_to_verify = get_missing_songs()
+        logger.info(f"{len(updated_tracks)} missing tracks matched exactly; fuzzy-matching {len(songs_to_verify)} remaining songs...")
+        found_song_ids = match_missing_songs_fuzzy(songs_to_verify, FUZZY_MATCH_BATCH_SIZE)
+    else:
+        index_watermark, song_watermark = int(index_watermark), int(song_watermark)
+        if max_index_id <= index_watermark and max_song_id <= song_watermark:
+            logger.info("Library index and missing songs unchanged since the last verification.")
+            return []
+        updated_tracks = reconcile_missing_songs_exact(index_watermark, song_watermark)
+        songs = get_missing_songs()
+        new_songs = [song for song in songs if song[0] > song_watermark]
+        # Known songs only need a fuzzy pass when the index has new rows
+        old_songs = [song for song in songs if song[0] <= song_watermark] if max_index_id > index_watermark else []
+        logger.info(f"{len(updated_tracks)} missing tracks matched exactly; fuzzy-matching {max_index_id - index_watermark} "
+                    f"new index rows against {len(old_songs)} songs and {len(new_songs)} new songs against the index...")
+        found_song_ids = match_missing_songs_against_new_index(old_songs, index_watermark, FUZZY_MATCH_BATCH_SIZE)
+        found_song_ids += match_missing_songs_fuzzy(new_songs, FUZZY_MATCH_BATCH_SIZE)
+
+    fuzzy_updated = set_missing_songs_status(found_song_ids, 'downloaded')
+    if fuzzy_updated:
+        logger.info(f"SUCCESS: {len(found_song_ids)} more songs are now present ({len(fuzzy_updated)} missing tracks updated).")
+    set_sync_state(VERIFIED_INDEX_ID_KEY, str(max_index_id))
+    set_sync_state(VERIFIED_SONG_ID_KEY, str(max_song_id))
+    return updated_tracks + fuzzy_updated
+
+
+def rescan_and_update_missing(since: datetime = None):
+    """Scans tracks recently added to Plex (since `since`, default the last 30 minutes) and updates the missing list."""
     logger.info("--- Starting post-download scan to clean missing tracks list ---")
     plex_url, plex_token = os.getenv("PLEX_URL"), os.getenv("PLEX_TOKEN")
     if not (plex_url and plex_token):
@@ -336,17 +424,17 @@ def rescan_and_update_missing():
         return
 
     try:
-        plex = PlexServer(plex_url, plex_token)
+        plex = connect_plex(plex_url, plex_token)
         music_library = plex.library.section(os.getenv("LIBRARY_NAME", "Musica"))
         
         logger.info("Searching for recently added tracks to Plex to update index...")
         recently_added = music_library.search(sort="addedAt:desc", limit=500)
         
         newly_indexed_count = 0
-        thirty_minutes_ago = datetime.now() - timedelta(minutes=30)
+        added_since = since or datetime.now() - timedelta(minutes=30)
 
         for track in recently_added:
-            if track.addedAt >= thirty_minutes_ago:
+            if track.addedAt and track.addedAt >= added_since:
                 add_track_to_index(track)
                 newly_indexed_count += 1
         
@@ -355,16 +443,13 @@ def rescan_and_update_missing():
         else:
             logger.info("No new tracks found to add to index.")
 
-        tracks_to_verify = get_missing_tracks()
-        logger.info(f"Verifying {len(tracks_to_verify)} tracks from missing list...")
+        confirmed, expired, reverted = reconcile_provisional_index_entries(PROVISIONAL_INDEX_TTL_DAYS)
+        if confirmed or expired:
+            logger.info(f"Provisional index entries: {confirmed} confirmed by Plex, {expired} expired "
+                        f"({reverted} missing tracks back to missing).")
+
+        updated_tracks = verify_missing_songs()
 
-        updated_tracks = []
-        for track_info in tracks_to_verify:
-            if check_track_in_index_smart(track_info[1], track_info[2]):
-                logger.info(f"SUCCESS: Track '{track_info[1]}' is now present. Updating status.")
-                update_track_status(track_info[0], 'downloaded')
-                updated_tracks.append(track_info)
-        
         # Auto-update AI playlists if there are new tracks available
         if updated_tracks:
             auto_update_ai_playlists(plex, updated_tracks)
@@ -378,12 +463,14 @@ def rescan_and_update_missing():
 def run_cleanup_only():
     """Performs only cleanup of old playlists for all users."""
     if not (os.getenv("SKIP_CLEANUP", "0") == "1"):
-        user_tokens = [os.getenv("PLEX_TOKEN"), os.getenv("PLEX_TOKEN_USERS")]
-        for token in filter(None, user_tokens):
+        user_tokens = {'main': os.getenv("PLEX_TOKEN"), 'secondary': os.getenv("PLEX_TOKEN_USERS")}
+        for user, token in user_tokens.items():
+            if not token:
+                continue
             try:
-                plex = PlexServer(os.getenv("PLEX_URL"), token)
+                plex = connect_plex(os.getenv("PLEX_URL"), token)
                 logger.info(f"--- Starting cleanup of old playlists for user {token[:4]}... ---")
-                delete_old_playlists(plex, os.getenv("LIBRARY_NAME"), int(os.getenv("WEEKS_LIMIT")), os.getenv("PRESERVE_TAG"))
+                delete_old_playlists(plex, os.getenv("LIBRARY_NAME"), int(os.getenv("WEEKS_LIMIT")), os.getenv("PRESERVE_TAG"), user=user)
             except Exception as e:
                 logger.error(f"Error during Plex connection for cleanup (user {token[:4]}...): {e}")
 
@@ -431,7 +518,7 @@ def run_full_sync_cycle():
         )
         
         try:
-            plex = PlexServer(user_inputs.plex_url, user_inputs.plex_token)
+            plex = connect_plex(user_inputs.plex_url, user_inputs.plex_token)
             sync_playlists_for_user(plex, user_inputs)
             
             if gemini_model and favorites_playlist_id:
@@ -476,12 +563,11 @@ def run_full_sync_cycle():
         logger.info(f"Found {current_missing_count} missing tracks in existing DB.")
     
     if RUN_DOWNLOADER:
-        download_attempted = run_downloader_only()
-        if download_attempted:
-            wait_time = int(os.getenv("PLEX_SCAN_WAIT_TIME", "300"))
-            logger.info(f"Waiting {wait_time} seconds to give Plex time to index...")
-            time.sleep(wait_time)
-            rescan_and_update_missing()
+        download_started = datetime.now().replace(microsecond=0)
+        downloaded_jobs = run_downloader_only()
+        if downloaded_jobs:
+            wait_for_plex_import(download_started, downloaded_jobs)
+            rescan_and_update_missing(since=download_started)
     else:
         logger.warning("Automatic download skipped as per configuration.")
     
@@ -510,9 +596,9 @@ def auto_update_ai_playlists(plex, updated_tracks):
         # Create separate connections for each user
         plex_connections = {}
         if main_token:
-            plex_connections['main'] = PlexServer(plex_url, main_token)
+            plex_connections['main'] = connect_plex(plex_url, main_token)
         if secondary_token:
-            plex_connections['secondary'] = PlexServer(plex_url, secondary_token)
+            plex_connections['secondary'] = connect_plex(plex_url, secondary_token)
         
         # Get playlists for each user
         updated_count = 0
@@ -528,6 +614,8 @@ def auto_update_ai_playlists(plex, updated_tracks):
                 continue
                 
             logger.info(f"Found {len(user_playlists)} AI playlists for user {user_type}")
+            # One refresh of the local playlist mirror per user; lookups below are local
+            sync_playlist_mirror(user_plex, user_type)
             
             for playlist_data in user_playlists:
                 playlist_title = playlist_data['title']  # title from managed_ai_playlists table
@@ -538,12 +626,8 @@ def auto_update_ai_playlists(plex, updated_tracks):
                     logger.info(f"🎵 Updating AI playlist '{playlist_title}' for user {user_type}")
                     
                     try:
-                        # Find the playlist on Plex for the correct user
-                        existing_playlist = None
-                        for playlist in user_plex.playlists():
-                            if playlist.title == playlist_title:
-                                existing_playlist = playlist
-                                break
+                        # Find the playlist in the mirror of the correct user
+                        existing_playlist = find_plex_playlist(user_type, playlist_title)
                         
                         if existing_playlist:
                             # Get tracks that are now available for this playlist
@@ -559,18 +643,15 @@ def auto_update_ai_playlists(plex, updated_tracks):
                                 
                                 # Search track on Plex using correct user connection
                                 plex_track = search_plex_track(user_plex, track_title, track_artist)
-                                if plex_track:
+                                if plex_track and plex_track.ratingKey in existing_playlist['item_keys']:
+                                    logger.info(f"Track '{track_title}' by '{track_artist}' is already in the playlist")
+                                elif plex_track:
                                     tracks_to_add.append(plex_track)
                                     logger.info(f"✅ Found track for addition: '{track_title}' by '{track_artist}'")
                             
-                            # Add new tracks to playlist
+                            # Add new tracks to playlist (appended after the current ones)
                             if tracks_to_add:
-                                current_tracks = existing_playlist.items()
-                                all_tracks = list(current_tracks) + tracks_to_add
-                                
-                                # Update playlist with all tracks (old + new)
-                                existing_playlist.clear()
-                                existing_playlist.addItems(all_tracks)
+                                user_plex.fetchItem(existing_playlist['rating_key']).addItems(tracks_to_add)
                                 
                                 logger.info(f"🎉 Playlist '{playlist_title}' updated with {len(tracks_to_add)} new tracks")
                                 updated_count += 1
@@ -0,0 +1,122 @@
+"""
+Server-side "find and download" over many missing tracks: links are resolved in
+parallel (cached lookups skip the network), found links are handed to the download
+scheduler in batches while the lookups are still running, and the progress is kept
+in memory so the page can follow it through Server-Sent Events.
+"""
+
+import os
+import logging
+import threading
+import time
+from typing import Dict, Iterator, List, Optional
+
+from .database import get_missing_tracks_matching
+from .downloader import plan_download_jobs
+
+logger = logging.getLogger(__name__)
+
+BULK_LOOKUP_WORKERS = int(os.getenv("BULK_DOWNLOAD_LOOKUP_WORKERS", "6"))
+# Found links are queued in batches of this size
+BULK_ENQUEUE_BATCH_SIZE = 25
+# Finished bulk jobs are forgotten after this long
+BULK_JOB_RETENTION_SECONDS = 3600
+
+_jobs: Dict[int, "BulkDownloadJob"] = {}
+_jobs_lock = threading.Lock()
+_next_id = 1
+
+
+class BulkDownloadJob:
+    """One bulk find-and-download run. `progress` changes are announced through `condition`."""
+
+    def __init__(self, job_id: int, scheduler, track_ids: Optional[List[int]], playlist: Optional[str], text: Optional[str]):
+        self.id = job_id
+        self.scheduler = scheduler
+        self.track_ids = track_ids
+        self.playlist = playlist
+        self.text = text
+        self.condition = threading.Condition()
+        self.version = 0
+        self.finished_at: Optional[float] = None
+        self.progress = {
+            "job_id": job_id, "state": "starting", "total": 0, "resolved": 0,
+            "found": 0, "not_found": 0, "queued_links": 0, "queued_tracks": 0, "error": None,
+        }
+        self._pending: Dict[str, List[int]] = {}
+        self._queued_links = set()
+
+    def _update(self, **changes):
+        with self.condition:
+            self.progress.update(changes)
+            self.version += 1
+            self.condition.notify_all()
+
+    def _flush(self):
+        if not self._pending:
+            return
+        batch, self._pending = self._pending, {}
+        self.scheduler.submit_many(batch)
+        self._queued_links.update(batch)
+        self._update(queued_links=len(self._queued_links),
+                     queued_tracks=self.progress["queued_tracks"] + sum(len(ids) for ids in batch.values()))
+
+    def _on_planned(self, link: Optional[str], rows: List[tuple]):
+        # Called from the planning thread only, so the pending batch needs no lock
+        if link:
+            self._pending.setdefault(link, []).extend(r[0] for r in rows)
+        self._update(resolved=self.progress["resolved"] + len(rows),
+                     found=self.progress["found"] + (len(rows) if link else 0),
+                     not_found=self.progress["not_found"] + (0 if link else len(rows)))
+        if len(self._pending) >= BULK_ENQUEUE_BATCH_SIZE:
+            self._flush()
+
+    def run(self):
+        try:
+            rows = get_missing_tracks_matching(self.track_ids, self.playlist, self.text)
+            self._update(state="resolving", total=len(rows))
+            logger.info(f"Bulk download {self.id}: resolving links for {len(rows)} missing tracks")
+            plan_download_jobs(rows, workers=BULK_LOOKUP_WORKERS, on_planned=self._on_planned)
+            self._flush()
+            self._update(state="done")
+            logger.info(f"Bulk download {self.id} finished: {self.progress}")
+        except Exception as e:
+            logger.error(f"Bulk download {self.id} failed: {e}", exc_info=True)
+            self._update(state="error", error=str(e))
+        finally:
+            self.finished_at = time.time()
+
+    def events(self, heartbeat_seconds: float = 15) -> Iterator[Dict]:
+        """Yield the progress each time it changes, until the job has finished; None as a keep-alive."""
+        seen = -1
+        while True:
+            with self.condition:
+                if self.version == seen:
+                    self.condition.wait(heartbeat_seconds)
+                if self.version == seen:
+                    progress = None
+                else:
+                    seen, progress = self.version, dict(self.progress)
+            yield progress
+            if progress and progress["state"] in ("done", "error"):
+                return
+
+
+def start_bulk_download(scheduler, track_ids: Optional[List[int]] = None, playlist: Optional[str] = None,
+                        text: Optional[str] = None) -> BulkDownloadJob:
+    """Start a bulk find-and-download for the given missing track IDs, or for every missing track matching the filters."""
+    global _next_id
+    with _jobs_lock:
+        now = time.time()
+        for job_id in [j for j, job in _jobs.items() if job.finished_at and now - job.finished_at > BULK_JOB_RETENTION_SECONDS]:
+            del _jobs[job_id]
+        job = BulkDownloadJob(_next_id, scheduler, track_ids, playlist, text)
+        _jobs[job.id] = job
+        _next_id += 1
+    threading.Thread(target=job.run, name=f"bulk-download-{job.id}", daemon=True).start()
+    return job
+
+
+def get_bulk_download(job_id: int) -> Optional[BulkDownloadJob]:
+    with _jobs_lock:
+        return _jobs.get(job_id)
@@ -3,12 +3,19 @@ from datetime import datetime, timedelta
 from plexapi.server import PlexServer
 import os
 from plexapi.exceptions import NotFound
+from .playlist_mirror import sync_playlist_mirror
+from .database import get_plex_playlists_added_before, delete_plex_playlists
 
-def delete_old_playlists(plex: PlexServer, library_name: str, weeks_limit: int, preserve_tag: str = "NO_DELETE") -> None:
+# Playlist type holding the items of each library section type
+SECTION_PLAYLIST_TYPES = {'artist': 'audio', 'movie': 'video', 'show': 'video', 'photo': 'photo'}
+
+def delete_old_playlists(plex: PlexServer, library_name: str, weeks_limit: int, preserve_tag: str = "NO_DELETE",
+                         user: str = "main") -> None:
     """
     Deletes playlists from the specified library that are older than the indicated limit (in weeks),
     unless the playlist title contains the exclusion tag.
     Deletion only occurs if the FORCE_DELETE_OLD_PLAYLISTS environment variable is set to "1".
+    Candidates are planned from the local playlist mirror of `user`, refreshed first.
     """
     # --- MODIFICATION: Reads environment variable to force deletion ---
     force_delete = os.getenv("FORCE_DELETE_OLD_PLAYLISTS", "0") == "1"
@@ -24,19 +31,17 @@ def delete_old_playlists(plex: PlexServer, library_name: str, weeks_limit: int,
     today = datetime.now()
     cutoff_date = today - timedelta(weeks=weeks_limit)
 
-    for playlist in library.playlists():
+    sync_playlist_mirror(plex, user, include=lambda playlist: False)
+    candidates = get_plex_playlists_added_before(user, int(cutoff_date.timestamp()), SECTION_PLAYLIST_TYPES.get(library.type))
+    for playlist in candidates:
         # Skip playlist if title contains the preserve tag (case-insensitive)
-        if preserve_tag.lower() in playlist.title.lower():
-            logging.info(f"Playlist '{playlist.title}' marked NOT to delete.")
+        if preserve_tag.lower() in playlist['title'].lower():
+            logging.info(f"Playlist '{playlist['title']}' marked NOT to delete.")
             continue
 
-        if hasattr(playlist, 'addedAt'):
-            creation_date = playlist.addedAt
-            if creation_date < cutoff_date:
-                playlists_to_delete.append(playlist)
-                logging.info(f"Playlist to delete: '{playlist.title}' (Created on {creation_date.strftime('%Y-%m-%d')})")
-        else:
-            logging.warning(f"Playlist '{playlist.title}' missing 'addedAt' attribute, ignored during cleanup.")
+        playlists_to_delete.append(playlist)
+        creation_date = datetime.fromtimestamp(playlist['added_at'])
+        logging.info(f"Playlist to delete: '{playlist['title']}' (Created on {creation_date.strftime('%Y-%m-%d')})")
 
     if playlists_to_delete:
         # --- MODIFICATION: Removed input(), confirmation is automatic if flag is active ---
@@ -44,10 +49,11 @@ def delete_old_playlists(plex: PlexServer, library_name: str, weeks_limit: int,
             logging.warning(f"FORCE_DELETE_OLD_PLAYLISTS is active. Deleting {len(playlists_to_delete)} playlists in progress...")
             for pl in playlists_to_delete:
                 try:
-                    pl.delete()
-                    logging.info(f"Playlist '{pl.title}' deleted.")
+                    plex.fetchItem(pl['rating_key']).delete()
+                    delete_plex_playlists(user, [pl['rating_key']])
+                    logging.info(f"Playlist '{pl['title']}' deleted.")
                 except Exception as e:
-                    logging.error(f"Unable to delete playlist '{pl.title}': {e}")
+                    logging.error(f"Unable to delete playlist '{pl['title']}': {e}")
         else:
             logging.info(f"Found {len(playlists_to_delete)} playlists to delete, but automatic deletion is not active. Set FORCE_DELETE_OLD_PLAYLISTS=1 in .env file to proceed.")
     else:
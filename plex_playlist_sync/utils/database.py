@@ -7,7 +7,7 @@ import queue
 import threading
 import time
 from contextlib import contextmanager
-from typing import List, Dict, Any, Optional
+from typing import List, Dict, Any, Iterator, Optional, Tuple
 from plexapi.server import PlexServer
 from plexapi.exceptions import NotFound
 from plexapi.audio import Track
@@ -102,19 +102,162 @@ def initialize_db():
             id INTEGER PRIMARY KEY AUTOINCREMENT, title TEXT NOT NULL, artist TEXT NOT NULL,\
             album TEXT, source_playlist_title TEXT NOT NULL, source_playlist_id INTEGER,\
             status TEXT NOT NULL DEFAULT 'missing', added_date TIMESTAMP DEFAULT CURRENT_TIMESTAMP,\
-            UNIQUE(title, artist, source_playlist_title))")
+            song_id INTEGER, UNIQUE(title, artist, source_playlist_title))")
+        # One row per song (normalised artist/title); missing_tracks rows are its playlist references
+        cur.execute("CREATE TABLE IF NOT EXISTS missing_songs (\
+            id INTEGER PRIMARY KEY AUTOINCREMENT, artist_key TEXT NOT NULL, title_key TEXT NOT NULL,\
+            title TEXT NOT NULL, artist TEXT NOT NULL, album TEXT, added_date TIMESTAMP DEFAULT CURRENT_TIMESTAMP,\
+            UNIQUE(artist_key, title_key))")
+        if 'song_id' not in {r[1] for r in cur.execute("PRAGMA table_info(missing_tracks)")}:
+            cur.execute("ALTER TABLE missing_tracks ADD COLUMN song_id INTEGER")
+        _link_missing_tracks_to_songs(cur)
         cur.execute("CREATE TABLE IF NOT EXISTS plex_library_index (\
             id INTEGER PRIMARY KEY AUTOINCREMENT, title_clean TEXT NOT NULL, artist_clean TEXT NOT NULL,\
-            album_clean TEXT, year INTEGER, added_at TIMESTAMP,\
+            album_clean TEXT, year INTEGER, added_at TIMESTAMP, provisional INTEGER NOT NULL DEFAULT 0,\
             UNIQUE(artist_clean, album_clean, title_clean))")
+        # Provisional rows come from the tags of freshly downloaded files, before Plex has indexed them
+        if 'provisional' not in {r[1] for r in cur.execute("PRAGMA table_info(plex_library_index)")}:
+            cur.execute("ALTER TABLE plex_library_index ADD COLUMN provisional INTEGER NOT NULL DEFAULT 0")
         cur.execute("CREATE TABLE IF NOT EXISTS managed_ai_playlists (\
             id INTEGER PRIMARY KEY AUTOINCREMENT, plex_rating_key INTEGER, title TEXT NOT NULL UNIQUE,\
             description TEXT, user TEXT NOT NULL, tracklist_json TEXT NOT NULL,\
             created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP)")
+        cur.execute("CREATE TABLE IF NOT EXISTS source_playlist_cache (\
+            service TEXT NOT NULL, playlist_id TEXT NOT NULL, snapshot TEXT NOT NULL,\
+            tracklist_json TEXT NOT NULL, updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,\
+            PRIMARY KEY(service, playlist_id))")
+        cur.execute("CREATE TABLE IF NOT EXISTS download_jobs (\
+            id INTEGER PRIMARY KEY AUTOINCREMENT, link TEXT NOT NULL UNIQUE, service TEXT NOT NULL,\
+            state TEXT NOT NULL DEFAULT 'pending', attempts INTEGER NOT NULL DEFAULT 0,\
+            next_attempt_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP, last_error TEXT,\
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP, updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,\
+            priority REAL NOT NULL DEFAULT 0)")
+        if 'priority' not in {r[1] for r in cur.execute("PRAGMA table_info(download_jobs)")}:
+            cur.execute("ALTER TABLE download_jobs ADD COLUMN priority REAL NOT NULL DEFAULT 0")
+        cur.execute("CREATE TABLE IF NOT EXISTS download_job_tracks (\
+            job_id INTEGER NOT NULL, missing_track_id INTEGER NOT NULL,\
+            PRIMARY KEY(job_id, missing_track_id))")
+        cur.execute("CREATE TABLE IF NOT EXISTS link_cache (\
+            artist_key TEXT NOT NULL, title_key TEXT NOT NULL, link TEXT, service TEXT,\
+            found_at TIMESTAMP, checked_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,\
+            PRIMARY KEY(artist_key, title_key))")
+        cur.execute("CREATE TABLE IF NOT EXISTS plex_playlists (\
+            user TEXT NOT NULL, rating_key INTEGER NOT NULL, title TEXT NOT NULL, updated_at INTEGER,\
+            leaf_count INTEGER, items_hash TEXT, item_keys_json TEXT, synced_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,\
+            playlist_type TEXT, added_at INTEGER, checked_items_hash TEXT, checked_item_keys_json TEXT,\
+            PRIMARY KEY(user, rating_key))")
+        playlist_columns = {r[1] for r in cur.execute("PRAGMA table_info(plex_playlists)")}
+        for column in ('playlist_type TEXT', 'added_at INTEGER', 'checked_items_hash TEXT', 'checked_item_keys_json TEXT'):
+            if column.split()[0] not in playlist_columns:
+                cur.execute(f"ALTER TABLE plex_playlists ADD COLUMN {column}")
+        cur.execute("CREATE TABLE IF NOT EXISTS sync_state (\
+            key TEXT PRIMARY KEY, value TEXT, updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP)")
+        cur.execute("CREATE TABLE IF NOT EXISTS fs_manifest_dirs (\
+            path TEXT PRIMARY KEY, parent TEXT NOT NULL, mtime REAL NOT NULL)")
+        cur.execute("CREATE TABLE IF NOT EXISTS fs_manifest_files (\
+            path TEXT PRIMARY KEY, dir TEXT NOT NULL, title_key TEXT, artist_key TEXT,\
+            name_key TEXT, dir_key TEXT, mtime REAL NOT NULL)")
+        # Track lookups used to cache album links; drop those so tracks get re-resolved to track URLs
+        cur.execute("DELETE FROM link_cache WHERE title_key NOT LIKE 'album:%' AND link LIKE '%/album/%'")
         # indices
         cur.execute("CREATE INDEX IF NOT EXISTS idx_index_artist_title ON plex_library_index(artist_clean, title_clean)")
         cur.execute("CREATE INDEX IF NOT EXISTS idx_missing_status ON missing_tracks(status)")
         cur.execute("CREATE INDEX IF NOT EXISTS idx_ai_user ON managed_ai_playlists(user)")
+        cur.execute("CREATE INDEX IF NOT EXISTS idx_jobs_state_next ON download_jobs(state, next_attempt_at)")
+        cur.execute("CREATE INDEX IF NOT EXISTS idx_jobs_state_priority ON download_jobs(state, priority DESC)")
+        cur.execute("DROP INDEX IF EXISTS idx_missing_title_artist")
+        cur.execute("CREATE INDEX IF NOT EXISTS idx_missing_song ON missing_tracks(song_id, status)")
+        # keyset pagination of the missing tracks view, one index per sort order
+        cur.execute("CREATE INDEX IF NOT EXISTS idx_missing_status_added ON missing_tracks(status, added_date, id)")
+        cur.execute("CREATE INDEX IF NOT EXISTS idx_missing_status_title ON missing_tracks(status, title COLLATE NOCASE, id)")
+        cur.execute("CREATE INDEX IF NOT EXISTS idx_missing_status_artist ON missing_tracks(status, artist COLLATE NOCASE, id)")
+        cur.execute("CREATE INDEX IF NOT EXISTS idx_missing_playlist ON missing_tracks(source_playlist_title, status)")
+        cur.execute("CREATE INDEX IF NOT EXISTS idx_job_tracks_missing ON download_job_tracks(missing_track_id)")
+        cur.execute("CREATE INDEX IF NOT EXISTS idx_plex_playlists_title ON plex_playlists(user, title)")
+        cur.execute("CREATE INDEX IF NOT EXISTS idx_manifest_dirs_parent ON fs_manifest_dirs(parent)")
+        cur.execute("CREATE INDEX IF NOT EXISTS idx_manifest_files_dir ON fs_manifest_files(dir)")
+        cur.execute("CREATE INDEX IF NOT EXISTS idx_manifest_files_tags ON fs_manifest_files(title_key, artist_key)")
+        cur.execute("CREATE INDEX IF NOT EXISTS idx_manifest_files_name ON fs_manifest_files(name_key)")
+
+
+def get_sync_state(key: str) -> Optional[str]:
+    with get_db() as con:
+        r = con.cursor().execute("SELECT value FROM sync_state WHERE key=?", (key,)).fetchone()
+        return r[0] if r else None
+
+
+def set_sync_state(key: str, value: Optional[str]):
+    with get_db() as con:
+        con.cursor().execute("INSERT OR REPLACE INTO sync_state (key, value, updated_at) VALUES (?,?,CURRENT_TIMESTAMP)",
+                             (key, value))
+
+
+# Mirror of the users' Plex playlists (see playlist_mirror): dates are epoch seconds,
+# item_keys_json/items_hash are NULL for playlists mirrored without their items. The
+# checked_* columns hold the items as of the last refresh that ran the new-item check, so
+# refreshes that only update the mirror never hide new items from that check.
+
+def _plex_playlist_row(r) -> Dict:
+    d = dict(r)
+    d['item_keys'] = json.loads(d.pop('item_keys_json') or '[]')
+    d['checked_item_keys'] = json.loads(d.pop('checked_item_keys_json') or '[]')
+    return d
+
+
+def get_plex_playlists(user: str) -> Dict[int, Dict]:
+    """Mirrored playlists of a user by ratingKey, with 'item_keys' decoded."""
+    with get_db() as con:
+        rows = con.cursor().execute("SELECT * FROM plex_playlists WHERE user=?", (user,)).fetchall()
+        return {r['rating_key']: _plex_playlist_row(r) for r in rows}
+
+
+def find_plex_playlist(user: str, title: str) -> Optional[Dict]:
+    with get_db() as con:
+        r = con.cursor().execute("SELECT * FROM plex_playlists WHERE user=? AND title=? LIMIT 1", (user, title)).fetchone()
+        return _plex_playlist_row(r) if r else None
+
+
+def get_plex_playlists_added_before(user: str, cutoff: int, playlist_type: Optional[str] = None) -> List[Dict]:
+    with get_db() as con:
+        rows = con.cursor().execute("SELECT rating_key, title, playlist_type, added_at FROM plex_playlists\
+            WHERE user=? AND added_at < ? AND (? IS NULL OR playlist_type=?) ORDER BY added_at",
+            (user, cutoff, playlist_type, playlist_type)).fetchall()
+        return [dict(r) for r in rows]
+
+
+def save_plex_playlist(user: str, rating_key: int, title: str, playlist_type: Optional[str], added_at: Optional[int],
+                       updated_at: Optional[int], leaf_count: Optional[int], item_keys: List[int], items_hash: str,
+                       checked: bool = False):
+    """Store a playlist with its items; `checked` also records them as seen by the new-item check."""
+    item_keys_json = json.dumps(item_keys)
+    with get_db() as con:
+        con.cursor().execute("INSERT INTO plex_playlists (user, rating_key, title, playlist_type, added_at, updated_at,\
+            leaf_count, items_hash, item_keys_json, checked_items_hash, checked_item_keys_json, synced_at)\
+            VALUES (?,?,?,?,?,?,?,?,?,?,?,CURRENT_TIMESTAMP)\
+            ON CONFLICT(user, rating_key) DO UPDATE SET title=excluded.title, playlist_type=excluded.playlist_type,\
+            added_at=excluded.added_at, updated_at=excluded.updated_at, leaf_count=excluded.leaf_count,\
+            items_hash=excluded.items_hash, item_keys_json=excluded.item_keys_json,\
+            checked_items_hash=COALESCE(excluded.checked_items_hash, checked_items_hash),\
+            checked_item_keys_json=COALESCE(excluded.checked_item_keys_json, checked_item_keys_json),\
+            synced_at=CURRENT_TIMESTAMP",
+            (user, rating_key, title, playlist_type, added_at, updated_at, leaf_count, items_hash, item_keys_json,
+             items_hash if checked else None, item_keys_json if checked else None))
+
+
+def save_plex_playlist_metadata(user: str, rating_key: int, title: str, playlist_type: Optional[str],
+                                added_at: Optional[int]):
+    """Store a playlist's title, type and addedAt, leaving its items and their updatedAt/leafCount untouched."""
+    with get_db() as con:
+        con.cursor().execute("INSERT INTO plex_playlists (user, rating_key, title, playlist_type, added_at, synced_at)\
+            VALUES (?,?,?,?,?,CURRENT_TIMESTAMP)\
+            ON CONFLICT(user, rating_key) DO UPDATE SET title=excluded.title, playlist_type=excluded.playlist_type,\
+            added_at=excluded.added_at, synced_at=CURRENT_TIMESTAMP",
+            (user, rating_key, title, playlist_type, added_at))
+
+
+def delete_plex_playlists(user: str, rating_keys: List[int]):
+    with get_db() as con:
+        con.cursor().executemany("DELETE FROM plex_playlists WHERE user=? AND rating_key=?", [(user, k) for k in rating_keys])
 
 
 def add_managed_ai_playlist(info: Dict[str, Any]):
@@ -148,15 +291,60 @@ def get_managed_playlist_details(pid: int) -> Optional[Dict]:
         return dict(r) if r else None
 
 
+def get_cached_source_playlist(service: str, playlist_id: str) -> Optional[Dict]:
+    """Return the cached tracklist of a streaming playlist with the snapshot it was fetched at."""
+    with get_db() as con:
+        r = con.cursor().execute("SELECT snapshot, tracklist_json FROM source_playlist_cache WHERE service=? AND playlist_id=?",
+                                 (service, str(playlist_id))).fetchone()
+        if not r:
+            return None
+        return {'snapshot': r['snapshot'], 'tracks': json.loads(r['tracklist_json'])}
+
+
+def save_source_playlist_cache(service: str, playlist_id: str, snapshot: str, tracks: List[Dict]):
+    with get_db() as con:
+        con.cursor().execute("INSERT OR REPLACE INTO source_playlist_cache (service, playlist_id, snapshot, tracklist_json, updated_at) VALUES (?,?,?,?,CURRENT_TIMESTAMP)",
+                             (service, str(playlist_id), str(snapshot), json.dumps(tracks, ensure_ascii=False)))
+
+
+# Missing songs: verification, link lookup and download work on missing_songs (one row per
+# normalised artist/title); their outcome fans out to every missing_tracks row (playlist reference).
+
+def _song_id(cur, title: str, artist: str, album: Optional[str] = None) -> int:
+    artist_key, title_key = _clean_string(artist or ''), _clean_string(title or '')
+    cur.execute("INSERT OR IGNORE INTO missing_songs (artist_key, title_key, title, artist, album) VALUES (?,?,?,?,?)",
+                (artist_key, title_key, title, artist, album))
+    return cur.execute("SELECT id FROM missing_songs WHERE artist_key=? AND title_key=?", (artist_key, title_key)).fetchone()[0]
+
+
+def _link_missing_tracks_to_songs(cur):
+    """Attach missing_tracks rows created before missing_songs existed to their song."""
+    rows = cur.execute("SELECT id, title, artist, album FROM missing_tracks WHERE song_id IS NULL").fetchall()
+    if rows:
+        cur.executemany("UPDATE missing_tracks SET song_id=? WHERE id=?",
+                        [(_song_id(cur, r[1], r[2], r[3]), r[0]) for r in rows])
+        logging.info(f"Linked {len(rows)} missing tracks to {cur.execute('SELECT COUNT(*) FROM missing_songs').fetchone()[0]} songs")
+
+
+def _delete_orphan_missing_songs(cur):
+    cur.execute("DELETE FROM missing_songs WHERE NOT EXISTS (SELECT 1 FROM missing_tracks m WHERE m.song_id=missing_songs.id)")
+
+
 def add_missing_track(info: Dict[str, Any]):
+    # A new playlist reference to a song that was already downloaded starts out as downloaded
     with get_db() as con:
-        con.cursor().execute("INSERT OR IGNORE INTO missing_tracks(title,artist,album,source_playlist_title,source_playlist_id) VALUES (?,?,?,?,?)",
-                               (info['title'],info['artist'],info.get('album'),info['source_playlist_title'],info['source_playlist_id']))
+        cur = con.cursor()
+        song_id = _song_id(cur, info['title'], info['artist'], info.get('album'))
+        cur.execute("INSERT OR IGNORE INTO missing_tracks(title,artist,album,source_playlist_title,source_playlist_id,song_id,status)\
+            VALUES (?,?,?,?,?,?,COALESCE((SELECT 'downloaded' FROM missing_tracks WHERE song_id=? AND status='downloaded' LIMIT 1),'missing'))",
+            (info['title'],info['artist'],info.get('album'),info['source_playlist_title'],info['source_playlist_id'],song_id,song_id))
 
 
 def delete_missing_track(mid: int):
     with get_db() as con:
-        con.cursor().execute("DELETE FROM missing_tracks WHERE id=?",(mid,))
+        cur = con.cursor()
+        cur.execute("DELETE FROM missing_tracks WHERE id=?",(mid,))
+        _delete_orphan_missing_songs(cur)
 
 
 def get_missing_tracks() -> List[tuple]:
@@ -164,9 +352,146 @@ def get_missing_tracks() -> List[tuple]:
         return con.cursor().execute("SELECT * FROM missing_tracks WHERE status='missing' OR status IS NULL").fetchall()
 
 
+def get_missing_songs() -> List[tuple]:
+    """Songs still missing from at least one playlist: (id, title, artist, album)."""
+    with get_db() as con:
+        return con.cursor().execute("SELECT s.id, s.title, s.artist, s.album FROM missing_songs s WHERE EXISTS\
+            (SELECT 1 FROM missing_tracks m WHERE m.song_id=s.id AND m.status='missing')").fetchall()
+
+
+def set_missing_songs_status(song_ids: List[int], status: str) -> List[tuple]:
+    """
+    Set the status of every still-missing playlist reference of the given songs.
+    Returns the missing_tracks rows updated.
+    """
+    updated = []
+    with get_db() as con:
+        cur = con.cursor()
+        for i in range(0, len(song_ids), 500):
+            chunk = song_ids[i:i+500]
+            updated.extend(cur.execute(f"UPDATE missing_tracks SET status=? WHERE status='missing'\
+                AND song_id IN ({','.join('?' for _ in chunk)}) RETURNING *", (status, *chunk)).fetchall())
+    return updated
+
+
+# Sort orders of the missing tracks API: name -> column expression (ties broken by id)
+MISSING_TRACK_SORTS = {
+    'added': "added_date",
+    'title': "title COLLATE NOCASE",
+    'artist': "artist COLLATE NOCASE",
+}
+
+
+# Substring search of the missing tracks lists; the text is matched literally (see _like_pattern)
+_TEXT_FILTER = "(title LIKE ? ESCAPE '\\' OR artist LIKE ? ESCAPE '\\' OR album LIKE ? ESCAPE '\\')"
+
+
+def _like_pattern(text: str) -> str:
+    """'%text%' with LIKE wildcards in the text escaped, so '50%' or 'a_b' match only themselves."""
+    escaped = text.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+    return f"%{escaped}%"
+
+
+def query_missing_tracks(status: Optional[str] = 'missing', playlist: Optional[str] = None, text: Optional[str] = None,
+                         sort: str = 'added', descending: bool = True, after: Optional[list] = None,
+                         limit: int = 100) -> Tuple[List[Dict], Optional[list]]:
+    """
+    One page of missing tracks, filtered and sorted in SQL with keyset pagination.
+    `after` is the cursor returned with the previous page ([sort value, id]).
+    Returns (rows, cursor of the next page or None when there are no more rows).
+    """
+    column = MISSING_TRACK_SORTS.get(sort, MISSING_TRACK_SORTS['added'])
+    where, params = [], []
+    if status:
+        where.append("status=?"); params.append(status)
+    if playlist:
+        where.append("source_playlist_title=?"); params.append(playlist)
+    if text:
+        where.append(_TEXT_FILTER); params.extend([_like_pattern(text)] * 3)
+    if after:
+        where.append(f"({column}, id) {'<' if descending else '>'} (?, ?)"); params.extend(after[:2])
+    order = 'DESC' if descending else 'ASC'
+    sql = f"SELECT id, title, artist, album, source_playlist_title, source_playlist_id, status, added_date\
+        FROM missing_tracks {'WHERE ' + ' AND '.join(where) if where else ''}\
+        ORDER BY {column} {order}, id {order} LIMIT ?"
+    params.append(limit + 1)
+    with get_db() as con:
+        rows = [dict(r) for r in con.cursor().execute(sql, tuple(params)).fetchall()]
+    if len(rows) <= limit:
+        return rows, None
+    rows = rows[:limit]
+    sort_key = 'added_date' if column == 'added_date' else sort
+    return rows, [rows[-1][sort_key], rows[-1]['id']]
+
+
+def get_missing_tracks_matching(track_ids: Optional[List[int]] = None, playlist: Optional[str] = None,
+                                text: Optional[str] = None) -> List[tuple]:
+    """Still-missing tracks among track_ids, or matching the same playlist/text filters as query_missing_tracks."""
+    where, params = ["status='missing'"], []
+    if track_ids is not None:
+        if not track_ids:
+            return []
+        where.append(f"id IN ({','.join('?' for _ in track_ids)})"); params.extend(track_ids)
+    if playlist:
+        where.append("source_playlist_title=?"); params.append(playlist)
+    if text:
+        where.append(_TEXT_FILTER); params.extend([_like_pattern(text)] * 3)
+    with get_db() as con:
+        return con.cursor().execute(f"SELECT * FROM missing_tracks WHERE {' AND '.join(where)}", tuple(params)).fetchall()
+
+
+# Exports: rows are read in chunks with fetchmany, so memory stays flat however large the table
+
+EXPORT_COLUMNS = {
+    'missing_tracks': ['id', 'title', 'artist', 'album', 'source_playlist_title', 'source_playlist_id', 'status', 'added_date'],
+    'library_index': ['id', 'title_clean', 'artist_clean', 'album_clean', 'year', 'added_at', 'provisional'],
+}
+
+
+def _iter_row_chunks(sql: str, params: tuple, chunk_size: int) -> Iterator[List[tuple]]:
+    with get_db() as con:
+        cur = con.cursor()
+        cur.execute(sql, params)
+        while True:
+            rows = cur.fetchmany(chunk_size)
+            if not rows:
+                return
+            yield rows
+
+
+def iter_missing_tracks_export(status: Optional[str] = None, playlist: Optional[str] = None,
+                               chunk_size: int = 1000) -> Iterator[List[tuple]]:
+    """Missing tracks (EXPORT_COLUMNS['missing_tracks']) in chunks of rows, oldest first."""
+    return _iter_row_chunks(f"SELECT {', '.join(EXPORT_COLUMNS['missing_tracks'])} FROM missing_tracks\
+        WHERE (? IS NULL OR status=?) AND (? IS NULL OR source_playlist_title=?) ORDER BY id",
+        (status, status, playlist, playlist), chunk_size)
+
+
+def iter_library_index_export(chunk_size: int = 1000) -> Iterator[List[tuple]]:
+    """The library index (EXPORT_COLUMNS['library_index']) in chunks of rows."""
+    return _iter_row_chunks(f"SELECT {', '.join(EXPORT_COLUMNS['library_index'])} FROM plex_library_index ORDER BY id",
+                            (), chunk_size)
+
+
+def get_missing_track_counts() -> Dict[str, int]:
+    with get_db() as con:
+        rows = con.cursor().execute("SELECT status, COUNT(*) FROM missing_tracks GROUP BY status").fetchall()
+        return {r[0]: r[1] for r in rows}
+
+
+def get_missing_track_playlists(status: Optional[str] = 'missing') -> List[Dict]:
+    """Source playlists with their number of missing tracks, for the view's playlist filter."""
+    with get_db() as con:
+        rows = con.cursor().execute("SELECT source_playlist_title AS title, COUNT(*) AS count FROM missing_tracks\
+            WHERE ? IS NULL OR status=? GROUP BY source_playlist_title ORDER BY source_playlist_title COLLATE NOCASE",
+            (status, status)).fetchall()
+        return [dict(r) for r in rows]
+
+
 def delete_all_missing_tracks():
     with get_db() as con:
         con.cursor().execute("DELETE FROM missing_tracks")
+        con.cursor().execute("DELETE FROM missing_songs")
 
 
 def get_missing_track_by_id(mid: int) -> Optional[Dict]:
@@ -176,8 +501,215 @@ def get_missing_track_by_id(mid: int) -> Optional[Dict]:
 
 
 def update_track_status(mid: int, status: str):
+    """
+    Set the status of a missing track. 'downloaded' fans out to the other playlists missing the same
+    song; a manual resolution ('resolved_manual') only concerns the playlist it was made for.
+    """
+    with get_db() as con:
+        cur = con.cursor()
+        cur.execute("UPDATE missing_tracks SET status=? WHERE id=?",(status,mid))
+        if status == 'downloaded':
+            cur.execute("UPDATE missing_tracks SET status=? WHERE status='missing'\
+                AND song_id=(SELECT song_id FROM missing_tracks WHERE id=?)",(status,mid))
+
+
+# Download job queue
+# States: pending (waiting, possibly for a retry), running, done, quarantined (gave up)
+
+def _enqueue_download_job(cur, link: str, service: str, track_ids: List[int], force: bool) -> Dict[str, Any]:
+    cur.execute("INSERT OR IGNORE INTO download_jobs (link, service) VALUES (?,?)", (link, service))
+    created = cur.rowcount == 1
+    row = cur.execute("SELECT id, state FROM download_jobs WHERE link=?", (link,)).fetchone()
+    job_id, state = row['id'], row['state']
+    requeued = False
+    # A done job whose tracks are missing again (e.g. its provisional index entry expired) is downloaded again
+    stale = state == 'done' and bool(track_ids) and cur.execute(
+        f"SELECT 1 FROM missing_tracks WHERE status='missing' AND id IN ({','.join('?' for _ in track_ids)}) LIMIT 1",
+        tuple(track_ids)).fetchone() is not None
+    if stale or (force and state in ('done', 'quarantined', 'cancelled')):
+        cur.execute("UPDATE download_jobs SET state='pending', attempts=0, next_attempt_at=CURRENT_TIMESTAMP,\
+            last_error=NULL, updated_at=CURRENT_TIMESTAMP WHERE id=?", (job_id,))
+        state, requeued = 'pending', True
+    cur.executemany("INSERT OR IGNORE INTO download_job_tracks (job_id, missing_track_id) VALUES (?,?)",
+                    [(job_id, tid) for tid in track_ids])
+    return {'job_id': job_id, 'created': created, 'requeued': requeued, 'state': state}
+
+
+def enqueue_download_job(link: str, service: str, track_ids: List[int], force: bool = False) -> Dict[str, Any]:
+    """
+    Create a download job for a link (or reuse the existing one) and attach missing-track IDs to it.
+    With force=True a done/quarantined/cancelled job is put back in the queue with its attempts reset;
+    a done job is also put back when one of the given tracks is missing again.
+    Returns {'job_id', 'created', 'requeued', 'state'}.
+    """
+    with get_db() as con:
+        return _enqueue_download_job(con.cursor(), link, service, track_ids, force)
+
+
+def enqueue_download_jobs(jobs: List[tuple], force: bool = False) -> List[Dict[str, Any]]:
+    """enqueue_download_job for a batch of (link, service, track_ids) in one transaction."""
+    with get_db() as con:
+        cur = con.cursor()
+        return [_enqueue_download_job(cur, link, service, track_ids, force) for link, service, track_ids in jobs]
+
+
+def claim_download_jobs(limit: int = 1, services: Optional[List[str]] = None) -> List[Dict]:
+    """
+    Atomically move up to `limit` due pending jobs to 'running' and return them, highest priority first.
+    A single UPDATE ... RETURNING statement, so concurrent workers never claim the same job.
+    """
+    where = "state='pending' AND next_attempt_at <= CURRENT_TIMESTAMP"
+    params: List[Any] = []
+    if services is not None:
+        if not services:
+            return []
+        where += f" AND service IN ({','.join('?' for _ in services)})"
+        params.extend(services)
+    params.append(limit)
+    with get_db() as con:
+        rows = con.cursor().execute(f"UPDATE download_jobs SET state='running', attempts=attempts+1, updated_at=CURRENT_TIMESTAMP\
+            WHERE id IN (SELECT id FROM download_jobs WHERE {where} ORDER BY priority DESC, next_attempt_at, id LIMIT ?)\
+            RETURNING id, link, service, attempts, priority", tuple(params)).fetchall()
+        return sorted((dict(r) for r in rows), key=lambda job: -job['priority'])
+
+
+def refresh_download_job_priorities(playlist_weight: float, ai_bonus: float, age_weight_per_day: float,
+                                    max_age_days: float, job_id: Optional[int] = None,
+                                    job_ids: Optional[List[int]] = None) -> int:
+    """
+    Recompute the priority of pending jobs (all of them, one job or the given jobs) from the missing
+    tracks they cover: playlists missing the same song (any user), a bonus when one of them is an
+    AI/weekly playlist, and the age of the oldest request, capped at max_age_days. One statement
+    whatever the number of jobs. Returns the number of jobs updated.
+    """
+    where, params = "state='pending'", [playlist_weight, ai_bonus, max_age_days, age_weight_per_day]
+    if job_id is not None:
+        job_ids = [job_id]
+    if job_ids is not None:
+        if not job_ids:
+            return 0
+        where += f" AND id IN ({','.join('?' for _ in job_ids)})"
+        params.extend(job_ids)
+    with get_db() as con:
+        cur = con.cursor()
+        cur.execute(f"UPDATE download_jobs SET priority=COALESCE((\
+            SELECT COUNT(DISTINCT m2.source_playlist_title) * ?\
+                + MAX(CASE WHEN m2.source_playlist_title IN (SELECT title FROM managed_ai_playlists)\
+                    OR m2.source_playlist_title LIKE '%week%' OR m2.source_playlist_title LIKE '%settimana%'\
+                    THEN ? ELSE 0 END)\
+                + MIN(MAX(julianday('now') - julianday(m2.added_date)), ?) * ?\
+            FROM download_job_tracks jt JOIN missing_tracks m ON m.id=jt.missing_track_id\
+            JOIN missing_tracks m2 ON m2.song_id=m.song_id\
+            WHERE jt.job_id=download_jobs.id), 0) WHERE {where}", tuple(params))
+        return cur.rowcount
+
+
+def get_download_job_track_ids(job_id: int) -> List[int]:
+    with get_db() as con:
+        rows = con.cursor().execute("SELECT missing_track_id FROM download_job_tracks WHERE job_id=?", (job_id,)).fetchall()
+        return [r[0] for r in rows]
+
+
+def get_download_jobs_with_tracks_downloaded(job_ids: List[int]) -> List[int]:
+    """Jobs among job_ids whose missing tracks are all marked downloaded (e.g. found on disk after a batch)."""
+    if not job_ids:
+        return []
     with get_db() as con:
-        con.cursor().execute("UPDATE missing_tracks SET status=? WHERE id=?",(status,mid))
+        rows = con.cursor().execute(f"SELECT jt.job_id FROM download_job_tracks jt JOIN missing_tracks m ON m.id=jt.missing_track_id\
+            WHERE jt.job_id IN ({','.join('?' for _ in job_ids)}) GROUP BY jt.job_id\
+            HAVING SUM(COALESCE(m.status, '') != 'downloaded') = 0", tuple(job_ids)).fetchall()
+        return [r[0] for r in rows]
+
+
+def complete_download_job(job_id: int) -> Optional[int]:
+    """
+    Mark a running job done and the songs it covers as downloaded, in every playlist missing them.
+    Returns the number of missing tracks updated, or None if the job was no longer running (e.g. cancelled).
+    """
+    with get_db() as con:
+        cur = con.cursor()
+        cur.execute("UPDATE download_jobs SET state='done', last_error=NULL, updated_at=CURRENT_TIMESTAMP\
+            WHERE id=? AND state='running'", (job_id,))
+        if cur.rowcount == 0:
+            return None
+        # Only still-missing references: a track resolved by hand meanwhile keeps its status
+        cur.execute("UPDATE missing_tracks SET status='downloaded' WHERE (status='missing' OR status IS NULL) AND (id IN\
+            (SELECT missing_track_id FROM download_job_tracks WHERE job_id=?) OR song_id IN\
+            (SELECT m.song_id FROM download_job_tracks jt JOIN missing_tracks m ON m.id=jt.missing_track_id WHERE jt.job_id=?))",
+            (job_id, job_id))
+        return cur.rowcount
+
+
+def fail_download_job(job_id: int, error: str, max_attempts: int, retry_base_seconds: int, retry_max_seconds: int) -> str:
+    """
+    Record a failed attempt of a running job: schedule a retry with exponential backoff, or quarantine
+    the job once it has used up max_attempts. Returns the new state; a job that is no longer running
+    (e.g. cancelled) is left alone and its current state returned.
+    """
+    with get_db() as con:
+        cur = con.cursor()
+        row = cur.execute("SELECT attempts, state FROM download_jobs WHERE id=?", (job_id,)).fetchone()
+        if not row:
+            return 'missing'
+        if row['state'] != 'running':
+            return row['state']
+        attempts = row['attempts']
+        if attempts >= max_attempts:
+            state = 'quarantined'
+            cur.execute("UPDATE download_jobs SET state='quarantined', last_error=?, updated_at=CURRENT_TIMESTAMP\
+                WHERE id=? AND state='running'", (error, job_id))
+        else:
+            state = 'pending'
+            delay = min(retry_max_seconds, retry_base_seconds * (2 ** max(0, attempts - 1)))
+            cur.execute("UPDATE download_jobs SET state='pending', last_error=?, next_attempt_at=datetime('now', ?),\
+                updated_at=CURRENT_TIMESTAMP WHERE id=? AND state='running'", (error, f"+{int(delay)} seconds", job_id))
+        if cur.rowcount == 0:
+            # Cancelled between the read and the update
+            return cur.execute("SELECT state FROM download_jobs WHERE id=?", (job_id,)).fetchone()['state']
+        return state
+
+
+def requeue_interrupted_download_jobs() -> int:
+    """Put jobs left 'running' by a previous process (e.g. a container restart) back in the queue."""
+    with get_db() as con:
+        cur = con.cursor()
+        cur.execute("UPDATE download_jobs SET state='pending', attempts=MAX(attempts-1,0), updated_at=CURRENT_TIMESTAMP\
+            WHERE state='running'")
+        return cur.rowcount
+
+
+def cancel_download_job(job_id: int, include_running: bool = True) -> bool:
+    """
+    Cancel a pending job, or a running one when include_running is set. The worker running it
+    is expected to stop the download.
+    """
+    states = ('pending', 'running') if include_running else ('pending',)
+    with get_db() as con:
+        cur = con.cursor()
+        cur.execute(f"UPDATE download_jobs SET state='cancelled', last_error='cancelled by user', updated_at=CURRENT_TIMESTAMP\
+            WHERE id=? AND state IN ({','.join('?' for _ in states)})", (job_id, *states))
+        return cur.rowcount == 1
+
+
+def get_download_job_counts() -> Dict[str, int]:
+    with get_db() as con:
+        rows = con.cursor().execute("SELECT state, COUNT(*) FROM download_jobs GROUP BY state").fetchall()
+        counts = {'pending': 0, 'running': 0, 'done': 0, 'quarantined': 0, 'cancelled': 0}
+        counts.update({r[0]: r[1] for r in rows})
+        return counts
+
+
+def get_missing_tracks_without_download_job() -> List[tuple]:
+    """
+    One missing track per song not covered by a pending or running download job (through any of its
+    playlists), so every song is looked up and downloaded once at a time. Songs whose jobs are finished
+    but which are missing again come back here.
+    """
+    with get_db() as con:
+        return con.cursor().execute("SELECT * FROM missing_tracks m WHERE m.id IN\
+            (SELECT MIN(id) FROM missing_tracks WHERE status='missing' OR status IS NULL GROUP BY song_id)\
+            AND NOT EXISTS (SELECT 1 FROM download_job_tracks jt JOIN missing_tracks m2 ON m2.id=jt.missing_track_id\
+            JOIN download_jobs j ON j.id=jt.job_id WHERE m2.song_id=m.song_id AND j.state IN ('pending','running'))").fetchall()
 
 
 def _clean_string(text: str) -> str:
@@ -187,6 +719,33 @@ def _clean_string(text: str) -> str:
     return re.sub(r"\s+",' ',s).strip()
 
 
+# Link lookup cache, keyed by the normalised (artist, title); album lookups use an 'album:' title key.
+# A row with link NULL is a cached miss; hits and misses expire after separate TTLs.
+
+def _link_cache_key(title: str, artist: str, kind: str) -> tuple:
+    title_key = _clean_string(title or '')
+    return _clean_string(artist or ''), title_key if kind == 'track' else f"{kind}:{title_key}"
+
+
+def get_cached_link(title: str, artist: str, hit_ttl_days: float, miss_ttl_days: float, kind: str = 'track') -> Optional[Dict]:
+    """
+    Return {'link', 'service'} for a fresh cache entry ('link' is None for a cached miss),
+    or None when the lookup has never been done or has expired.
+    """
+    with get_db() as con:
+        r = con.cursor().execute("SELECT link, service FROM link_cache WHERE artist_key=? AND title_key=?\
+            AND checked_at > datetime('now', CASE WHEN link IS NULL THEN ? ELSE ? END)",
+            (*_link_cache_key(title, artist, kind), f"-{miss_ttl_days} days", f"-{hit_ttl_days} days")).fetchone()
+        return dict(r) if r else None
+
+
+def save_link_lookup(title: str, artist: str, link: Optional[str], service: Optional[str], kind: str = 'track'):
+    with get_db() as con:
+        con.cursor().execute("INSERT OR REPLACE INTO link_cache (artist_key, title_key, link, service, found_at, checked_at)\
+            VALUES (?,?,?,?,CASE WHEN ? IS NULL THEN NULL ELSE CURRENT_TIMESTAMP END,CURRENT_TIMESTAMP)",
+            (*_link_cache_key(title, artist, kind), link, service, link))
+
+
 def get_library_index_stats() -> Dict[str,int]:
     with get_db() as con:
         cnt = con.cursor().execute("SELECT COUNT(*) FROM plex_library_index").fetchone()[0]
@@ -200,41 +759,107 @@ def check_track_in_index(title:str,artist:str) -> bool:
         return bool(r)
 
 
-def check_track_in_index_smart(title:str,artist:str,debug:bool=False) -> bool:
+def _fuzzy_patterns(tc:str,ac:str) -> List[str]:
+    # candidates share the first four characters of the title or of the artist
+    return [k[:4] for k in (tc,ac) if len(k)>3]
+
+
+def _fuzzy_match(tc:str,ac:str,dbt:str,dba:str) -> bool:
     from thefuzz import fuzz
+    tscore = fuzz.token_set_ratio(tc,dbt)
+    ascore = fuzz.token_set_ratio(ac,dba) if ac and dba else 100
+    score = (tscore*0.7 + ascore*0.3) if ac and dba else tscore
+    return score>=85
+
+
+def check_track_in_index_smart(title:str,artist:str,debug:bool=False) -> bool:
     tc,ac = _clean_string(title),_clean_string(artist)
     # exact
     if check_track_in_index(title,artist): return True
     # fuzzy retrieve candidates
-    patterns=[]
-    if len(tc)>3: patterns.append(f"%{tc[:4]}%")
-    if len(ac)>3: patterns.append(f"%{ac[:4]}%")
+    patterns=[f"%{p}%" for p in _fuzzy_patterns(tc,ac)]
     if patterns:
         q = " OR ".join(["title_clean LIKE ? OR artist_clean LIKE ?" for _ in patterns])
         params = []
         for p in patterns: params.extend([p,p])
-        candidates = get_db().cursor().execute(f"SELECT title_clean,artist_clean FROM plex_library_index WHERE {q}",tuple(params)).fetchall()
+        with get_db() as con:
+            candidates = con.cursor().execute(f"SELECT title_clean,artist_clean FROM plex_library_index WHERE {q}",tuple(params)).fetchall()
         for dbt,dba in candidates:
-            tscore = fuzz.token_set_ratio(tc,dbt)
-            ascore = fuzz.token_set_ratio(ac,dba) if ac and dba else 100
-            score = (tscore*0.7 + ascore*0.3) if ac and dba else tscore
-            if score>=85: return True
+            if _fuzzy_match(tc,ac,dbt,dba): return True
     return False
 
 
-def check_track_in_filesystem(title:str,artist:str,base_path:str="M:\\Organizzata") -> bool:
-    import glob,platform
-    start=time.time()
-    if platform.system()!='Windows': base_path = base_path.replace('M:\\','/mnt/m/')
-    tc= re.sub(r'[<>:"/\\|?*]','',title)[:30]
-    ac= re.sub(r'[<>:"/\\|?*]','',artist)[:30]
-    patterns=[f"{base_path}/**/*{tc[:15]}*{ac[:15]}*.mp3"]
-    for p in patterns:
-        if time.time()-start>5: break
-        try:
-            if glob.glob(p,recursive=True): return True
-        except: pass
-    return False
+def get_max_index_id() -> int:
+    with get_db() as con:
+        return con.cursor().execute("SELECT COALESCE(MAX(id),0) FROM plex_library_index").fetchone()[0]
+
+
+def get_max_missing_song_id() -> int:
+    with get_db() as con:
+        return con.cursor().execute("SELECT COALESCE(MAX(id),0) FROM missing_songs").fetchone()[0]
+
+
+def reconcile_missing_songs_exact(since_index_id:Optional[int]=None,since_song_id:Optional[int]=None) -> List[tuple]:
+    """
+    Mark downloaded, in one statement, every missing track whose song has an exact match
+    in the library index (join on the normalised keys). Returns the missing_tracks rows updated.
+    With watermarks only index rows above since_index_id are joined, plus the whole index
+    for songs above since_song_id.
+    """
+    songs="SELECT s.id FROM missing_songs s JOIN plex_library_index p ON p.artist_clean=s.artist_key AND p.title_clean=s.title_key"
+    params=()
+    if since_index_id is not None:
+        songs=f"SELECT s.id FROM plex_library_index p JOIN missing_songs s ON s.artist_key=p.artist_clean AND s.title_key=p.title_clean\
+            WHERE p.id>? UNION {songs} WHERE s.id>?"
+        params=(since_index_id,since_song_id or 0)
+    with get_db() as con:
+        return con.cursor().execute(f"UPDATE missing_tracks SET status='downloaded' WHERE status='missing' AND song_id IN ({songs})\
+            RETURNING *",params).fetchall()
+
+
+def match_missing_songs_fuzzy(songs:List[tuple],batch_size:int=100,since_index_id:Optional[int]=None) -> List[int]:
+    """
+    Fuzzy-match songs (id, title, artist, ...) against the index, with the same rules as
+    check_track_in_index_smart but one candidate query per batch of songs. With since_index_id
+    only the index rows added after it are candidates. Returns the matched song IDs.
+    """
+    matched=[]
+    for i in range(0,len(songs),batch_size):
+        batch=[(song[0],_clean_string(song[1]),_clean_string(song[2])) for song in songs[i:i+batch_size]]
+        patterns=sorted({p for _,tc,ac in batch for p in _fuzzy_patterns(tc,ac)})
+        if not patterns: continue
+        q=" OR ".join(["title_clean LIKE ? OR artist_clean LIKE ?" for _ in patterns])
+        params=[]
+        for p in patterns: params.extend([f"%{p}%",f"%{p}%"])
+        params.append(since_index_id if since_index_id is not None else -1)
+        with get_db() as con:
+            candidates=con.cursor().execute(f"SELECT title_clean,artist_clean FROM plex_library_index WHERE ({q}) AND id>?",
+                                            tuple(params)).fetchall()
+        for song_id,tc,ac in batch:
+            song_patterns=_fuzzy_patterns(tc,ac)
+            for dbt,dba in candidates:
+                if any(p in dbt or p in dba for p in song_patterns) and _fuzzy_match(tc,ac,dbt,dba):
+                    matched.append(song_id)
+                    break
+    return matched
+
+
+def match_missing_songs_against_new_index(songs:List[tuple],since_index_id:int,batch_size:int=100) -> List[int]:
+    """
+    Fuzzy-match songs (id, title, artist, ...) against the index rows added after since_index_id only,
+    with the same candidate rule as the full match. Returns the matched song IDs.
+    """
+    return match_missing_songs_fuzzy(songs,batch_size,since_index_id=since_index_id)
+
+
+def check_track_in_filesystem(title:str,artist:str,base_path:Optional[str]=None) -> bool:
+    # Indexed lookup in the persistent manifest of the music folder (see file_manifest)
+    from .file_manifest import find_track_file, MUSIC_FOLDER_PATH
+    try:
+        return find_track_file(title,artist,base_path or MUSIC_FOLDER_PATH) is not None
+    except Exception as e:
+        logging.warning(f"Filesystem manifest lookup failed for '{title} - {artist}': {e}")
+        return False
 
 
 def comprehensive_track_verification(title:str,artist:str,debug:bool=False) -> Dict[str,bool]:
@@ -245,6 +870,12 @@ def comprehensive_track_verification(title:str,artist:str,debug:bool=False) -> D
     return res
 
 
+# A real Plex item confirms the provisional row with the same keys instead of being ignored
+_INDEX_UPSERT = "INSERT INTO plex_library_index (title_clean,artist_clean,album_clean,year,added_at) VALUES (?,?,?,?,?)\
+    ON CONFLICT(artist_clean,album_clean,title_clean) DO UPDATE SET provisional=0,year=excluded.year,added_at=excluded.added_at\
+    WHERE plex_library_index.provisional=1"
+
+
 def add_track_to_index(track:Track) -> bool:
     if not hasattr(track,'title'): return False
     title,artist,album = track.title,track.grandparentTitle,track.parentTitle
@@ -253,7 +884,7 @@ def add_track_to_index(track:Track) -> bool:
     for attempt in range(3):
         try:
             with sqlite3.connect(DB_PATH,timeout=10) as con:
-                con.execute("INSERT OR IGNORE INTO plex_library_index (title_clean,artist_clean,album_clean,year,added_at) VALUES (?,?,?,?,?)",(tc,ac,alb,year,added))
+                con.execute(_INDEX_UPSERT,(tc,ac,alb,year,added))
             return True
         except sqlite3.OperationalError:
             time.sleep(0.1)
@@ -271,11 +902,52 @@ def bulk_add_tracks_to_index(tracks:List[Track],chunk_size:int=1000) -> int:
         with sqlite3.connect(DB_PATH) as con:
             con.execute("PRAGMA synchronous=OFF"); con.execute("PRAGMA journal_mode=MEMORY")
             cur=con.cursor()
-            cur.executemany("INSERT OR IGNORE INTO plex_library_index (title_clean,artist_clean,album_clean,year,added_at) VALUES (?,?,?,?,?)",chunk)
+            cur.executemany(_INDEX_UPSERT,chunk)
             inserted+=cur.rowcount
     return inserted
 
 
+def add_provisional_index_entries(entries:List[Dict]) -> Tuple[int, int]:
+    """
+    Index tracks read from downloaded files ({'title','artist','album','year'}) as provisional rows,
+    and mark the missing tracks they match as downloaded. Returns (rows inserted, missing tracks marked).
+    """
+    data=[(_clean_string(e['title']),_clean_string(e['artist']),_clean_string(e.get('album') or ''),e.get('year'))
+          for e in entries if e.get('title') and e.get('artist')]
+    if not data: return 0,0
+    keys={(ac,tc) for tc,ac,_,_ in data}
+    with get_db() as con:
+        cur=con.cursor()
+        cur.executemany("INSERT OR IGNORE INTO plex_library_index (title_clean,artist_clean,album_clean,year,added_at,provisional)\
+            VALUES (?,?,?,?,CURRENT_TIMESTAMP,1)",data)
+        inserted=cur.rowcount
+        song_ids=[r[0] for key in keys for r in cur.execute("SELECT id FROM missing_songs WHERE artist_key=? AND title_key=?",key)]
+    return inserted,len(set_missing_songs_status(song_ids,'downloaded'))
+
+
+def reconcile_provisional_index_entries(max_age_days:float) -> Tuple[int, int, int]:
+    """
+    Drop provisional rows that Plex has confirmed under slightly different keys (same artist/title,
+    other album), and those Plex never confirmed within max_age_days. The missing tracks marked
+    downloaded on the strength of an expired row go back to missing, unless another index row
+    still has the song. Returns (confirmed, expired, missing tracks reverted).
+    """
+    with get_db() as con:
+        cur=con.cursor()
+        cur.execute("DELETE FROM plex_library_index WHERE provisional=1 AND EXISTS (SELECT 1 FROM plex_library_index p\
+            WHERE p.provisional=0 AND p.artist_clean=plex_library_index.artist_clean AND p.title_clean=plex_library_index.title_clean)")
+        confirmed=cur.rowcount
+        expired=cur.execute("DELETE FROM plex_library_index WHERE provisional=1 AND added_at < datetime('now', ?)\
+            RETURNING artist_clean,title_clean",(f"-{max_age_days} days",)).fetchall()
+        reverted=0
+        for ac,tc in {tuple(r) for r in expired}:
+            cur.execute("UPDATE missing_tracks SET status='missing' WHERE status='downloaded' AND song_id IN\
+                (SELECT id FROM missing_songs WHERE artist_key=? AND title_key=?)\
+                AND NOT EXISTS (SELECT 1 FROM plex_library_index WHERE artist_clean=? AND title_clean=?)",(ac,tc,ac,tc))
+            reverted+=cur.rowcount
+        return confirmed,len(expired),reverted
+
+
 def test_matching_improvements(sample_size:int=100) -> Optional[Dict]:
     import random
     missing=get_missing_tracks()
@@ -296,14 +968,17 @@ def clean_invalid_missing_tracks():
         cur.execute("DELETE FROM missing_tracks WHERE source_playlist_title LIKE '%no_delete%'")
         for k in tvs:
             cur.execute("DELETE FROM missing_tracks WHERE title LIKE ? OR artist LIKE ?","%{}%".format(k))
+        _delete_orphan_missing_songs(cur)
 
 
-def clean_resolved_missing_tracks() -> (int,int):
+def clean_resolved_missing_tracks() -> Tuple[int, int]:
     with get_db() as con:
         cur=con.cursor()
         cur.execute("SELECT COUNT(*) FROM missing_tracks WHERE status IN ('downloaded','resolved_manual')")
         cnt=cur.fetchone()[0]
-        if cnt>0: cur.execute("DELETE FROM missing_tracks WHERE status IN ('downloaded','resolved_manual')")
+        if cnt>0:
+            cur.execute("DELETE FROM missing_tracks WHERE status IN ('downloaded','resolved_manual')")
+            _delete_orphan_missing_songs(cur)
         return cnt, con.cursor().execute("SELECT COUNT(*) FROM missing_tracks").fetchone()[0]
 
 
@@ -314,7 +989,8 @@ def clean_tv_content_from_missing_tracks():
 def diagnose_indexing_issues():
     plex_url,plex_token,lib=os.getenv('PLEX_URL'),os.getenv('PLEX_TOKEN'),os.getenv('LIBRARY_NAME','Music')
     if not plex_url or not plex_token: return
-    plex=PlexServer(plex_url,plex_token)
+    from .http_client import create_session
+    plex=PlexServer(plex_url,plex_token,session=create_session())
     items=plex.library.section(lib).search(libtype='track',limit=1000)
     counts={'tracks':0,'non':0,'empty':0}
     for it in items:
@@ -324,6 +1000,7 @@ def diagnose_indexing_issues():
 
 
 def clear_library_index():
+    # Provisional rows survive a rebuild: Plex may not have indexed those files yet
     with get_db() as con:
-        con.cursor().execute("DELETE FROM plex_library_index")
+        con.cursor().execute("DELETE FROM plex_library_index WHERE provisional=0")
     logging.info("Cleared plex_library_index")
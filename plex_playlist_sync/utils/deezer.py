@@ -1,26 +1,54 @@
 import logging
-from typing import List
+import time
+from dataclasses import asdict
+from typing import List, Tuple, Dict, Optional
 import requests
 import os
 from plexapi.server import PlexServer
 from .helperClasses import Playlist, Track, UserInputs
 from .plex import update_or_create_plex_playlist
+from .database import get_cached_source_playlist, save_source_playlist_cache
+from .http_client import http_get, pause_host, backoff_delay, in_request_deadline, MAX_RETRIES
 
 DEEZER_API_URL = "https://api.deezer.com"
+# Deezer reports throttling inside a 200 response: {"error": {"code": 4, "message": "Quota limit exceeded"}}
+DEEZER_QUOTA_ERROR_CODE = 4
 
 
-def _get_all_tracks_from_playlist(tracklist_url: str) -> List[Track]:
+def _deezer_get_json(url: str, params: Optional[Dict] = None) -> Dict:
+    """
+    GET a Deezer API URL through the shared rate-limited session.
+    Quota errors reported in the response body are retried like HTTP 429s (not inside request_deadline()).
+    """
+    for attempt in range(MAX_RETRIES + 1):
+        response = http_get(url, params=params)
+        response.raise_for_status()
+        data = response.json()
+        error = data.get('error') if isinstance(data, dict) else None
+        if not error or error.get('code') != DEEZER_QUOTA_ERROR_CODE or attempt >= MAX_RETRIES or in_request_deadline():
+            return data
+        delay = backoff_delay(attempt)
+        logging.warning(f"Deezer quota exceeded; backing off {delay:.1f}s (retry {attempt + 1}/{MAX_RETRIES})")
+        pause_host(url, delay)
+        time.sleep(delay)
+    return data
+
+
+def _get_all_tracks_from_playlist(tracklist_url: str) -> Tuple[List[Track], bool]:
     """
     Retrieve ALL tracks from a Deezer playlist URL, handling pagination.
+    Returns the tracks and whether every page was read successfully.
     """
     all_tracks: List[Track] = []
     url = tracklist_url
+    complete = False
 
     while url:
         try:
-            response = requests.get(url)
-            response.raise_for_status()
-            data = response.json()
+            data = _deezer_get_json(url)
+            if 'error' in data:
+                logging.error(f"Deezer API error fetching tracklist at {url}: {data['error'].get('message', 'Unknown error')}")
+                break
 
             for track_data in data.get('data', []):
                 track = Track(
@@ -35,6 +63,8 @@ def _get_all_tracks_from_playlist(tracklist_url: str) -> List[Track]:
             url = data.get('next')
             if url:
                 logging.debug(f"Deezer pagination: moving to {url}")
+            else:
+                complete = True
 
         except requests.exceptions.RequestException as e:
             logging.error(f"Network error fetching Deezer playlist at {url}: {e}")
@@ -43,7 +73,32 @@ def _get_all_tracks_from_playlist(tracklist_url: str) -> List[Track]:
             logging.error(f"Unexpected error parsing Deezer tracks: {e}")
             break
 
-    return all_tracks
+    return all_tracks, complete
+
+
+def _get_playlist_tracks_cached(playlist_id: str, playlist_data: dict) -> Optional[List[Track]]:
+    """
+    Return the tracks of a Deezer playlist, skipping the paginated tracklist
+    download when the playlist checksum matches the one cached on disk.
+    Returns None if the tracklist could not be read completely and nothing is cached,
+    so a truncated playlist is never synced.
+    """
+    checksum = playlist_data.get('checksum')
+    cached = get_cached_source_playlist('deezer', playlist_id)
+    if checksum and cached and cached['snapshot'] == checksum:
+        logging.info(f"Deezer playlist {playlist_id} unchanged (checksum {checksum}); using cached tracklist.")
+        return [Track(**t) for t in cached['tracks']]
+
+    tracks, complete = _get_all_tracks_from_playlist(playlist_data.get('tracklist', ''))
+    if not complete:
+        if cached:
+            logging.warning(f"Deezer tracklist for playlist {playlist_id} is incomplete; falling back to the last cached tracklist.")
+            return [Track(**t) for t in cached['tracks']]
+        logging.error(f"Deezer tracklist for playlist {playlist_id} is incomplete; skipping to avoid syncing a truncated playlist.")
+        return None
+    if checksum:
+        save_source_playlist_cache('deezer', playlist_id, checksum, [asdict(t) for t in tracks])
+    return tracks
 
 
 def deezer_playlist_sync(plex: PlexServer, user_inputs: UserInputs) -> None:
@@ -67,9 +122,7 @@ def deezer_playlist_sync(plex: PlexServer, user_inputs: UserInputs) -> None:
         logging.info(f"Syncing Deezer playlist ID: {playlist_id}")
         playlist_url = f"{DEEZER_API_URL}/playlist/{playlist_id}"
         try:
-            response = requests.get(playlist_url)
-            response.raise_for_status()
-            playlist_data = response.json()
+            playlist_data = _deezer_get_json(playlist_url)
 
             if 'error' in playlist_data:
                 message = playlist_data['error'].get('message', 'Unknown error')
@@ -83,7 +136,9 @@ def deezer_playlist_sync(plex: PlexServer, user_inputs: UserInputs) -> None:
                 poster=playlist_data.get('picture_big', '')
             )
 
-            tracks = _get_all_tracks_from_playlist(playlist_data.get('tracklist', ''))
+            tracks = _get_playlist_tracks_cached(playlist_id, playlist_data)
+            if tracks is None:
+                continue
             if tracks:
                 logging.info(f"Found {len(tracks)} tracks in playlist '{playlist_obj.name}'")
                 update_or_create_plex_playlist(plex, playlist_obj, tracks, user_inputs)
@@ -94,3 +149,56 @@ def deezer_playlist_sync(plex: PlexServer, user_inputs: UserInputs) -> None:
             logging.error(f"Network error retrieving Deezer playlist {playlist_id}: {e}")
         except Exception as e:
             logging.error(f"Unexpected error during Deezer sync for playlist {playlist_id}: {e}")
+
+
+class DeezerLinkFinder:
+    """
+    Finds Deezer links for missing tracks using the public search API.
+    """
+
+    @staticmethod
+    def search_tracks(title: str, artist: str, limit: int = 10) -> List[Dict]:
+        """
+        Return raw Deezer search results for a title/artist pair ([] if Deezer has none).
+        Network errors are raised (requests.RequestException) so they are not mistaken for a miss.
+        """
+        queries = [f'artist:"{artist}" track:"{title}"', f"{title} {artist}"]
+        for query in queries:
+            data = _deezer_get_json(f"{DEEZER_API_URL}/search", params={'q': query, 'limit': limit})
+            results = data.get('data', [])
+            if results:
+                return results
+        return []
+
+    @staticmethod
+    def find_track_link(track_info: Dict) -> Optional[str]:
+        """
+        Return the Deezer link of the requested track, or None.
+        Network errors are raised (requests.RequestException).
+        """
+        title = track_info.get('title', '')
+        artist = track_info.get('artist', '')
+        if not title or not artist:
+            return None
+        results = DeezerLinkFinder.search_tracks(title, artist, limit=5)
+        if not results:
+            return None
+        track_id = results[0].get('id')
+        return f"https://www.deezer.com/track/{track_id}" if track_id else None
+
+    @staticmethod
+    def find_album_link(album_info: Dict) -> Optional[str]:
+        """
+        Return the Deezer link of the requested album ({'album', 'artist'}), or None.
+        Network errors are raised (requests.RequestException).
+        """
+        album = album_info.get('album', '')
+        artist = album_info.get('artist', '')
+        if not album or not artist:
+            return None
+        for query in (f'artist:"{artist}" album:"{album}"', f"{album} {artist}"):
+            data = _deezer_get_json(f"{DEEZER_API_URL}/search/album", params={'q': query, 'limit': 5})
+            results = data.get('data', [])
+            if results:
+                return f"https://www.deezer.com/album/{results[0]['id']}"
+        return None
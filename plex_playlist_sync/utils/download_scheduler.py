@@ -0,0 +1,297 @@
+"""
+Download scheduler: a pool of worker threads draining the durable download_jobs
+queue in SQLite, with a separate concurrency cap for each streaming service.
+Failed jobs are retried with exponential backoff and quarantined after
+DOWNLOAD_MAX_ATTEMPTS, so the queue survives restarts and stops wasting
+bandwidth on tracks that will never download. Running jobs report progress
+and can be cancelled.
+"""
+
+import os
+import logging
+import threading
+import time
+from collections import deque
+from typing import Callable, Deque, Dict, List, Optional
+from urllib.parse import urlparse
+
+from .database import (
+    enqueue_download_job,
+    enqueue_download_jobs,
+    claim_download_jobs,
+    complete_download_job,
+    fail_download_job,
+    cancel_download_job,
+    requeue_interrupted_download_jobs,
+    get_download_job_counts,
+    get_download_job_track_ids,
+    refresh_download_job_priorities,
+)
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_WORKERS = int(os.getenv("DOWNLOAD_WORKERS", "4"))
+DEFAULT_SERVICE_LIMITS = {
+    "deezer": int(os.getenv("DOWNLOAD_CONCURRENCY_DEEZER", "2")),
+    "tidal": int(os.getenv("DOWNLOAD_CONCURRENCY_TIDAL", "2")),
+    "qobuz": int(os.getenv("DOWNLOAD_CONCURRENCY_QOBUZ", "2")),
+    "other": int(os.getenv("DOWNLOAD_CONCURRENCY_OTHER", "1")),
+}
+DOWNLOAD_MAX_ATTEMPTS = int(os.getenv("DOWNLOAD_MAX_ATTEMPTS", "5"))
+DOWNLOAD_RETRY_BASE_SECONDS = int(os.getenv("DOWNLOAD_RETRY_BASE_SECONDS", "900"))
+DOWNLOAD_RETRY_MAX_SECONDS = int(os.getenv("DOWNLOAD_RETRY_MAX_SECONDS", str(7 * 86400)))
+# Priority score: playlists waiting for the song, AI/weekly playlist bonus, days waiting (capped)
+PRIORITY_PLAYLIST_WEIGHT = float(os.getenv("DOWNLOAD_PRIORITY_PLAYLIST_WEIGHT", "10"))
+PRIORITY_AI_BONUS = float(os.getenv("DOWNLOAD_PRIORITY_AI_BONUS", "25"))
+PRIORITY_AGE_WEIGHT_PER_DAY = float(os.getenv("DOWNLOAD_PRIORITY_AGE_WEIGHT", "0.5"))
+PRIORITY_MAX_AGE_DAYS = 60
+# How often idle workers look for jobs whose retry time has come
+POLL_INTERVAL_SECONDS = 15
+# Window used to compute the throughput figure exposed by stats()
+THROUGHPUT_WINDOW_SECONDS = 600
+
+
+def detect_service(link: str) -> str:
+    host = (urlparse(link).hostname or "").lower()
+    for service in ("deezer", "tidal", "qobuz"):
+        if service in host:
+            return service
+    return "other"
+
+
+def refresh_priorities(job_id: Optional[int] = None, job_ids: Optional[List[int]] = None) -> int:
+    """Recompute the demand-weighted priority of pending jobs (all of them, one, or the given ones)."""
+    return refresh_download_job_priorities(
+        PRIORITY_PLAYLIST_WEIGHT, PRIORITY_AI_BONUS, PRIORITY_AGE_WEIGHT_PER_DAY, PRIORITY_MAX_AGE_DAYS,
+        job_id=job_id, job_ids=job_ids,
+    )
+
+
+def queue_download(link: str, track_ids: List[int], force: bool = False) -> Dict:
+    """Add a link to the durable queue (deduplicated by link) and score it."""
+    result = enqueue_download_job(link, detect_service(link), track_ids, force=force)
+    refresh_priorities(result["job_id"])
+    return result
+
+
+def queue_downloads(planned: Dict[str, List[int]], force: bool = False) -> List[Dict]:
+    """queue_download for a batch of links (link -> track IDs): queued in one transaction, scored in one statement."""
+    results = enqueue_download_jobs([(link, detect_service(link), ids) for link, ids in planned.items()], force=force)
+    refresh_priorities(job_ids=sorted({result["job_id"] for result in results}))
+    return results
+
+
+def record_job_outcome(job: Dict, success: bool, error: str = "") -> str:
+    """Persist the result of one download attempt. Returns the job's new state."""
+    if success:
+        updated = complete_download_job(job["id"])
+        if updated is None:
+            logger.info(f"Download of {job['link']} finished after job {job['id']} was cancelled; outcome ignored.")
+            return "cancelled"
+        logger.info(f"Download completed for {job['link']} ({updated} missing tracks marked downloaded)")
+        return "done"
+    state = fail_download_job(
+        job["id"], error or "download failed",
+        DOWNLOAD_MAX_ATTEMPTS, DOWNLOAD_RETRY_BASE_SECONDS, DOWNLOAD_RETRY_MAX_SECONDS,
+    )
+    if state == "quarantined":
+        logger.warning(f"Download of {job['link']} failed {job['attempts']} times; job quarantined.")
+    elif state != "pending":
+        logger.info(f"Download of {job['link']} failed after job {job['id']} left the running state ({state}); outcome ignored.")
+    else:
+        logger.warning(f"Download of {job['link']} failed (attempt {job['attempts']}/{DOWNLOAD_MAX_ATTEMPTS}); retry scheduled.")
+    return state
+
+
+class DownloadScheduler:
+    """
+    Runs N download workers over the download_jobs table. A worker only claims
+    jobs for services below their concurrency cap, so a slow service cannot
+    starve the others. Claims are atomic, so other claimers (e.g. the sync
+    cycle's batch downloader) never pick the same job.
+    """
+
+    def __init__(
+        self,
+        download_fn: Callable[..., None],
+        workers: int = DEFAULT_WORKERS,
+        service_limits: Optional[Dict[str, int]] = None,
+    ):
+        self.download_fn = download_fn
+        self.workers = workers
+        self.service_limits = dict(service_limits or DEFAULT_SERVICE_LIMITS)
+        self.condition = threading.Condition()
+        self.active: Dict[int, Dict] = {}
+        self.active_per_service: Dict[str, int] = {s: 0 for s in self.service_limits}
+        self.completed = 0
+        self.failed = 0
+        self.cancelled = 0
+        self.finished_at: Deque[float] = deque()
+        self.threads: List[threading.Thread] = []
+        self.running = False
+
+    def start(self):
+        with self.condition:
+            if self.running:
+                return
+            self.running = True
+        requeued = requeue_interrupted_download_jobs()
+        if requeued:
+            logger.info(f"Re-queued {requeued} download jobs interrupted by the previous shutdown")
+        refresh_priorities()
+        for i in range(self.workers):
+            thread = threading.Thread(target=self._worker, name=f"download-worker-{i + 1}", daemon=True)
+            thread.start()
+            self.threads.append(thread)
+        logger.info(f"Download scheduler started: {self.workers} workers, limits {self.service_limits}")
+
+    def stop(self):
+        with self.condition:
+            self.running = False
+            self.condition.notify_all()
+
+    def submit(self, link: str, track_ids: Optional[List[int]] = None, force: bool = True) -> bool:
+        """
+        Queue a link. Returns False if it was already queued or running (IDs are merged).
+        Manual submissions default to force=True so a quarantined link can be retried by hand.
+        """
+        result = queue_download(link, list(track_ids or []), force=force)
+        with self.condition:
+            self.condition.notify_all()
+        if result["created"] or result["requeued"]:
+            logger.info(f"Queued download: {link}")
+            return True
+        logger.info(f"Download already known (state {result['state']}), merged track IDs: {link}")
+        return False
+
+    def submit_many(self, planned: Dict[str, List[int]], force: bool = True) -> int:
+        """Queue a batch of links (link -> track IDs). Returns how many were newly queued or re-queued."""
+        results = queue_downloads(planned, force=force)
+        with self.condition:
+            self.condition.notify_all()
+        queued = sum(1 for result in results if result["created"] or result["requeued"])
+        logger.info(f"Queued {queued} downloads ({len(results) - queued} already known, track IDs merged)")
+        return queued
+
+    def cancel(self, job_id: int) -> bool:
+        """
+        Cancel a queued job, or one running in this scheduler: its download is stopped through the
+        cancel event handed to download_fn. Jobs running elsewhere (the sync cycle's streamrip batch)
+        cannot be stopped, so they are not cancellable. Returns False if the job was not cancellable.
+        """
+        with self.condition:
+            # Workers claim under this lock, so a job cannot start running here between the two steps
+            job = self.active.get(job_id)
+            if not cancel_download_job(job_id, include_running=job is not None):
+                return False
+            if job is not None:
+                job["cancel_event"].set()
+        logger.info(f"Download job {job_id} cancelled")
+        return True
+
+    def _limit_for(self, service: str) -> int:
+        return self.service_limits.get(service, self.service_limits.get("other", 1))
+
+    def _services_with_capacity(self) -> List[str]:
+        return [s for s in self.service_limits if self.active_per_service.get(s, 0) < self._limit_for(s)]
+
+    def _claim(self) -> Optional[Dict]:
+        """Claim one due job for a service with a free slot; caller holds the lock."""
+        services = self._services_with_capacity()
+        if not services:
+            return None
+        jobs = claim_download_jobs(limit=1, services=services)
+        if not jobs:
+            return None
+        job = jobs[0]
+        job["started_at"] = time.time()
+        job["cancel_event"] = threading.Event()
+        job["progress"] = {}
+        self.active[job["id"]] = job
+        self.active_per_service[job["service"]] = self.active_per_service.get(job["service"], 0) + 1
+        return job
+
+    def _worker(self):
+        while True:
+            with self.condition:
+                job = None
+                while self.running and job is None:
+                    try:
+                        job = self._claim()
+                    except Exception as e:
+                        logger.error(f"Error claiming download job: {e}")
+                    if job is None:
+                        self.condition.wait(POLL_INTERVAL_SECONDS)
+                if not self.running:
+                    return
+
+            success, error = False, ""
+            try:
+                logger.info(f"Starting download for {job['link']} (job {job['id']}, attempt {job['attempts']})")
+                self.download_fn(
+                    job["link"],
+                    on_progress=lambda progress, job=job: job.__setitem__("progress", progress),
+                    cancel_event=job["cancel_event"],
+                )
+                success = True
+            except Exception as e:
+                error = str(e)
+                if not job["cancel_event"].is_set():
+                    logger.error(f"Error downloading {job['link']} (job {job['id']}): {e}", exc_info=True)
+
+            cancelled = job["cancel_event"].is_set()
+            if not cancelled:
+                # A cancelled job already has its final state in the database
+                try:
+                    record_job_outcome(job, success, error)
+                except Exception as e:
+                    logger.error(f"Error recording outcome of download job {job['id']}: {e}", exc_info=True)
+
+            with self.condition:
+                self.active.pop(job["id"], None)
+                self.active_per_service[job["service"]] -= 1
+                if cancelled:
+                    self.cancelled += 1
+                elif success:
+                    self.completed += 1
+                    self.finished_at.append(time.time())
+                else:
+                    self.failed += 1
+                self.condition.notify_all()
+
+    def stats(self) -> Dict:
+        now = time.time()
+        counts = get_download_job_counts()
+        with self.condition:
+            while self.finished_at and now - self.finished_at[0] > THROUGHPUT_WINDOW_SECONDS:
+                self.finished_at.popleft()
+            active_jobs = [dict(job, progress=dict(job["progress"])) for job in self.active.values()]
+            stats = {
+                "queue_depth": counts.get("pending", 0),
+                "jobs_by_state": counts,
+                "active_count": len(active_jobs),
+                "per_service": {
+                    service: {"active": self.active_per_service.get(service, 0), "limit": limit}
+                    for service, limit in self.service_limits.items()
+                },
+                "completed": self.completed,
+                "failed": self.failed,
+                "cancelled": self.cancelled,
+                "throughput_per_minute": round(len(self.finished_at) * 60.0 / THROUGHPUT_WINDOW_SECONDS, 2),
+                "workers": self.workers,
+            }
+        stats["active_jobs"] = [
+            {
+                "job_id": job["id"],
+                "link": job["link"],
+                "service": job["service"],
+                "attempt": job["attempts"],
+                "priority": round(job["priority"], 1),
+                "track_ids": get_download_job_track_ids(job["id"]),
+                "running_seconds": round(now - job["started_at"], 1),
+                "progress": job["progress"],
+                "cancelling": job["cancel_event"].is_set(),
+            }
+            for job in active_jobs
+        ]
+        return stats
@@ -1,18 +1,33 @@
 import os
+import re
 import logging
+import queue
+import sqlite3
 import subprocess
+import threading
 import time
+import tomllib
 import unicodedata
-from typing import Dict, Optional, List
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, as_completed, wait
+from typing import Callable, Dict, Optional, List, Set, Tuple
 
-from deezer import DeezerLinkFinder
-from tidal import TidalLinkFinder
+from .deezer import DeezerLinkFinder
+from .tidal import TidalLinkFinder, TidalUnavailable
+from .spotify import create_spotify_client
+from .database import get_cached_link, save_link_lookup, add_provisional_index_entries
+from .file_manifest import AUDIO_EXTENSIONS
+from .http_client import request_deadline
+import mutagen
 import spotipy
-from spotipy.oauth2 import SpotifyClientCredentials
 
 # Configuration from environment variables
 TEMP_DIR = os.environ.get('TEMP_DOWNLOAD_DIR', '/app/state')
 STREAMRIP_CONFIG = os.environ.get('STREAMRIP_CONFIG_PATH', '/root/.config/streamrip/config.toml')
+# Where streamrip writes downloads, as seen by the Plex server (e.g. a host path); defaults to
+# the [downloads] folder of the streamrip config
+PLEX_DOWNLOAD_PATH = os.environ.get('PLEX_DOWNLOAD_PATH', '')
+# streamrip is stopped only when it prints nothing for this long, however long the batch is
+STREAMRIP_INACTIVITY_TIMEOUT = int(os.environ.get('STREAMRIP_INACTIVITY_TIMEOUT', '600'))
 
 # Service credentials
 download_order = [s.strip().lower() for s in os.environ.get('DOWNLOAD_ORDER', 'tidal,deezer').split(',')]
@@ -21,11 +36,162 @@ TIDAL_PASSWORD = os.environ.get('TIDAL_PASSWORD', '')
 SPOTIFY_CLIENT_ID = os.environ.get('SPOTIFY_CLIENT_ID', '')
 SPOTIFY_CLIENT_SECRET = os.environ.get('SPOTIFY_CLIENT_SECRET', '')
 
+# Link lookup cache TTLs: found links are trusted longer than "not found" answers
+LINK_CACHE_HIT_TTL_DAYS = float(os.environ.get('LINK_CACHE_HIT_TTL_DAYS', '30'))
+LINK_CACHE_MISS_TTL_DAYS = float(os.environ.get('LINK_CACHE_MISS_TTL_DAYS', '3'))
+
+# Link resolution queries every configured service at once; a service that has not
+# answered LINK_LOOKUP_TIMEOUT seconds after its lookup started is treated as a miss
+LINK_LOOKUP_TIMEOUT = float(os.environ.get('LINK_LOOKUP_TIMEOUT', '30'))
+LINK_LOOKUP_WORKERS = int(os.environ.get('LINK_LOOKUP_WORKERS', '9'))
+# Download the whole album instead of single tracks once this many of its tracks are missing
+ALBUM_DOWNLOAD_MIN_TRACKS = int(os.environ.get('ALBUM_DOWNLOAD_MIN_TRACKS', '3'))
+
 # Initialize Spotify client if configured
 spotify_client: Optional[spotipy.Spotify] = None
 if 'spotify' in download_order and SPOTIFY_CLIENT_ID and SPOTIFY_CLIENT_SECRET:
-    creds = SpotifyClientCredentials(client_id=SPOTIFY_CLIENT_ID, client_secret=SPOTIFY_CLIENT_SECRET)
-    spotify_client = spotipy.Spotify(auth_manager=creds)
+    spotify_client = create_spotify_client(SPOTIFY_CLIENT_ID, SPOTIFY_CLIENT_SECRET)
+
+
+def _load_streamrip_config() -> Dict:
+    try:
+        with open(STREAMRIP_CONFIG, 'rb') as f:
+            return tomllib.load(f)
+    except (OSError, tomllib.TOMLDecodeError) as e:
+        logging.warning(f'Could not read streamrip config {STREAMRIP_CONFIG}: {e}')
+        return {}
+
+
+def get_streamrip_download_folder() -> Optional[str]:
+    """The [downloads] folder configured for streamrip, or None if the config cannot be read."""
+    return _load_streamrip_config().get('downloads', {}).get('folder') or None
+
+
+def _read_streamrip_ids(path: str, table: str) -> Set[str]:
+    # Read-only, so a running rip process is never blocked by us
+    try:
+        with sqlite3.connect(f'file:{path}?mode=ro', uri=True, timeout=5) as con:
+            return {str(row[0]) for row in con.execute(f'SELECT id FROM {table}')}
+    except sqlite3.Error as e:
+        logging.debug(f'Could not read {table} from {path}: {e}')
+        return set()
+
+
+def load_streamrip_history() -> Tuple[Set[str], Set[str]]:
+    """
+    Media IDs from streamrip's own databases (as enabled in its config):
+    (IDs already downloaded, IDs that failed to download).
+    """
+    database = _load_streamrip_config().get('database', {})
+    downloaded, failed = set(), set()
+    if database.get('downloads_enabled', True) and database.get('downloads_path'):
+        downloaded = _read_streamrip_ids(database['downloads_path'], 'downloads')
+    if database.get('failed_downloads_enabled', True) and database.get('failed_downloads_path'):
+        failed = _read_streamrip_ids(database['failed_downloads_path'], 'failed_downloads')
+    return downloaded, failed
+
+
+def classify_links_by_streamrip_history(links: List[str]) -> Tuple[List[str], List[str], List[str]]:
+    """
+    Split links into (already downloaded, known failures, to download) using streamrip's databases.
+    streamrip records track IDs only, so album links are never reported as downloaded.
+    """
+    downloaded_ids, failed_ids = load_streamrip_history()
+    downloaded, failed, remaining = [], [], []
+    for link in links:
+        media_id = _link_media_id(clean_url(link))
+        if media_id and '/track/' in link and media_id in downloaded_ids:
+            downloaded.append(link)
+        elif media_id and media_id in failed_ids:
+            failed.append(link)
+        else:
+            remaining.append(link)
+    return downloaded, failed, remaining
+
+
+def _changed_download_entries(folder: str, since: float) -> List[os.DirEntry]:
+    """Entries directly under the download folder modified after `since` (epoch seconds)."""
+    try:
+        with os.scandir(folder) as entries:
+            return [entry for entry in entries if entry.stat().st_mtime >= since]
+    except OSError as e:
+        logging.warning(f'Could not list download folder {folder}: {e}')
+        return []
+
+
+def get_changed_download_folders(since: float) -> List[str]:
+    """
+    Folders directly under the streamrip download folder modified after `since` (epoch seconds),
+    translated to Plex server paths through PLEX_DOWNLOAD_PATH.
+    """
+    folder = get_streamrip_download_folder()
+    if not folder:
+        return []
+    plex_root = PLEX_DOWNLOAD_PATH or folder
+    separator = '\\' if '\\' in plex_root else '/'
+    changed = []
+    for entry in _changed_download_entries(folder, since):
+        if entry.is_dir(follow_symlinks=False):
+            changed.append(plex_root.rstrip('/\\') + separator + entry.name)
+        elif plex_root not in changed:
+            # Loose files written straight into the download folder
+            changed.append(plex_root)
+    return changed
+
+
+def read_audio_tags(path: str) -> Optional[Dict]:
+    """Title/artist/album/year tags of an audio file, or None if it has no usable tags."""
+    try:
+        audio = mutagen.File(path, easy=True)
+    except Exception as e:
+        logging.debug(f'Could not read tags of {path}: {e}')
+        return None
+    if audio is None or not audio.tags:
+        return None
+
+    def first(key: str) -> str:
+        values = audio.tags.get(key) or ['']
+        return str(values[0]).strip()
+
+    title, artist = first('title'), first('artist') or first('albumartist')
+    if not title or not artist:
+        return None
+    year = first('date')[:4]
+    return {'title': title, 'artist': artist, 'album': first('album'), 'year': int(year) if year.isdigit() else None}
+
+
+def index_downloaded_files(since: float) -> int:
+    """
+    Read the tags of the audio files streamrip wrote after `since` and add them to the library
+    index as provisional rows, so the tracks stop counting as missing before Plex has scanned them.
+    Returns the number of files read.
+    """
+    folder = get_streamrip_download_folder()
+    if not folder:
+        return 0
+    paths = []
+    for entry in _changed_download_entries(folder, since):
+        if entry.is_dir(follow_symlinks=False):
+            for root, _, files in os.walk(entry.path):
+                paths.extend(os.path.join(root, name) for name in files)
+        else:
+            paths.append(entry.path)
+    tags = []
+    for path in paths:
+        if not path.lower().endswith(AUDIO_EXTENSIONS):
+            continue
+        try:
+            if os.path.getmtime(path) < since:
+                continue
+        except OSError:
+            continue
+        track_tags = read_audio_tags(path)
+        if track_tags:
+            tags.append(track_tags)
+    if tags:
+        inserted, marked = add_provisional_index_entries(tags)
+        logging.info(f'Indexed {inserted} downloaded files provisionally; {marked} missing tracks marked downloaded')
+    return len(tags)
 
 
 def clean_url(url: str) -> str:
@@ -41,17 +207,142 @@ def clean_url(url: str) -> str:
     return cleaned
 
 
-def download_with_streamrip(link: str) -> None:
+# A line mentioning a link's media ID and one of these words marks that link as failed
+_FAILURE_PATTERN = re.compile(r"error|failed|unable to|could not|not available|not streamable", re.IGNORECASE)
+# ...unless it only says the item was already downloaded
+_ALREADY_DOWNLOADED_PATTERN = re.compile(r"already downloaded|marked as downloaded", re.IGNORECASE)
+_MEDIA_ID_PATTERN = re.compile(r"/(?:track|album|playlist|artist|label)/([A-Za-z0-9]+)")
+
+
+def _link_media_id(link: str) -> Optional[str]:
+    match = _MEDIA_ID_PATTERN.search(link)
+    return match.group(1) if match else None
+
+
+def _parse_streamrip_outcomes(links: List[str], output: str, returncode: Optional[int],
+                              downloaded_ids: Set[str] = frozenset()) -> Dict[str, bool]:
     """
-    Invoke streamrip to download a single URL with timeout and cleanup.
+    Decide for each link of a batch whether it was downloaded. rip exits non-zero for the whole
+    batch when any item fails, so the exit code only decides links without evidence of their own:
+    a track streamrip recorded in its downloads database succeeded, a link whose media ID appears
+    on a failure line failed, and the rest (albums, or the database disabled) follow the exit code.
     """
-    if not link:
-        logging.info('No link provided for download.')
-        return
-    cleaned_link = clean_url(link)
-    if not cleaned_link:
-        logging.error('Cleaned URL is empty, aborting download.')
-        return
+    ids = {link: _link_media_id(link) for link in links}
+    # Whole IDs only, so track 123 is not failed by a line about track 1234567 or a timestamp
+    id_patterns = {link: re.compile(rf"(?<![A-Za-z0-9]){re.escape(media_id)}(?![A-Za-z0-9])")
+                   for link, media_id in ids.items() if media_id}
+    failed = set()
+    for line in output.splitlines():
+        if not _FAILURE_PATTERN.search(line) or _ALREADY_DOWNLOADED_PATTERN.search(line):
+            continue
+        for link, pattern in id_patterns.items():
+            if pattern.search(line):
+                failed.add(link)
+    outcomes = {}
+    for link, media_id in ids.items():
+        if media_id and '/track/' in link and media_id in downloaded_ids:
+            outcomes[link] = True
+        else:
+            outcomes[link] = returncode == 0 and link not in failed
+    return outcomes
+
+
+# Per-track progress markers in streamrip's output
+_PERCENT_PATTERN = re.compile(r"(\d{1,3}(?:\.\d+)?)\s*%")
+_TRACK_DONE_PATTERN = re.compile(r"\b(?:downloaded|completed|finished)\b", re.IGNORECASE)
+
+
+class DownloadCancelled(Exception):
+    """Raised when a streamrip run is stopped through its cancel event."""
+
+
+def _run_streamrip(command: List[str], on_progress: Optional[Callable[[Dict], None]] = None,
+                   cancel_event: Optional[threading.Event] = None) -> Tuple[Optional[int], List[str]]:
+    """
+    Run streamrip with Popen, reading its output line by line as it is produced.
+    Progress is reported through on_progress; the process is stopped when cancel_event
+    is set or when it prints nothing for STREAMRIP_INACTIVITY_TIMEOUT seconds.
+    Returns (returncode, failure lines); returncode is None if the run was stopped.
+    Only lines that look like failures are kept, so memory does not grow with the output.
+    """
+    process = subprocess.Popen(command, stdout=subprocess.PIPE, stderr=subprocess.STDOUT,
+                               text=True, encoding='utf-8', errors='replace', bufsize=1)
+    lines: queue.Queue = queue.Queue()
+
+    def pump():
+        # Text mode splits on '\r' too, so progress bar redraws arrive as separate lines
+        for line in process.stdout:
+            lines.put(line)
+        lines.put(None)
+
+    threading.Thread(target=pump, name='streamrip-output', daemon=True).start()
+    progress = {'percent': None, 'tracks_done': 0, 'last_line': '', 'lines': 0}
+    failure_lines: List[str] = []
+    last_output = time.monotonic()
+    stop_reason = None
+    while True:
+        if cancel_event is not None and cancel_event.is_set():
+            stop_reason = 'cancelled'
+            break
+        if time.monotonic() - last_output > STREAMRIP_INACTIVITY_TIMEOUT:
+            stop_reason = 'inactive'
+            break
+        try:
+            line = lines.get(timeout=1)
+        except queue.Empty:
+            continue
+        if line is None:
+            break
+        line = line.strip()
+        if not line:
+            continue
+        last_output = time.monotonic()
+        logging.debug(f'streamrip: {line}')
+        if _FAILURE_PATTERN.search(line):
+            failure_lines.append(line)
+        percent = _PERCENT_PATTERN.search(line)
+        if percent:
+            progress['percent'] = min(100.0, float(percent.group(1)))
+        if _TRACK_DONE_PATTERN.search(line) and not _FAILURE_PATTERN.search(line):
+            progress['tracks_done'] += 1
+        progress['last_line'] = line[:200]
+        progress['lines'] += 1
+        if on_progress:
+            on_progress(dict(progress))
+
+    if stop_reason is None:
+        return process.wait(), failure_lines
+    process.terminate()
+    try:
+        process.wait(timeout=10)
+    except subprocess.TimeoutExpired:
+        process.kill()
+        process.wait()
+    if stop_reason == 'cancelled':
+        raise DownloadCancelled('Download cancelled')
+    logging.error(f'Streamrip printed nothing for {STREAMRIP_INACTIVITY_TIMEOUT}s; process stopped')
+    return None, failure_lines
+
+
+def download_links_with_streamrip(links: List[str], on_progress: Optional[Callable[[Dict], None]] = None,
+                                  cancel_event: Optional[threading.Event] = None) -> Dict[str, bool]:
+    """
+    Download a batch of URLs with a single streamrip invocation, so streamrip's own
+    concurrency/max_connections settings apply and login happens once.
+    Returns a mapping of each (original) link to whether it was downloaded.
+    Raises DownloadCancelled if cancel_event is set while streamrip is running.
+    """
+    cleaned = {}
+    for link in links:
+        cleaned_link = clean_url(link)
+        if cleaned_link:
+            cleaned[cleaned_link] = link
+        else:
+            logging.error(f"Cleaned URL is empty for '{link}', skipping.")
+    outcomes = {link: False for link in links}
+    if not cleaned:
+        logging.info('No links provided for download.')
+        return outcomes
 
     # Ensure temporary directory exists
     try:
@@ -62,31 +353,35 @@ def download_with_streamrip(link: str) -> None:
     else:
         temp_dir_local = TEMP_DIR
 
-    links_file = os.path.join(temp_dir_local, f'temp_links_{int(time.time())}.txt')
+    links_file = os.path.join(temp_dir_local, f'temp_links_{int(time.time() * 1000)}_{os.getpid()}_{threading.get_ident()}.txt')
     try:
         with open(links_file, 'w', encoding='utf-8') as f:
-            f.write(cleaned_link + '\n')
+            f.write('\n'.join(cleaned) + '\n')
 
-        logging.info(f'Starting streamrip download for: {cleaned_link}')
+        logging.info(f'Starting streamrip batch download for {len(cleaned)} links')
+        started = time.time()
         command = ['rip', '--config-path', STREAMRIP_CONFIG, 'file', links_file]
-        result = subprocess.run(
-            command,
-            capture_output=True,
-            text=True,
-            check=True,
-            timeout=1800
-        )
-        logging.info(f'Download completed: {cleaned_link}')
-        if result.stdout:
-            logging.debug(f'Streamrip stdout:\n{result.stdout}')
-        if result.stderr:
-            logging.warning(f'Streamrip stderr:\n{result.stderr}')
-    except subprocess.CalledProcessError as e:
-        logging.error(f'Streamrip failed for {cleaned_link}: {e}')
-        if e.stdout:
-            logging.error(f'Stdout:\n{e.stdout}')
-        if e.stderr:
-            logging.error(f'Stderr:\n{e.stderr}')
+        returncode, failure_lines = _run_streamrip(command, on_progress, cancel_event)
+        if failure_lines:
+            logging.warning('Streamrip reported errors:\n' + '\n'.join(failure_lines[-50:]))
+        if returncode is None:
+            logging.error('Streamrip was stopped; only links it recorded as downloaded count as done')
+        elif returncode != 0:
+            logging.error(f'Streamrip exited with code {returncode}')
+
+        parsed = _parse_streamrip_outcomes(list(cleaned), '\n'.join(failure_lines), returncode,
+                                           load_streamrip_history()[0])
+        for cleaned_link, ok in parsed.items():
+            outcomes[cleaned[cleaned_link]] = ok
+        succeeded = sum(parsed.values())
+        logging.info(f'Streamrip batch finished: {succeeded}/{len(parsed)} links downloaded')
+        try:
+            index_downloaded_files(started)
+        except Exception as e:
+            logging.warning(f'Could not index downloaded files provisionally: {e}')
+    except DownloadCancelled:
+        logging.info(f'Streamrip batch of {len(cleaned)} links cancelled')
+        raise
     except Exception as e:
         logging.error(f'Unexpected error during streamrip download: {e}')
     finally:
@@ -95,53 +390,249 @@ def download_with_streamrip(link: str) -> None:
                 os.remove(links_file)
             except Exception as e:
                 logging.warning(f'Failed to remove temp file {links_file}: {e}')
+    return outcomes
 
 
-def find_and_download_track(track_info: Dict) -> None:
+def download_with_streamrip(link: str) -> bool:
     """
-    Find and download a track by querying services in the configured order.
-    Supports 'spotify', 'tidal', 'deezer'.
+    Invoke streamrip to download a single URL. Returns True on success.
     """
-    title = track_info.get('title', '')
-    artist = track_info.get('artist', '')
-    if not title or not artist:
-        logging.error('Track info missing title or artist.')
+    if not link:
+        logging.info('No link provided for download.')
+        return False
+    return download_links_with_streamrip([link]).get(link, False)
+
+
+def download_single_track_with_streamrip(link: str, on_progress: Optional[Callable[[Dict], None]] = None,
+                                         cancel_event: Optional[threading.Event] = None) -> None:
+    """
+    Download a single URL, raising if streamrip did not download it
+    (DownloadCancelled if it was cancelled).
+    """
+    if not link:
+        raise ValueError('No link provided for download.')
+    if classify_links_by_streamrip_history([link])[0]:
+        logging.info(f'{link} is already in the streamrip downloads database, not downloading again')
         return
+    if not download_links_with_streamrip([link], on_progress, cancel_event).get(link, False):
+        raise RuntimeError(f'Streamrip failed to download {link}')
+
+
+def _spotify_lookup(title: str, artist: str) -> Optional[str]:
+    results = spotify_client.search(q=f'track:{title} artist:{artist}', type='track', limit=1)
+    items = results.get('tracks', {}).get('items', [])
+    return items[0]['external_urls']['spotify'] if items else None
+
+
+def _spotify_album_lookup(album: str, artist: str) -> Optional[str]:
+    results = spotify_client.search(q=f'album:{album} artist:{artist}', type='album', limit=1)
+    items = results.get('albums', {}).get('items', [])
+    return items[0]['external_urls']['spotify'] if items else None
+
+
+def _tidal_lookup(title: str, artist: str) -> Optional[str]:
+    # Cheap: the finder reuses the process-wide authenticated Tidal session
+    return TidalLinkFinder(TIDAL_USERNAME, TIDAL_PASSWORD).find_track_link({'title': title, 'artist': artist})
+
+
+def _tidal_album_lookup(album: str, artist: str) -> Optional[str]:
+    return TidalLinkFinder(TIDAL_USERNAME, TIDAL_PASSWORD).find_album_link({'album': album, 'artist': artist})
+
+
+def _deezer_lookup(title: str, artist: str) -> Optional[str]:
+    return DeezerLinkFinder.find_track_link({'title': title, 'artist': artist})
+
+
+def _deezer_album_lookup(album: str, artist: str) -> Optional[str]:
+    return DeezerLinkFinder.find_album_link({'album': album, 'artist': artist})
 
-    link: Optional[str] = None
+
+_LOOKUPS = {
+    'track': {'spotify': _spotify_lookup, 'tidal': _tidal_lookup, 'deezer': _deezer_lookup},
+    'album': {'spotify': _spotify_album_lookup, 'tidal': _tidal_album_lookup, 'deezer': _deezer_album_lookup},
+}
+
+
+def _configured_lookups(kind: str = 'track') -> List[Tuple[str, Callable[[str, str], Optional[str]]]]:
+    """(service, lookup) pairs for the usable services, in DOWNLOAD_ORDER priority."""
+    lookups = []
     for service in download_order:
-        service = service.lower()
         if service == 'spotify' and spotify_client:
-            try:
-                results = spotify_client.search(q=f'track:{title} artist:{artist}', type='track', limit=1)
-                items = results.get('tracks', {}).get('items', [])
-                if items:
-                    link = items[0]['external_urls']['spotify']
-                    logging.info(f'Found Spotify link for {title} - {artist}')
-                    break
-            except Exception as e:
-                logging.warning(f'Spotify lookup failed for {title} - {artist}: {e}')
-
+            lookups.append((service, _LOOKUPS[kind][service]))
         elif service == 'tidal' and TIDAL_USERNAME and TIDAL_PASSWORD:
-            try:
-                tidal_finder = TidalLinkFinder(TIDAL_USERNAME, TIDAL_PASSWORD)
-                link = tidal_finder.find_track_link({'title': title, 'artist': artist})
-                if link:
-                    logging.info(f'Found Tidal link for {title} - {artist}')
+            lookups.append((service, _LOOKUPS[kind][service]))
+        elif service == 'deezer':
+            lookups.append((service, _LOOKUPS[kind][service]))
+        else:
+            logging.debug(f'Service {service} is not configured or unsupported.')
+    return lookups
+
+
+_lookup_executor = ThreadPoolExecutor(max_workers=LINK_LOOKUP_WORKERS, thread_name_prefix='link-lookup')
+
+
+def _resolve_link(kind: str, name: str, artist: str) -> Tuple[Optional[str], Optional[str], bool]:
+    """
+    Query all configured services concurrently and return (link, service, conclusive).
+    The highest-priority answer wins as soon as every service ranked above it has
+    missed, so a hit from the first service returns without waiting for the rest.
+    A service whose lookup raised or ran longer than LINK_LOOKUP_TIMEOUT (counted from
+    when it started, not from when it was queued in the shared pool) counts as a miss,
+    but makes a "not found" answer inconclusive. Lookups still queued are cancelled;
+    ones already in flight are left to finish in the background and their answers are ignored.
+    """
+    lookups = _configured_lookups(kind)
+    if not lookups:
+        return None, None, True
+    started: Dict[int, float] = {}
+
+    def run(rank: int, lookup: Callable[[str, str], Optional[str]]) -> Optional[str]:
+        started[rank] = time.monotonic()
+        # Once we stop waiting the lookup must not keep a pool thread busy retrying its requests
+        with request_deadline(LINK_LOOKUP_TIMEOUT):
+            return lookup(name, artist)
+
+    futures = {_lookup_executor.submit(run, rank, lookup): rank for rank, (_, lookup) in enumerate(lookups)}
+    answers: Dict[int, Optional[str]] = {}
+    failed = set()
+    pending = set(futures)
+    try:
+        while True:
+            # Walk the ranking: stop at the first service that is still running or has a link
+            for rank, (service, _) in enumerate(lookups):
+                if rank not in answers:
                     break
-            except Exception as e:
-                logging.warning(f'Tidal lookup failed for {title} - {artist}: {e}')
+                if answers[rank]:
+                    logging.info(f'Found {service.capitalize()} {kind} link for {name} - {artist}')
+                    return answers[rank], service, True
+            else:
+                return None, None, not failed
+            now = time.monotonic()
+            for future in [f for f in pending if futures[f] in started and now - started[futures[f]] >= LINK_LOOKUP_TIMEOUT]:
+                rank = futures[future]
+                logging.warning(f'{lookups[rank][0].capitalize()} {kind} lookup for {name} - {artist} '
+                                f'timed out after {LINK_LOOKUP_TIMEOUT}s')
+                answers[rank] = None
+                failed.add(rank)
+                pending.discard(future)
+            if not pending:
+                continue
+            # Wake up at the first deadline of a running lookup (or re-check queued ones after a full timeout)
+            timeout = min([started[futures[f]] + LINK_LOOKUP_TIMEOUT - now for f in pending if futures[f] in started],
+                          default=LINK_LOOKUP_TIMEOUT)
+            done, pending = wait(pending, timeout=max(timeout, 0), return_when=FIRST_COMPLETED)
+            for future in done:
+                rank = futures[future]
+                try:
+                    answers[rank] = future.result()
+                except Exception as e:
+                    # A Tidal login cooldown was already logged once by the session pool
+                    log = logging.debug if isinstance(e, TidalUnavailable) else logging.warning
+                    log(f'{lookups[rank][0].capitalize()} {kind} lookup failed for {name} - {artist}: {e}')
+                    answers[rank] = None
+                    failed.add(rank)
+    finally:
+        for future in pending:
+            future.cancel()
+
+
+def resolve_track_link(title: str, artist: str) -> Tuple[Optional[str], Optional[str]]:
+    return _resolve_link('track', title, artist)[:2]
+
+
+def resolve_album_link(album: str, artist: str) -> Tuple[Optional[str], Optional[str]]:
+    return _resolve_link('album', album, artist)[:2]
+
+
+def _find_link_cached(kind: str, name: str, artist: str) -> Optional[str]:
+    cached = get_cached_link(name, artist, LINK_CACHE_HIT_TTL_DAYS, LINK_CACHE_MISS_TTL_DAYS, kind=kind)
+    if cached is not None:
+        logging.debug(f"Link cache {'hit' if cached['link'] else 'negative hit'} for {kind} {name} - {artist}")
+        return cached['link']
+    link, service, conclusive = _resolve_link(kind, name, artist)
+    # A miss is only cached when every service answered "not found"; errors and timeouts are retried next time
+    if link or conclusive:
+        save_link_lookup(name, artist, link, service, kind=kind)
+    return link
+
+
+def find_track_link_cached(title: str, artist: str) -> Optional[str]:
+    """
+    Track link lookup backed by the link_cache table. The services are only queried
+    for tracks never looked up before or whose cached hit/miss has expired.
+    """
+    return _find_link_cached('track', title, artist)
+
+
+def find_album_link_cached(album: str, artist: str) -> Optional[str]:
+    """Album link lookup backed by the link_cache table."""
+    return _find_link_cached('album', album, artist)
 
-        elif service == 'deezer':
-            deezer_link = DeezerLinkFinder.find_track_link({'title': title, 'artist': artist})
-            if deezer_link:
-                link = deezer_link
-                logging.info(f'Found Deezer link for {title} - {artist}')
-                break
 
+def plan_download_jobs(missing_tracks: List[tuple], workers: int = 3,
+                       on_planned: Optional[Callable[[Optional[str], List[tuple]], None]] = None) -> Dict[str, List[int]]:
+    """
+    Turn missing_tracks rows (id, title, artist, album, ...) into download jobs: link -> covered row IDs.
+    Tracks are grouped by (artist, album); a group with at least ALBUM_DOWNLOAD_MIN_TRACKS distinct
+    missing titles is downloaded as one album, every other track through its own track-level link.
+    on_planned(link, rows) is called as each lookup settles (link None when nothing was found).
+    """
+    groups: Dict[Tuple[str, str], List[tuple]] = {}
+    for row in missing_tracks:
+        album = (row[3] or '').strip()
+        groups.setdefault(((row[2] or '').strip().lower(), album.lower()), []).append(row)
+
+    album_groups: List[List[tuple]] = []
+    single_rows: List[tuple] = []
+    for (_, album), rows in groups.items():
+        if album and len({(r[1] or '').strip().lower() for r in rows}) >= ALBUM_DOWNLOAD_MIN_TRACKS:
+            album_groups.append(rows)
         else:
-            logging.debug(f'Service {service} is not configured or unsupported.')
+            single_rows.extend(rows)
+
+    planned: Dict[str, List[int]] = {}
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        album_futures = {executor.submit(find_album_link_cached, rows[0][3], rows[0][2]): rows for rows in album_groups}
+        for future in as_completed(album_futures):
+            rows = album_futures[future]
+            link = future.result()
+            if link:
+                logging.info(f"Album link for '{rows[0][3]}' by '{rows[0][2]}' covers {len(rows)} missing tracks: {link}")
+                planned.setdefault(link, []).extend(r[0] for r in rows)
+                if on_planned:
+                    on_planned(link, rows)
+            else:
+                single_rows.extend(rows)
+
+        # The same song can be missing from several playlists: look it up once
+        by_track: Dict[Tuple[str, str], List[tuple]] = {}
+        for row in single_rows:
+            by_track.setdefault(((row[1] or '').strip().lower(), (row[2] or '').strip().lower()), []).append(row)
+        track_futures = {executor.submit(find_track_link_cached, rows[0][1], rows[0][2]): rows for rows in by_track.values()}
+        for future in as_completed(track_futures):
+            rows = track_futures[future]
+            link = future.result()
+            if link:
+                logging.info(f"Link found for '{rows[0][1]}' by '{rows[0][2]}': {link}")
+                planned.setdefault(link, []).extend(r[0] for r in rows)
+            if on_planned:
+                on_planned(link, rows)
+    return planned
+
+
+def find_and_download_track(track_info: Dict) -> None:
+    """
+    Find a track on the configured services (queried concurrently, DOWNLOAD_ORDER
+    decides which answer wins) and download it.
+    """
+    title = track_info.get('title', '')
+    artist = track_info.get('artist', '')
+    if not title or not artist:
+        logging.error('Track info missing title or artist.')
+        return
 
+    link = find_track_link_cached(title, artist)
     if not link:
         logging.error(f'No streaming link found for {title} - {artist}')
         return
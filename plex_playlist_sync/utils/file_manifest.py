@@ -0,0 +1,191 @@
+"""
+Persistent manifest of the music folder, used to check whether a track exists on disk
+without walking the tree.
+
+Every directory is stored with its mtime. A refresh stats the known directories and
+only lists the ones whose mtime changed (a file was added, removed or renamed in them),
+so after the first build it costs one stat per directory. Files are stored with
+normalised keys taken from their tags and from their path, indexed for lookups.
+"""
+
+import os
+import re
+import logging
+import threading
+import time
+from typing import Dict, List, Optional, Tuple
+
+import mutagen
+
+from .database import get_db, _clean_string
+
+logger = logging.getLogger(__name__)
+
+MUSIC_FOLDER_PATH = os.getenv("MUSIC_FOLDER_PATH", "/music")
+# A lookup refreshes the manifest first when the last refresh is older than this
+MANIFEST_REFRESH_SECONDS = int(os.getenv("FILESYSTEM_MANIFEST_REFRESH_SECONDS", "600"))
+# A refresh commits its changes every this many rescanned or removed directories
+MANIFEST_COMMIT_DIRS = 50
+AUDIO_EXTENSIONS = ('.flac', '.mp3', '.m4a', '.mp4', '.ogg', '.opus', '.aiff', '.wav', '.wma', '.alac')
+
+# "01. Title", "01 - Title", "1-01 Title"
+_TRACK_NUMBER_PREFIX = re.compile(r"^\s*(?:\d+[-.])?\d+\s*[-._)]?\s+")
+
+_refresh_lock = threading.Lock()
+_last_refresh: Dict[str, float] = {}
+
+
+def _file_keys(path: str) -> Tuple[str, str, str, str]:
+    """(title_key, artist_key) from the tags, (name_key, dir_key) from the file and folder names."""
+    stem = os.path.splitext(os.path.basename(path))[0]
+    name_key = _clean_string(_TRACK_NUMBER_PREFIX.sub('', stem))
+    dir_key = _clean_string(os.path.basename(os.path.dirname(path)))
+    title_key = artist_key = ''
+    try:
+        audio = mutagen.File(path, easy=True)
+        if audio is not None and audio.tags:
+            title_key = _clean_string(str((audio.tags.get('title') or [''])[0]))
+            artist_key = _clean_string(str((audio.tags.get('artist') or audio.tags.get('albumartist') or [''])[0]))
+    except Exception as e:
+        logger.debug(f"Could not read tags of {path}: {e}")
+    return title_key, artist_key, name_key, dir_key
+
+
+def _list_directory(path: str) -> Optional[Tuple[List[str], Dict[str, float]]]:
+    """(subdirectories, audio file -> mtime) of one directory, or None if it cannot be listed."""
+    subdirs, files = [], {}
+    try:
+        with os.scandir(path) as entries:
+            for entry in entries:
+                try:
+                    if entry.is_dir(follow_symlinks=False):
+                        subdirs.append(entry.path)
+                    elif entry.name.lower().endswith(AUDIO_EXTENSIONS):
+                        files[entry.path] = entry.stat().st_mtime
+                except OSError:
+                    continue
+    except OSError as e:
+        logger.warning(f"Could not list {path}: {e}")
+        return None
+    return subdirs, files
+
+
+def _scan_directory(path: str, mtime: float, known_subdirs: List[str]) -> Tuple[List[str], Optional[tuple]]:
+    """
+    Re-list one directory and read the tags of its new or modified files, outside any transaction.
+    Returns its subdirectories and the manifest update to write (see _write_directory).
+    """
+    listing = _list_directory(path)
+    if listing is None:
+        return [], None
+    subdirs, files = listing
+    with get_db() as con:
+        known = {r[0]: r[1] for r in con.cursor().execute("SELECT path, mtime FROM fs_manifest_files WHERE dir=?", (path,))}
+    removed = [(p,) for p in known if p not in files]
+    changed = [(p, path, *_file_keys(p), m) for p, m in files.items() if known.get(p) != m]
+    gone = [d for d in known_subdirs if d not in set(subdirs)]
+    return subdirs, (path, mtime, removed, changed, subdirs, gone)
+
+
+def _write_directory(cur, path: str, mtime: float, removed: List[tuple], changed: List[tuple],
+                     subdirs: List[str], gone: List[str]):
+    if removed:
+        cur.executemany("DELETE FROM fs_manifest_files WHERE path=?", removed)
+    if changed:
+        cur.executemany("INSERT OR REPLACE INTO fs_manifest_files (path, dir, title_key, artist_key, name_key, dir_key, mtime)\
+            VALUES (?,?,?,?,?,?,?)", changed)
+    for subdir in gone:
+        _forget_tree(cur, subdir)
+    # Subdirectories not scanned yet get an impossible mtime, so a refresh interrupted before them still lists them
+    cur.executemany("INSERT OR IGNORE INTO fs_manifest_dirs (path, parent, mtime) VALUES (?,?,-1)",
+                    [(subdir, path) for subdir in subdirs])
+    cur.execute("INSERT OR REPLACE INTO fs_manifest_dirs (path, parent, mtime) VALUES (?,?,?)",
+                (path, os.path.dirname(path), mtime))
+
+
+def _forget_tree(cur, path: str):
+    like = path.rstrip(os.sep) + os.sep + '%'
+    cur.execute("DELETE FROM fs_manifest_files WHERE dir=? OR dir LIKE ?", (path, like))
+    cur.execute("DELETE FROM fs_manifest_dirs WHERE path=? OR path LIKE ?", (path, like))
+
+
+def _write_updates(updates: List[tuple]):
+    """Write the pending directory updates (or ('forget', path) removals) in one short transaction."""
+    if not updates:
+        return
+    with get_db() as con:
+        cur = con.cursor()
+        for update in updates:
+            if update[0] == 'forget':
+                _forget_tree(cur, update[1])
+            else:
+                _write_directory(cur, *update)
+    updates.clear()
+
+
+def refresh_manifest(root: str = MUSIC_FOLDER_PATH) -> Dict[str, int]:
+    """
+    Bring the manifest of `root` up to date. Directories whose mtime is unchanged are not
+    listed again; their known subdirectories are still visited. Tags are read outside any
+    transaction and the changes committed every MANIFEST_COMMIT_DIRS directories, so other
+    writers are not held up by a long walk. Returns refresh statistics.
+    """
+    start = time.time()
+    stats = {'dirs_checked': 0, 'dirs_rescanned': 0}
+    with _refresh_lock:
+        with get_db() as con:
+            known = {r[0]: (r[1], r[2]) for r in con.cursor().execute("SELECT path, parent, mtime FROM fs_manifest_dirs")}
+        children: Dict[str, List[str]] = {}
+        for path, (parent, _) in known.items():
+            children.setdefault(parent, []).append(path)
+
+        updates: List[tuple] = []
+        stack = [root]
+        while stack:
+            path = stack.pop()
+            stats['dirs_checked'] += 1
+            try:
+                mtime = os.stat(path).st_mtime
+            except OSError:
+                if path in known:
+                    updates.append(('forget', path))
+            else:
+                if path in known and known[path][1] == mtime:
+                    stack.extend(children.get(path, []))
+                else:
+                    stats['dirs_rescanned'] += 1
+                    subdirs, update = _scan_directory(path, mtime, children.get(path, []))
+                    if update:
+                        updates.append(update)
+                    stack.extend(subdirs)
+            if len(updates) >= MANIFEST_COMMIT_DIRS:
+                _write_updates(updates)
+        _write_updates(updates)
+        _last_refresh[root] = time.time()
+    stats['files'] = get_manifest_file_count()
+    logger.info(f"Filesystem manifest of {root} refreshed in {time.time() - start:.2f}s: {stats}")
+    return stats
+
+
+def get_manifest_file_count() -> int:
+    with get_db() as con:
+        return con.cursor().execute("SELECT COUNT(*) FROM fs_manifest_files").fetchone()[0]
+
+
+def find_track_file(title: str, artist: str, root: str = MUSIC_FOLDER_PATH) -> Optional[str]:
+    """
+    Path of a file of the given track, matched by its tags or by its file and folder names
+    ("Artist - Album/01. Title.flac"), or None. Refreshes the manifest when it is stale.
+    """
+    if time.time() - _last_refresh.get(root, 0) > MANIFEST_REFRESH_SECONDS:
+        refresh_manifest(root)
+    tc, ac = _clean_string(title or ''), _clean_string(artist or '')
+    if not tc:
+        return None
+    with get_db() as con:
+        cur = con.cursor()
+        r = cur.execute("SELECT path FROM fs_manifest_files WHERE title_key=? AND artist_key=? LIMIT 1", (tc, ac)).fetchone()
+        if r is None and ac:
+            r = cur.execute("SELECT path FROM fs_manifest_files WHERE name_key=? AND dir_key LIKE ? LIMIT 1",
+                            (tc, f"%{ac}%")).fetchone()
+        return r[0] if r else None
@@ -7,6 +7,7 @@ class Track:
     artist: str
     album: str
     url: str
+    isrc: str = ""
 
 
 @dataclass
@@ -15,6 +16,7 @@ class Playlist:
     name: str
     description: str
     poster: str
+    snapshot_id: str = ""
 
 
 @dataclass
@@ -0,0 +1,283 @@
+"""
+Shared outbound HTTP layer used by every API client in utils/.
+
+Each remote host gets a token bucket (requests per second + burst) and a cap
+on concurrent requests. Responses with 429/5xx status codes, timeouts and connection
+errors are retried with jittered exponential backoff, honouring Retry-After. Requests
+that are not idempotent (POST, PATCH) are only retried when they were not sent: on a
+failed connection or a 429.
+Deezer, Spotify (spotipy), Tidal (tidalapi) and Plex (plexapi) all accept a
+requests.Session, so they are handed a RateLimitedSession from this module.
+"""
+
+import os
+import random
+import logging
+import threading
+import time
+from contextlib import contextmanager
+from email.utils import parsedate_to_datetime
+from typing import Dict, Optional, Tuple
+from urllib.parse import urlparse
+
+import requests
+from urllib3.exceptions import NewConnectionError
+
+from .http_fixtures import get_active_adapter
+
+logger = logging.getLogger(__name__)
+
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+# Methods that can be sent again after a timeout or 5xx without repeating a side effect
+IDEMPOTENT_METHODS = {"GET", "HEAD", "OPTIONS", "PUT", "DELETE"}
+MAX_RETRIES = int(os.getenv("HTTP_MAX_RETRIES", "5"))
+BACKOFF_BASE = float(os.getenv("HTTP_BACKOFF_BASE", "1.0"))
+BACKOFF_MAX = float(os.getenv("HTTP_BACKOFF_MAX", "60"))
+DEFAULT_TIMEOUT = float(os.getenv("HTTP_DEFAULT_TIMEOUT", "30"))
+
+# host suffix -> (requests per second, burst size, max concurrent requests)
+DEFAULT_HOST_LIMITS: Dict[str, Tuple[float, int, int]] = {
+    "api.deezer.com": (9.0, 10, 4),       # Deezer allows 50 requests every 5 seconds
+    "api.spotify.com": (5.0, 10, 4),
+    "accounts.spotify.com": (2.0, 4, 2),
+    "tidal.com": (4.0, 8, 3),
+    "tidalhifi.com": (4.0, 8, 3),
+}
+# Anything not listed above, e.g. the local Plex server
+FALLBACK_HOST_LIMIT: Tuple[float, int, int] = (25.0, 50, 8)
+
+
+def _parse_limits_override(value: str) -> Dict[str, Tuple[float, int, int]]:
+    """
+    Parse HTTP_RATE_LIMITS, e.g. "api.deezer.com=10:10:4,192.168.1.10=50:50:16"
+    (rate per second : burst : max concurrency).
+    """
+    limits = {}
+    for entry in filter(None, (e.strip() for e in value.split(","))):
+        try:
+            host, spec = entry.split("=", 1)
+            rate, burst, concurrency = spec.split(":")
+            limits[host.strip().lower()] = (float(rate), int(burst), int(concurrency))
+        except ValueError:
+            logger.warning(f"Ignoring invalid HTTP_RATE_LIMITS entry: '{entry}'")
+    return limits
+
+
+HOST_LIMITS = {**DEFAULT_HOST_LIMITS, **_parse_limits_override(os.getenv("HTTP_RATE_LIMITS", ""))}
+
+
+class TokenBucket:
+    """Blocking token bucket; can also be paused as a whole when the host asks us to back off."""
+
+    def __init__(self, rate: float, capacity: int):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = float(capacity)
+        self.updated = time.monotonic()
+        self.paused_until = 0.0
+        self.lock = threading.Lock()
+
+    def acquire(self, deadline: Optional[float] = None):
+        """Take a token, waiting as needed; raises Timeout if the wait would run past `deadline` (monotonic)."""
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if now < self.paused_until:
+                    wait = self.paused_until - now
+                elif self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                else:
+                    wait = (1 - self.tokens) / self.rate
+            if deadline is not None and now + wait > deadline:
+                raise requests.exceptions.Timeout("request deadline exceeded while rate limited")
+            time.sleep(wait)
+
+    def pause(self, seconds: float):
+        with self.lock:
+            self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+
+
+class HostLimiter:
+    """Token bucket plus concurrency cap for a single remote host."""
+
+    def __init__(self, host: str, rate: float, burst: int, max_concurrency: int):
+        self.host = host
+        self.bucket = TokenBucket(rate, burst)
+        self.semaphore = threading.BoundedSemaphore(max_concurrency)
+
+    def __enter__(self):
+        deadline = getattr(_deadline, "at", None)
+        if not self.semaphore.acquire(timeout=None if deadline is None else max(0.0, deadline - time.monotonic())):
+            raise requests.exceptions.Timeout(f"{self.host}: request deadline exceeded waiting for a connection slot")
+        try:
+            self.bucket.acquire(deadline)
+        except BaseException:
+            self.semaphore.release()
+            raise
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.semaphore.release()
+        return False
+
+
+_limiters: Dict[str, HostLimiter] = {}
+_limiters_lock = threading.Lock()
+
+
+def get_host_limiter(url: str) -> HostLimiter:
+    host = (urlparse(url).hostname or "").lower()
+    with _limiters_lock:
+        limiter = _limiters.get(host)
+        if limiter is None:
+            rate, burst, concurrency = FALLBACK_HOST_LIMIT
+            for suffix, limits in HOST_LIMITS.items():
+                if host == suffix or host.endswith("." + suffix):
+                    rate, burst, concurrency = limits
+                    break
+            limiter = HostLimiter(host, rate, burst, concurrency)
+            _limiters[host] = limiter
+            logger.debug(f"HTTP limiter for {host}: {rate}/s, burst {burst}, concurrency {concurrency}")
+        return limiter
+
+
+def pause_host(url: str, seconds: float):
+    """Stop every request to the host of `url` for the given number of seconds."""
+    get_host_limiter(url).bucket.pause(seconds)
+
+
+_deadline = threading.local()
+
+
+@contextmanager
+def request_deadline(seconds: float):
+    """
+    Within this block, requests made by the current thread get a single attempt whose timeout is
+    capped to what is left of `seconds`, and fail with Timeout once the time is up. Used by work
+    that is abandoned after a fixed time (link lookups), so it never outlives its caller by retrying.
+    """
+    previous = getattr(_deadline, "at", None)
+    at = time.monotonic() + seconds
+    _deadline.at = at if previous is None else min(previous, at)
+    try:
+        yield
+    finally:
+        _deadline.at = previous
+
+
+def in_request_deadline() -> bool:
+    """True inside request_deadline(), where callers should not retry either."""
+    return getattr(_deadline, "at", None) is not None
+
+
+def _cap_timeout(timeout, remaining: float):
+    if isinstance(timeout, tuple):
+        return tuple(remaining if t is None else min(t, remaining) for t in timeout)
+    return remaining if timeout is None else min(timeout, remaining)
+
+
+def backoff_delay(attempt: int) -> float:
+    """Full-jitter exponential backoff for the given (0-based) attempt."""
+    return random.uniform(0, min(BACKOFF_MAX, BACKOFF_BASE * (2 ** attempt)))
+
+
+def _retry_after_seconds(response: requests.Response) -> Optional[float]:
+    value = response.headers.get("Retry-After")
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+def _is_connect_error(error: requests.exceptions.RequestException) -> bool:
+    """True if the request never reached the server (connection refused, DNS failure, connect timeout)."""
+    if isinstance(error, requests.exceptions.ConnectTimeout):
+        return True
+    reason = getattr(error.args[0], "reason", None) if error.args else None
+    return isinstance(error, requests.exceptions.ConnectionError) and isinstance(reason, NewConnectionError)
+
+
+class RateLimitedSession(requests.Session):
+    """
+    requests.Session that routes every request through the per-host limiter
+    and retries throttled or failed requests with backoff.
+    """
+
+    def __init__(self, max_retries: int = MAX_RETRIES):
+        super().__init__()
+        self.max_retries = max_retries
+
+    def get_adapter(self, url):
+        # Record/replay mode (see http_fixtures) intercepts the transport for every session
+        fixture_adapter = get_active_adapter()
+        if fixture_adapter is not None:
+            return fixture_adapter
+        return super().get_adapter(url)
+
+    def request(self, method, url, *args, **kwargs):
+        kwargs.setdefault("timeout", DEFAULT_TIMEOUT)
+        limiter = get_host_limiter(url)
+        idempotent = method.upper() in IDEMPOTENT_METHODS
+        max_retries = self.max_retries
+        deadline = getattr(_deadline, "at", None)
+        if deadline is not None:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                raise requests.exceptions.Timeout(f"{method} {limiter.host}: request deadline exceeded")
+            kwargs["timeout"] = _cap_timeout(kwargs["timeout"], remaining)
+            max_retries = 0
+        attempt = 0
+        while True:
+            try:
+                with limiter:
+                    response = super().request(method, url, *args, **kwargs)
+            except (requests.exceptions.ConnectionError, requests.exceptions.Timeout) as e:
+                if attempt >= max_retries or not (idempotent or _is_connect_error(e)):
+                    raise
+                delay = backoff_delay(attempt)
+                logger.warning(f"{method} {limiter.host} failed ({e.__class__.__name__}); retry {attempt + 1}/{max_retries} in {delay:.1f}s")
+            else:
+                retryable = response.status_code == 429 or (idempotent and response.status_code in RETRY_STATUSES)
+                if not retryable or attempt >= max_retries:
+                    return response
+                retry_after = _retry_after_seconds(response)
+                delay = retry_after if retry_after is not None else backoff_delay(attempt)
+                delay = min(delay, BACKOFF_MAX)
+                if response.status_code == 429:
+                    # Everyone talking to this host has to slow down, not just this thread
+                    limiter.bucket.pause(delay)
+                logger.warning(f"{method} {limiter.host} returned {response.status_code}; retry {attempt + 1}/{max_retries} in {delay:.1f}s")
+                response.close()
+            attempt += 1
+            time.sleep(delay)
+
+
+def create_session() -> RateLimitedSession:
+    """New rate-limited session for clients that keep their own headers or cookies (Plex, Spotify, Tidal)."""
+    return RateLimitedSession()
+
+
+_shared_session: Optional[RateLimitedSession] = None
+_shared_session_lock = threading.Lock()
+
+
+def get_http_session() -> RateLimitedSession:
+    """Process-wide rate-limited session for stateless API calls (e.g. the Deezer public API)."""
+    global _shared_session
+    with _shared_session_lock:
+        if _shared_session is None:
+            _shared_session = create_session()
+        return _shared_session
+
+
+def http_get(url: str, **kwargs) -> requests.Response:
+    return get_http_session().get(url, **kwargs)
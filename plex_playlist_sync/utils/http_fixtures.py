@@ -0,0 +1,235 @@
+"""
+Record/replay of outbound HTTP exchanges for offline benchmarking.
+
+In "record" mode every request made through a RateLimitedSession is sent for
+real and the exchange is appended to a gzip-compressed JSON-lines archive.
+In "replay" mode requests are answered from the archive, in recorded order
+for repeated requests, with optional artificial latency. The mode is set with
+HTTP_FIXTURE_MODE / HTTP_FIXTURE_PATH or programmatically with fixture_mode().
+
+Credentials (OAuth tokens, Plex tokens, passwords) are redacted from recorded
+URLs and bodies, and from the request keys, so archives can be shared and
+replayed with other credentials.
+"""
+
+import os
+import base64
+import gzip
+import hashlib
+import json
+import logging
+import re
+import threading
+import time
+from collections import defaultdict, deque
+from contextlib import contextmanager
+from typing import Dict, Optional
+
+import requests
+from requests.adapters import BaseAdapter, HTTPAdapter
+from requests.structures import CaseInsensitiveDict
+
+logger = logging.getLogger(__name__)
+
+# Headers that change on every run and carry no information for replay
+_VOLATILE_HEADERS = {"date", "set-cookie", "x-request-id", "age", "expires"}
+
+
+# Fields whose values are credentials, in query strings, form/JSON bodies and XML attributes
+_SECRET_FIELDS = ("access_token", "refresh_token", "id_token", "client_secret", "password",
+                  "X-Plex-Token", "authToken", "authenticationToken", "sessionId")
+_SECRET_NAMES = "|".join(re.escape(name) for name in _SECRET_FIELDS)
+_SECRET_PATTERNS = (
+    # query strings and form bodies: name=value
+    re.compile(rf"(?i)((?:^|[?&;])(?:{_SECRET_NAMES})=)[^&;#\s]*"),
+    # JSON: "name": "value"
+    re.compile(rf'(?i)("(?:{_SECRET_NAMES})"\s*:\s*")(?:[^"\\]|\\.)*(")'),
+    # XML attributes: name="value"
+    re.compile(rf'(?i)(\b(?:{_SECRET_NAMES})=")[^"]*(")'),
+)
+REDACTED = "REDACTED"
+
+
+class FixtureMissError(requests.exceptions.RequestException):
+    """Raised in replay mode when a request has no recorded response."""
+
+
+def redact(text: str) -> str:
+    """Replace credential values in a URL or text body with a placeholder."""
+    for pattern in _SECRET_PATTERNS:
+        text = pattern.sub(lambda m: m.group(1) + REDACTED + (m.group(2) if m.lastindex > 1 else ""), text)
+    return text
+
+
+def _redact_bytes(content: bytes) -> bytes:
+    try:
+        text = content.decode("utf-8")
+    except UnicodeDecodeError:
+        return content  # binary payloads (artwork, audio) carry no credentials
+    return redact(text).encode("utf-8")
+
+
+def request_key(method: str, url: str, body) -> str:
+    if isinstance(body, str):
+        body = body.encode("utf-8")
+    url = redact(url)
+    if body:
+        body = _redact_bytes(body)
+    digest = hashlib.sha1()
+    digest.update(method.upper().encode("utf-8"))
+    digest.update(b" ")
+    digest.update(url.encode("utf-8"))
+    if body:
+        digest.update(b"\n")
+        digest.update(body)
+    return digest.hexdigest()
+
+
+class RecordingAdapter(BaseAdapter):
+    """Sends requests for real and appends each exchange to the archive."""
+
+    def __init__(self, path: str):
+        super().__init__()
+        self.path = path
+        self.transport = HTTPAdapter()
+        self.lock = threading.Lock()
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self.archive = gzip.open(path, "at", encoding="utf-8")
+        self.recorded = 0
+        logger.info(f"Recording HTTP exchanges to {path}")
+
+    def send(self, request, **kwargs):
+        start = time.perf_counter()
+        response = self.transport.send(request, **kwargs)
+        content = response.content  # reads streamed bodies too, so they can be archived
+        elapsed = time.perf_counter() - start
+        record = {
+            "key": request_key(request.method, request.url, request.body),
+            "method": request.method,
+            "url": redact(request.url),
+            "status": response.status_code,
+            "reason": response.reason,
+            "headers": {k: v for k, v in response.headers.items() if k.lower() not in _VOLATILE_HEADERS},
+            "body": base64.b64encode(_redact_bytes(content)).decode("ascii"),
+            "elapsed": round(elapsed, 4),
+        }
+        with self.lock:
+            self.archive.write(json.dumps(record, separators=(",", ":")) + "\n")
+            self.recorded += 1
+        return response
+
+    def close(self):
+        with self.lock:
+            if not self.archive.closed:
+                self.archive.close()
+                logger.info(f"Recorded {self.recorded} HTTP exchanges to {self.path}")
+        self.transport.close()
+
+
+class ReplayAdapter(BaseAdapter):
+    """Answers requests from a recorded archive, deterministically."""
+
+    def __init__(self, path: str, latency_ms: float = 0.0, latency_scale: float = 0.0):
+        super().__init__()
+        self.path = path
+        self.latency_ms = latency_ms
+        self.latency_scale = latency_scale
+        self.lock = threading.Lock()
+        self.responses: Dict[str, deque] = defaultdict(deque)
+        self.misses = 0
+        count = 0
+        with gzip.open(path, "rt", encoding="utf-8") as archive:
+            for line in archive:
+                if line.strip():
+                    record = json.loads(line)
+                    self.responses[record["key"]].append(record)
+                    count += 1
+        logger.info(f"Replaying {count} HTTP exchanges from {path} (latency {latency_ms}ms + {latency_scale}x recorded)")
+
+    def send(self, request, **kwargs):
+        key = request_key(request.method, request.url, request.body)
+        with self.lock:
+            recorded = self.responses.get(key)
+            if not recorded:
+                self.misses += 1
+                record = None
+            elif len(recorded) > 1:
+                record = recorded.popleft()
+            else:
+                # Keep serving the last recorded answer for repeated requests
+                record = recorded[0]
+        if record is None:
+            raise FixtureMissError(f"No recorded response for {request.method} {request.url}", request=request)
+
+        delay = self.latency_ms / 1000.0 + self.latency_scale * record.get("elapsed", 0.0)
+        if delay > 0:
+            time.sleep(delay)
+
+        response = requests.Response()
+        response.status_code = record["status"]
+        response.reason = record.get("reason", "")
+        response.headers = CaseInsensitiveDict(record.get("headers", {}))
+        response.headers.pop("Content-Encoding", None)  # body is stored decoded
+        response._content = base64.b64decode(record["body"])
+        response.encoding = requests.utils.get_encoding_from_headers(response.headers)
+        response.url = request.url
+        response.request = request
+        response.connection = self
+        return response
+
+    def close(self):
+        if self.misses:
+            logger.warning(f"HTTP replay: {self.misses} requests had no recorded response")
+
+
+_active_adapter: Optional[BaseAdapter] = None
+_active_lock = threading.Lock()
+
+
+def get_active_adapter() -> Optional[BaseAdapter]:
+    return _active_adapter
+
+
+def start_fixture_mode(mode: str, path: str, latency_ms: float = 0.0, latency_scale: float = 0.0) -> BaseAdapter:
+    """Activate record or replay for every RateLimitedSession in the process."""
+    global _active_adapter
+    with _active_lock:
+        if _active_adapter is not None:
+            _active_adapter.close()
+        if mode == "record":
+            _active_adapter = RecordingAdapter(path)
+        elif mode == "replay":
+            _active_adapter = ReplayAdapter(path, latency_ms, latency_scale)
+        else:
+            raise ValueError(f"Unknown HTTP fixture mode: '{mode}' (expected 'record' or 'replay')")
+        return _active_adapter
+
+
+def stop_fixture_mode():
+    global _active_adapter
+    with _active_lock:
+        if _active_adapter is not None:
+            _active_adapter.close()
+            _active_adapter = None
+
+
+@contextmanager
+def fixture_mode(mode: str, path: str, latency_ms: float = 0.0, latency_scale: float = 0.0):
+    adapter = start_fixture_mode(mode, path, latency_ms, latency_scale)
+    try:
+        yield adapter
+    finally:
+        stop_fixture_mode()
+
+
+def start_fixture_mode_from_env():
+    mode = os.getenv("HTTP_FIXTURE_MODE", "").strip().lower()
+    if not mode:
+        return None
+    path = os.getenv("HTTP_FIXTURE_PATH", "state_data/http_fixtures.jsonl.gz")
+    return start_fixture_mode(
+        mode,
+        path,
+        latency_ms=float(os.getenv("HTTP_REPLAY_LATENCY_MS", "0")),
+        latency_scale=float(os.getenv("HTTP_REPLAY_LATENCY_SCALE", "0")),
+    )
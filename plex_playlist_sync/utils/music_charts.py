@@ -6,13 +6,15 @@ from typing import List, Dict, Optional
 from datetime import datetime, timedelta
 import time
 
+from .http_client import create_session
+
 logger = logging.getLogger(__name__)
 
 class MusicChartsSearcher:
     """Classe per ricercare classifiche musicali online e fornire dati aggiornati a Gemini."""
     
     def __init__(self):
-        self.session = requests.Session()
+        self.session = create_session()
         self.session.headers.update({
             'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'
         })
@@ -0,0 +1,124 @@
+"""
+Local mirror of each user's Plex playlists (ratingKey, title, type, addedAt, updatedAt,
+leafCount and item ratingKeys) in the plex_playlists table.
+
+A refresh costs one playlists() request per user; items are only fetched again for
+playlists whose updatedAt or leafCount changed. Lookups by title, item diffs and
+cleanup planning are then local queries. The items last seen by the new-item check
+(on_changed) are kept apart, so a refresh without the check never advances them.
+"""
+
+import os
+import hashlib
+import logging
+import concurrent.futures
+from typing import Callable, Dict, List, Optional
+
+from .database import get_plex_playlists, save_plex_playlist, save_plex_playlist_metadata, delete_plex_playlists
+
+logger = logging.getLogger(__name__)
+
+# Items per Plex request, and concurrent requests shared by all changed playlists
+PLAYLIST_SCAN_PAGE_SIZE = int(os.getenv("PLAYLIST_SCAN_PAGE_SIZE", "500"))
+PLAYLIST_SCAN_WORKERS = int(os.getenv("PLAYLIST_SCAN_WORKERS", "4"))
+
+
+def _epoch(value) -> Optional[int]:
+    return int(value.timestamp()) if value else None
+
+
+def _items_hash(item_keys: List[int]) -> str:
+    return hashlib.sha1(",".join(str(k) for k in item_keys).encode()).hexdigest()
+
+
+def _fetch_playlist_page(playlist, start: int) -> list:
+    # Playlist.key is the playlist itself (plexapi strips '/items'); its tracks live under '/items'
+    return playlist.fetchItems(f"{playlist.key}/items", container_start=start, container_size=PLAYLIST_SCAN_PAGE_SIZE)
+
+
+def _fetch_playlists_items(playlists: list):
+    """
+    Yield (playlist, items) for each playlist as soon as all its items are loaded. Items are fetched
+    in pages of PLAYLIST_SCAN_PAGE_SIZE, and the pages of all playlists share one pool of
+    PLAYLIST_SCAN_WORKERS threads. Playlists with a page that failed to load are logged and skipped.
+    """
+    pages: Dict[int, Dict[int, list]] = {}
+    remaining: Dict[int, int] = {}
+    failed = set()
+    with concurrent.futures.ThreadPoolExecutor(max_workers=PLAYLIST_SCAN_WORKERS) as executor:
+        futures = {}
+        for playlist in playlists:
+            starts = range(0, max(playlist.leafCount or 0, 1), PLAYLIST_SCAN_PAGE_SIZE)
+            pages[playlist.ratingKey], remaining[playlist.ratingKey] = {}, len(starts)
+            for start in starts:
+                futures[executor.submit(_fetch_playlist_page, playlist, start)] = (playlist, start)
+        for future in concurrent.futures.as_completed(futures):
+            playlist, start = futures[future]
+            try:
+                pages[playlist.ratingKey][start] = future.result()
+            except Exception as e:
+                if playlist.ratingKey not in failed:
+                    logger.warning(f"Error loading items of playlist {playlist.title} (from {start}): {e}")
+                failed.add(playlist.ratingKey)
+            remaining[playlist.ratingKey] -= 1
+            if remaining[playlist.ratingKey] == 0:
+                playlist_pages = pages.pop(playlist.ratingKey)
+                if playlist.ratingKey not in failed:
+                    yield playlist, [item for page_start in sorted(playlist_pages) for item in playlist_pages[page_start]]
+
+
+def _save(user: str, playlist, item_keys: Optional[List[int]], checked: bool = False):
+    playlist_type, added_at = getattr(playlist, 'playlistType', None), _epoch(getattr(playlist, 'addedAt', None))
+    if item_keys is None:
+        save_plex_playlist_metadata(user, playlist.ratingKey, playlist.title, playlist_type, added_at)
+    else:
+        save_plex_playlist(user, playlist.ratingKey, playlist.title, playlist_type, added_at, _epoch(playlist.updatedAt),
+                           playlist.leafCount, item_keys, _items_hash(item_keys), checked)
+
+
+def sync_playlist_mirror(plex, user: str,
+                         on_changed: Optional[Callable[[object, list, list], None]] = None,
+                         include: Optional[Callable[[object], bool]] = None) -> Dict[int, Dict]:
+    """
+    Bring the mirror of `user`'s playlists up to date and return it (ratingKey -> row).
+
+    Items are loaded only for playlists accepted by `include` that are new, whose updatedAt/leafCount
+    changed, or (with on_changed) whose current items were never checked; the others only get their
+    title, type and addedAt refreshed. For each loaded playlist on_changed(playlist, items, new_items)
+    is called before its row is saved, with new_items the items not seen by the previous check; if it
+    raises, the row is left as it was so the next refresh retries the playlist. Refreshes without
+    on_changed keep the checked items as they were. Playlists deleted on Plex are dropped from the mirror.
+    """
+    playlists = plex.playlists()
+    known = get_plex_playlists(user)
+    gone = set(known) - {p.ratingKey for p in playlists}
+    if gone:
+        delete_plex_playlists(user, list(gone))
+
+    to_load = []
+    for playlist in playlists:
+        state = known.get(playlist.ratingKey)
+        if include and not include(playlist):
+            _save(user, playlist, None)
+            continue
+        unchanged = (state and state['items_hash'] is not None
+                     and state['updated_at'] == _epoch(playlist.updatedAt)
+                     and state['leaf_count'] == playlist.leafCount
+                     and (not on_changed or state['checked_items_hash'] == state['items_hash']))
+        if not unchanged:
+            to_load.append(playlist)
+    logger.info(f"Playlist mirror of user {user}: {len(playlists)} playlists, {len(to_load)} to load, "
+                f"{len(gone)} removed")
+
+    for playlist, items in _fetch_playlists_items(to_load):
+        state = known.get(playlist.ratingKey)
+        item_keys = [item.ratingKey for item in items]
+        if on_changed:
+            seen = set(state['checked_item_keys']) if state else set()
+            try:
+                on_changed(playlist, items, [item for item in items if item.ratingKey not in seen])
+            except Exception as e:
+                logger.warning(f"Error processing playlist {playlist.title}: {e}")
+                continue
+        _save(user, playlist, item_keys, checked=bool(on_changed))
+    return get_plex_playlists(user)
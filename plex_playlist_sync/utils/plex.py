@@ -1,6 +1,8 @@
 import logging
 import re
-from typing import List
+import time
+from datetime import datetime
+from typing import List, Optional
 
 from plexapi.exceptions import NotFound
 from plexapi.server import PlexServer
@@ -9,6 +11,63 @@ from thefuzz import fuzz
 
 from .helperClasses import Playlist, Track, UserInputs
 from .database import add_missing_track, check_track_in_index
+from .http_client import create_session
+
+
+def connect_plex(plex_url: str, plex_token: str, timeout: Optional[int] = None) -> PlexServer:
+    """Connette a Plex usando la sessione HTTP condivisa con rate limiting e retry."""
+    return PlexServer(plex_url, plex_token, session=create_session(), timeout=timeout)
+
+def request_partial_scan(plex: PlexServer, section, paths: List[str], max_paths: int = 50) -> None:
+    """
+    Chiede a Plex di scansionare solo le cartelle indicate (percorsi visti dal server Plex).
+    Con troppe cartelle, o nessuna, scansiona l'intera sezione.
+    """
+    if not paths or len(paths) > max_paths:
+        logging.info(f"Scansione completa della sezione '{section.title}' ({len(paths)} cartelle modificate)")
+        section.update()
+        return
+    for path in paths:
+        logging.info(f"Scansione parziale di '{section.title}': {path}")
+        section.update(path=path)
+
+
+def _section_refreshing(plex: PlexServer, section_key) -> bool:
+    return any(s.refreshing for s in plex.library.sections() if str(s.key) == str(section_key))
+
+
+def wait_for_new_tracks(plex: PlexServer, section, since: datetime, expected: int, max_wait: int) -> int:
+    """
+    Attende che Plex importi le tracce aggiunte dopo `since`, interrogando con backoff solo
+    le ultime tracce aggiunte. Termina appena la scansione è finita e sono comparse almeno
+    `expected` tracce, oppure quando il conteggio resta stabile a scansione ferma.
+    Restituisce il numero di nuove tracce trovate.
+    """
+    deadline = time.monotonic() + max_wait
+    delay, last_count, stable_polls, count = 2.0, -1, 0, 0
+    while True:
+        time.sleep(min(delay, max(0.0, deadline - time.monotonic())))
+        try:
+            recent = section.search(libtype='track', sort='addedAt:desc', limit=expected + 100)
+            count = sum(1 for t in recent if t.addedAt and t.addedAt >= since)
+            refreshing = _section_refreshing(plex, section.key)
+        except Exception as e:
+            logging.warning(f"Errore durante il controllo delle nuove tracce su Plex: {e}")
+            refreshing = True
+        logging.info(f"Plex: {count}/{expected} nuove tracce, scansione {'in corso' if refreshing else 'ferma'}")
+        if not refreshing:
+            if count >= expected:
+                return count
+            stable_polls = stable_polls + 1 if count == last_count else 0
+            if stable_polls >= 2:
+                logging.info(f"Plex non sta importando altro: {count} nuove tracce su {expected} attese")
+                return count
+        last_count = count
+        if time.monotonic() >= deadline:
+            logging.warning(f"Timeout di {max_wait}s in attesa di Plex: {count} nuove tracce su {expected} attese")
+            return count
+        delay = min(delay * 2, 30.0)
+
 
 def _clean_string_for_search(text: str) -> str:
     """Funzione di pulizia standard per la ricerca, rimuove caratteri speciali e parentesi."""
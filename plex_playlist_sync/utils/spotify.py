@@ -1,12 +1,31 @@
 import logging
+from dataclasses import asdict
 from typing import List
 import os
 
 import spotipy
+from spotipy.oauth2 import SpotifyClientCredentials
 from plexapi.server import PlexServer
 
 from .helperClasses import Playlist, Track, UserInputs
 from .plex import update_or_create_plex_playlist
+from .database import get_cached_source_playlist, save_source_playlist_cache
+from .http_client import create_session
+
+# Only the attributes used to build a Track are requested from the playlist items endpoint
+SP_TRACK_FIELDS = "items(track(name,artists(name),album(name),external_urls(spotify),external_ids(isrc))),next"
+
+
+def create_spotify_client(client_id: str, client_secret: str) -> spotipy.Spotify:
+    """
+    Build a client-credentials Spotify client whose API and token requests go through
+    the shared rate-limited session. Spotipy's own retry adapter is not mounted when
+    a session is passed in, so throttling and retries are handled in one place.
+    """
+    auth_manager = SpotifyClientCredentials(
+        client_id=client_id, client_secret=client_secret, requests_session=create_session()
+    )
+    return spotipy.Spotify(auth_manager=auth_manager, requests_session=create_session())
 
 
 def _get_sp_user_playlists(
@@ -19,23 +38,26 @@ def _get_sp_user_playlists(
 
     try:
         sp_playlists = sp.user_playlists(user_id)
-        # Aggiunto 'enumerate' per poter contare le playlist
-        for i, playlist in enumerate(sp_playlists["items"]):
-            # Se il limite è impostato e lo abbiamo raggiunto, esce dal ciclo
-            if limit > 0 and i >= limit:
-                logging.warning(f"MODALITÀ TEST: Limite di {limit} playlist raggiunto per Spotify. Interrompo.")
-                break
-
-            playlists.append(
-                Playlist(
-                    id=playlist["uri"],
-                    name=playlist["name"] + suffix,
-                    description=playlist.get("description", ""),
-                    poster=""
-                    if len(playlist["images"]) == 0
-                    else playlist["images"][0].get("url", ""),
+        # Scorre tutte le pagine, non solo la prima
+        while sp_playlists:
+            for playlist in sp_playlists["items"]:
+                # Se il limite è impostato e lo abbiamo raggiunto, esce dal ciclo
+                if limit > 0 and len(playlists) >= limit:
+                    logging.warning(f"MODALITÀ TEST: Limite di {limit} playlist raggiunto per Spotify. Interrompo.")
+                    return playlists
+
+                playlists.append(
+                    Playlist(
+                        id=playlist["uri"],
+                        name=playlist["name"] + suffix,
+                        description=playlist.get("description", ""),
+                        poster=""
+                        if not playlist.get("images")
+                        else playlist["images"][0].get("url", ""),
+                        snapshot_id=playlist.get("snapshot_id", ""),
+                    )
                 )
-            )
+            sp_playlists = sp.next(sp_playlists) if sp_playlists.get("next") else None
     except Exception as e:
         logging.error(f"Spotify User ID Error: {e}")
     return playlists
@@ -48,12 +70,16 @@ def _get_sp_tracks_from_playlist(
 
     def extract_sp_track_metadata(track) -> Track:
         title = track["track"]["name"]
-        artist = track["track"]["artists"][0]["name"]
-        album = track["track"]["album"]["name"]
-        url = track["track"]["external_urls"].get("spotify", "")
-        return Track(title, artist, album, url)
+        artists = track["track"].get("artists") or [{}]
+        artist = artists[0].get("name", "")
+        album = (track["track"].get("album") or {}).get("name", "")
+        url = (track["track"].get("external_urls") or {}).get("spotify", "")
+        isrc = (track["track"].get("external_ids") or {}).get("isrc", "")
+        return Track(title, artist, album, url, isrc)
 
-    sp_playlist_tracks = sp.user_playlist_tracks(user_id, playlist.id)
+    sp_playlist_tracks = sp.playlist_items(
+        playlist.id, fields=SP_TRACK_FIELDS, additional_types=("track",)
+    )
 
     tracks = list(
         map(
@@ -75,6 +101,21 @@ def _get_sp_tracks_from_playlist(
     return tracks
 
 
+def _get_sp_tracks_cached(
+    sp: spotipy.Spotify, user_id: str, playlist: Playlist
+) -> List[Track]:
+    """Return playlist tracks, refetching them only when the snapshot_id has changed."""
+    cached = get_cached_source_playlist("spotify", playlist.id)
+    if playlist.snapshot_id and cached and cached["snapshot"] == playlist.snapshot_id:
+        logging.info(f"Spotify playlist '{playlist.name}' unchanged (snapshot {playlist.snapshot_id}); using cached tracklist.")
+        return [Track(**t) for t in cached["tracks"]]
+
+    tracks = _get_sp_tracks_from_playlist(sp, user_id, playlist)
+    if playlist.snapshot_id:
+        save_source_playlist_cache("spotify", playlist.id, playlist.snapshot_id, [asdict(t) for t in tracks])
+    return tracks
+
+
 def spotify_playlist_sync(
     sp: spotipy.Spotify, plex: PlexServer, userInputs: UserInputs
 ) -> None:
@@ -88,7 +129,7 @@ def spotify_playlist_sync(
     )
     if playlists:
         for playlist in playlists:
-            tracks = _get_sp_tracks_from_playlist(
+            tracks = _get_sp_tracks_cached(
                 sp, userInputs.spotify_user_id, playlist
             )
             update_or_create_plex_playlist(plex, playlist, tracks, userInputs)
@@ -1,20 +1,195 @@
+import os
+import json
 import logging
-from typing import List, Dict
+import threading
+import time
+from datetime import datetime
+from typing import List, Dict, Optional
 import tidalapi
 import unicodedata
 
-class TidalLinkFinder:
+from .http_client import create_session
+
+# Tokens are persisted next to the other state files so restarts don't force a new login
+TIDAL_STATE_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(__file__))), "state_data")
+TIDAL_SESSION_FILE = os.path.join(TIDAL_STATE_DIR, "tidal_session.json")
+# Lifetime of a username/password session before it is re-validated with a fresh login
+TIDAL_SESSION_TTL = int(os.getenv("TIDAL_SESSION_TTL", "43200"))
+# Refresh OAuth tokens this many seconds before they expire
+TIDAL_REFRESH_MARGIN = 300
+# After a failed login, Tidal lookups fail fast for this long instead of logging in again each time
+TIDAL_LOGIN_RETRY_SECONDS = int(os.getenv("TIDAL_LOGIN_RETRY_SECONDS", "900"))
+
+
+class TidalUnavailable(RuntimeError):
+    """Raised instead of a new login attempt while a failed Tidal login is cooling down."""
+
+
+class TidalSessionPool:
+    """
+    Process-wide authenticated Tidal session shared by all lookups.
+    The session tokens are saved to state_data and reloaded on start; expired
+    tokens are refreshed (OAuth) or replaced with a new login (session id).
+    """
+
     def __init__(self, username: str, password: str):
-        """
-        Initialize a Tidal session for track/album lookup.
-        """
-        self.session = tidalapi.Session()
+        self.username = username
+        self.password = password
+        self.lock = threading.Lock()
+        self.session: Optional[tidalapi.Session] = None
+        self.expires_at = 0.0
+        self.login_retry_at = 0.0
+
+    def _new_session(self) -> tidalapi.Session:
+        session = tidalapi.Session()
+        # Route every Tidal API call through the shared rate limiter
+        session.request_session = create_session()
+        return session
+
+    def _load_saved(self) -> bool:
+        if not os.path.exists(TIDAL_SESSION_FILE):
+            return False
+        try:
+            with open(TIDAL_SESSION_FILE, 'r', encoding='utf-8') as f:
+                saved = json.load(f)
+        except (json.JSONDecodeError, IOError) as e:
+            logging.warning(f"Unable to read saved Tidal session {TIDAL_SESSION_FILE}: {e}")
+            return False
+        if saved.get('username') != self.username:
+            return False
+
+        session = self._new_session()
+        try:
+            if saved.get('access_token'):
+                expiry = datetime.fromisoformat(saved['expiry_time']) if saved.get('expiry_time') else None
+                session.load_oauth_session(saved.get('token_type', 'Bearer'), saved['access_token'],
+                                           saved.get('refresh_token'), expiry)
+            elif saved.get('session_id'):
+                session.load_session(saved['session_id'], saved.get('country_code'), saved.get('user_id'))
+            else:
+                return False
+        except Exception as e:
+            logging.warning(f"Saved Tidal session could not be loaded: {e}")
+            return False
+
+        self.session = session
+        self.expires_at = saved.get('expires_at', 0.0)
+        if time.time() >= self.expires_at - TIDAL_REFRESH_MARGIN and not self._refresh():
+            return False
+        if not self.session.check_login():
+            logging.info("Saved Tidal session is no longer valid.")
+            self.session = None
+            return False
+        logging.info("Reusing saved Tidal session.")
+        return True
+
+    def _save(self):
+        session = self.session
+        data = {'username': self.username, 'expires_at': self.expires_at}
+        if getattr(session, 'access_token', None):
+            expiry = getattr(session, 'expiry_time', None)
+            data.update({
+                'token_type': getattr(session, 'token_type', 'Bearer'),
+                'access_token': session.access_token,
+                'refresh_token': getattr(session, 'refresh_token', None),
+                'expiry_time': expiry.isoformat() if expiry else None,
+            })
+        else:
+            user = getattr(session, 'user', None)
+            data.update({
+                'session_id': getattr(session, 'session_id', None),
+                'country_code': getattr(session, 'country_code', None),
+                'user_id': getattr(user, 'id', None),
+            })
+        try:
+            os.makedirs(TIDAL_STATE_DIR, exist_ok=True)
+            with open(TIDAL_SESSION_FILE, 'w', encoding='utf-8') as f:
+                json.dump(data, f, indent=2)
+        except IOError as e:
+            logging.error(f"Unable to save Tidal session {TIDAL_SESSION_FILE}: {e}")
+
+    def _expiry_from_session(self) -> float:
+        expiry = getattr(self.session, 'expiry_time', None)
+        if expiry:
+            return expiry.timestamp()
+        return time.time() + TIDAL_SESSION_TTL
+
+    def _refresh(self) -> bool:
+        """Refresh OAuth tokens in place; session-id logins cannot be refreshed."""
+        refresh_token = getattr(self.session, 'refresh_token', None)
+        if not refresh_token or not hasattr(self.session, 'token_refresh'):
+            self.session = None
+            return False
+        try:
+            self.session.token_refresh(refresh_token)
+        except Exception as e:
+            logging.warning(f"Tidal token refresh failed: {e}")
+            self.session = None
+            return False
+        self.expires_at = self._expiry_from_session()
+        self._save()
+        logging.info("Tidal access token refreshed.")
+        return True
+
+    def _login(self):
+        session = self._new_session()
         try:
-            self.session.login(username, password)
+            session.login(self.username, self.password)
             logging.info("Authenticated to Tidal successfully.")
         except Exception as e:
-            logging.error(f"Failed to authenticate to Tidal: {e}")
+            self.login_retry_at = time.time() + TIDAL_LOGIN_RETRY_SECONDS
+            logging.error(f"Failed to authenticate to Tidal: {e}. Tidal lookups are skipped for {TIDAL_LOGIN_RETRY_SECONDS}s.")
             raise
+        self.login_retry_at = 0.0
+        self.session = session
+        self.expires_at = self._expiry_from_session()
+        self._save()
+
+    def get_session(self) -> tidalapi.Session:
+        """The shared session, logging in if needed. Raises TidalUnavailable while a failed login cools down."""
+        with self.lock:
+            if self.session is not None and time.time() >= self.expires_at - TIDAL_REFRESH_MARGIN:
+                self._refresh()
+            if self.session is None and time.time() < self.login_retry_at:
+                raise TidalUnavailable(f"Tidal login failed; next attempt in {int(self.login_retry_at - time.time())}s")
+            if self.session is None and not self._load_saved():
+                self._login()
+            return self.session
+
+    def invalidate(self):
+        """Drop the current session, e.g. after an authentication error."""
+        with self.lock:
+            self.session = None
+            self.expires_at = 0.0
+
+
+_pools: Dict[str, TidalSessionPool] = {}
+_pools_lock = threading.Lock()
+
+
+def get_tidal_session_pool(username: str, password: str) -> TidalSessionPool:
+    with _pools_lock:
+        pool = _pools.get(username)
+        if pool is None or pool.password != password:
+            pool = TidalSessionPool(username, password)
+            _pools[username] = pool
+        return pool
+
+
+class TidalLinkFinder:
+    def __init__(self, username: str, password: str):
+        """
+        Initialize track/album lookup on the shared, already authenticated Tidal session.
+        """
+        self.pool = get_tidal_session_pool(username, password)
+        self.session = self.pool.get_session()
+
+    def _check_auth_error(self, error: Exception):
+        """Invalidate the shared session when Tidal rejects its credentials."""
+        response = getattr(error, 'response', None)
+        if getattr(response, 'status_code', None) == 401:
+            logging.warning("Tidal session rejected (401); a new session will be created on the next lookup.")
+            self.pool.invalidate()
 
     @staticmethod
     def _clean_string(s: str) -> str:
@@ -28,8 +203,9 @@ class TidalLinkFinder:
 
     def find_album_by_track(self, title: str, artist: str) -> Dict | None:
         """
-        Given a title and artist, search Tidal and return the first matching album.
-        Returns dict with 'album_id' and 'album_name', or None if not found.
+        Given a title and artist, search Tidal and return the first matching track and its album.
+        Returns dict with 'track_id', 'album_id' and 'album_name', or None if not found.
+        Search errors are raised, so callers can tell them from "not found".
         """
         title_c = self._clean_string(title)
         artist_c = self._clean_string(artist)
@@ -40,10 +216,10 @@ class TidalLinkFinder:
                 return None
             track = results.tracks[0]
             album = track.album
-            return {'album_id': album.id, 'album_name': album.name}
+            return {'track_id': track.id, 'album_id': album.id, 'album_name': album.name}
         except Exception as e:
-            logging.warning(f"Tidal search failed for '{title} - {artist}': {e}")
-            return None
+            self._check_auth_error(e)
+            raise
 
     def get_artist_albums(self, artist_name: str) -> List[Dict]:
         """
@@ -70,11 +246,25 @@ class TidalLinkFinder:
         track = self.find_album_by_track(track_info.get('title', ''), track_info.get('artist', ''))
         if not track:
             return None
-        try:
-            # Construct streaming link
-            return f"https://listen.tidal.com/album/{track['album_id']}"
-        except Exception:
+        return f"https://listen.tidal.com/track/{track['track_id']}"
+
+    def find_album_link(self, album_info: Dict) -> str | None:
+        """
+        Find streaming URL for a whole album ({'album', 'artist'}) in Tidal, if available.
+        Returns album URL or None. Search errors are raised.
+        """
+        album_c = self._clean_string(album_info.get('album', ''))
+        artist_c = self._clean_string(album_info.get('artist', ''))
+        if not album_c or not artist_c:
             return None
+        try:
+            results = self.session.search('albums', f"{album_c} {artist_c}")
+            if not results or not results.albums:
+                return None
+            return f"https://listen.tidal.com/album/{results.albums[0].id}"
+        except Exception as e:
+            self._check_auth_error(e)
+            raise
 
     def find_potential_tracks(self, title: str, artist: str) -> List[Dict]:
         """
@@ -96,5 +286,6 @@ class TidalLinkFinder:
             logging.info(f"Found {len(potentials)} potential matches for '{title} - {artist}' on Tidal.")
             return potentials
         except Exception as e:
+            self._check_auth_error(e)
             logging.error(f"Error during manual search for '{title} - {artist}' on Tidal: {e}")
             return []
@@ -0,0 +1,11 @@
+import pytest
+
+from plex_playlist_sync.utils import database
+
+
+@pytest.fixture
+def db(tmp_path, monkeypatch):
+    """A fresh SQLite database for the test."""
+    monkeypatch.setattr(database, "DB_PATH", str(tmp_path / "sync_database.db"))
+    monkeypatch.setattr(database, "_db_pool", None)
+    database.initialize_db()
@@ -0,0 +1,72 @@
+import threading
+
+from plex_playlist_sync.utils import database, download_scheduler
+
+
+def _running_job(link="https://www.deezer.com/track/1"):
+    database.enqueue_download_job(link, "deezer", [])
+    job, = database.claim_download_jobs(limit=1)
+    return job
+
+
+def _state(job_id):
+    with database.get_db() as con:
+        return con.cursor().execute("SELECT state FROM download_jobs WHERE id=?", (job_id,)).fetchone()["state"]
+
+
+def test_outcome_of_a_cancelled_job_is_ignored(db):
+    job = _running_job()
+    assert database.cancel_download_job(job["id"])
+
+    assert database.fail_download_job(job["id"], "boom", 5, 60, 600) == "cancelled"
+    assert database.complete_download_job(job["id"]) is None
+    assert _state(job["id"]) == "cancelled"
+
+
+def test_failed_running_job_is_rescheduled(db):
+    job = _running_job()
+    assert database.fail_download_job(job["id"], "boom", 5, 60, 600) == "pending"
+    assert _state(job["id"]) == "pending"
+
+
+def test_scheduler_rejects_cancel_of_a_job_it_is_not_running(db):
+    scheduler = download_scheduler.DownloadScheduler(download_fn=lambda *args, **kwargs: None)
+    job = _running_job()
+    assert not scheduler.cancel(job["id"])
+    assert _state(job["id"]) == "running"
+
+    job["cancel_event"] = threading.Event()
+    scheduler.active[job["id"]] = job
+    assert scheduler.cancel(job["id"])
+    assert job["cancel_event"].is_set()
+    assert _state(job["id"]) == "cancelled"
+
+
+def test_completed_job_keeps_tracks_resolved_by_hand(db):
+    for title in ("One", "Two"):
+        database.add_missing_track({"title": title, "artist": "Artist", "source_playlist_title": "Mix", "source_playlist_id": 1})
+    job_id = database.enqueue_download_job("https://www.deezer.com/album/1", "deezer", [1, 2])["job_id"]
+    database.claim_download_jobs(limit=1)
+    with database.get_db() as con:
+        con.cursor().execute("UPDATE missing_tracks SET status='resolved_manual' WHERE id=1")
+
+    assert database.complete_download_job(job_id) == 1
+    with database.get_db() as con:
+        statuses = [r[0] for r in con.cursor().execute("SELECT status FROM missing_tracks ORDER BY id")]
+    assert statuses == ["resolved_manual", "downloaded"]
+
+
+def test_queued_batch_is_scored_in_one_refresh(db, monkeypatch):
+    for title in ("One", "Two"):
+        database.add_missing_track({"title": title, "artist": "Artist", "source_playlist_title": "Mix", "source_playlist_id": 1})
+    refreshes = []
+    refresh = database.refresh_download_job_priorities
+    monkeypatch.setattr(download_scheduler, "refresh_download_job_priorities",
+                        lambda *args, **kwargs: refreshes.append(kwargs) or refresh(*args, **kwargs))
+
+    results = download_scheduler.queue_downloads({"https://www.deezer.com/track/1": [1], "https://www.deezer.com/track/2": [2]})
+
+    assert len(refreshes) == 1
+    assert refreshes[0]["job_ids"] == sorted(r["job_id"] for r in results)
+    with database.get_db() as con:
+        assert all(r[0] > 0 for r in con.cursor().execute("SELECT priority FROM download_jobs"))
@@ -0,0 +1,37 @@
+from plex_playlist_sync.utils import file_manifest
+
+
+def _tree(root, paths):
+    for path in paths:
+        (root / path).parent.mkdir(parents=True, exist_ok=True)
+        (root / path).write_bytes(b"")
+
+
+def test_refresh_commits_in_batches_and_tracks_changes(db, tmp_path, monkeypatch):
+    monkeypatch.setattr(file_manifest, "MANIFEST_COMMIT_DIRS", 2)
+    monkeypatch.setattr(file_manifest, "_file_keys", lambda path: ("", "", path.rsplit("/", 1)[-1], ""))
+    writes = []
+    write_updates = file_manifest._write_updates
+    monkeypatch.setattr(file_manifest, "_write_updates", lambda updates: writes.append(len(updates)) or write_updates(updates))
+    root = tmp_path / "music"
+    _tree(root, [f"Artist {i}/Album/0{i}. Song.flac" for i in range(3)])
+
+    stats = file_manifest.refresh_manifest(str(root))
+    assert stats["files"] == 3
+    assert max(writes) <= 2
+
+    _tree(root, ["Artist 3/Album/01. Song.mp3"])
+    assert file_manifest.refresh_manifest(str(root))["files"] == 4
+    assert file_manifest.refresh_manifest(str(root))["dirs_rescanned"] == 0
+
+
+def test_subdirectories_of_an_interrupted_refresh_are_still_scanned(db, tmp_path, monkeypatch):
+    root = tmp_path / "music"
+    _tree(root, ["Artist/Album/01. Song.flac"])
+    monkeypatch.setattr(file_manifest, "_file_keys", lambda path: ("", "", "", ""))
+    # Only the root gets written, as if the process stopped before its subdirectories
+    mtime = root.stat().st_mtime
+    subdirs, update = file_manifest._scan_directory(str(root), mtime, [])
+    file_manifest._write_updates([update])
+
+    assert file_manifest.refresh_manifest(str(root))["files"] == 1
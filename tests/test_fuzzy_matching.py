@@ -0,0 +1,31 @@
+import pytest
+
+from plex_playlist_sync.utils import database
+
+
+@pytest.fixture
+def index(db, monkeypatch):
+    # Stand-in for the thefuzz score, so the tests exercise candidate selection only
+    monkeypatch.setattr(database, "_fuzzy_match", lambda tc, ac, dbt, dba: tc == dbt and ac in dba)
+
+    def add(title, artist):
+        with database.get_db() as con:
+            return con.cursor().execute("INSERT INTO plex_library_index (title_clean, artist_clean, album_clean)\
+                VALUES (?,?,'')", (title, artist)).lastrowid
+    return add
+
+
+def test_incremental_match_finds_what_the_full_match_finds(index):
+    watermark = index("help", "the beatles")
+    index("yesterday", "the beatles")
+    songs = [(1, "Yesterday", "Beatles")]
+
+    assert database.match_missing_songs_fuzzy(songs) == [1]
+    assert database.match_missing_songs_against_new_index(songs, watermark) == [1]
+
+
+def test_incremental_match_ignores_rows_up_to_the_watermark(index):
+    index("yesterday", "the beatles")
+    watermark = index("help", "the beatles")
+
+    assert database.match_missing_songs_against_new_index([(1, "Yesterday", "Beatles")], watermark) == []
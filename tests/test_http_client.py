@@ -0,0 +1,77 @@
+from unittest import mock
+
+import pytest
+import requests
+from urllib3.exceptions import NewConnectionError
+
+from plex_playlist_sync.utils import http_client
+
+
+@pytest.fixture
+def send(monkeypatch):
+    """Make the underlying session answer with the given responses/exceptions, in order."""
+    monkeypatch.setattr(http_client, "backoff_delay", lambda attempt: 0.0)
+    calls, timeouts = [], []
+
+    def configure(*outcomes):
+        outcomes = list(outcomes)
+        calls.clear()
+        timeouts.clear()
+
+        def request(self, method, url, *args, **kwargs):
+            calls.append(method)
+            timeouts.append(kwargs.get("timeout"))
+            outcome = outcomes.pop(0)
+            if isinstance(outcome, Exception):
+                raise outcome
+            return mock.Mock(status_code=outcome, headers={})
+        monkeypatch.setattr(requests.Session, "request", request)
+        return calls, timeouts
+    return configure
+
+
+def test_get_is_retried_on_timeout_and_5xx(send):
+    calls, _ = send(requests.exceptions.ReadTimeout("slow"), 503, 200)
+    assert http_client.RateLimitedSession().request("GET", "http://plex.local/library").status_code == 200
+    assert calls == ["GET"] * 3
+
+
+def test_post_is_not_retried_on_timeout_or_5xx(send):
+    calls, _ = send(requests.exceptions.ReadTimeout("slow"))
+    with pytest.raises(requests.exceptions.ReadTimeout):
+        http_client.RateLimitedSession().request("POST", "http://plex.local/playlists")
+    assert calls == ["POST"]
+
+    calls, _ = send(502)
+    assert http_client.RateLimitedSession().request("POST", "http://plex.local/playlists").status_code == 502
+    assert calls == ["POST"]
+
+
+def test_post_is_retried_when_it_was_not_sent(send):
+    refused = requests.exceptions.ConnectionError(mock.Mock(reason=NewConnectionError(None, "refused")))
+    calls, _ = send(refused, requests.exceptions.ConnectTimeout("connect"), 429, 201)
+    assert http_client.RateLimitedSession().request("POST", "http://plex.local/playlists").status_code == 201
+    assert calls == ["POST"] * 4
+
+
+def test_requests_within_a_deadline_get_one_capped_attempt(send):
+    calls, timeouts = send(requests.exceptions.ReadTimeout("slow"))
+    with http_client.request_deadline(5):
+        with pytest.raises(requests.exceptions.ReadTimeout):
+            http_client.RateLimitedSession().request("GET", "http://plex.local/library")
+    assert calls == ["GET"]
+    assert timeouts[0] <= 5
+
+    calls, _ = send(503)
+    with http_client.request_deadline(5):
+        assert http_client.RateLimitedSession().request("GET", "http://plex.local/library").status_code == 503
+    assert calls == ["GET"]
+
+
+def test_requests_past_the_deadline_are_not_sent(send):
+    calls, _ = send(200)
+    with http_client.request_deadline(0):
+        with pytest.raises(requests.exceptions.Timeout):
+            http_client.RateLimitedSession().request("GET", "http://plex.local/library")
+    assert calls == []
+    assert not http_client.in_request_deadline()
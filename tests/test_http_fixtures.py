@@ -0,0 +1,19 @@
+from plex_playlist_sync.utils.http_fixtures import redact, request_key
+
+
+def test_redact_removes_credentials():
+    assert redact("https://plex:32400/library?X-Plex-Token=abc123&type=1") == \
+        "https://plex:32400/library?X-Plex-Token=REDACTED&type=1"
+    assert redact('{"access_token": "a1", "refresh_token":"r2", "user": "me"}') == \
+        '{"access_token": "REDACTED", "refresh_token":"REDACTED", "user": "me"}'
+    assert redact('<user authToken="xyz" id="1"/>') == '<user authToken="REDACTED" id="1"/>'
+    assert redact("grant_type=refresh_token&refresh_token=qq&client_id=c") == \
+        "grant_type=refresh_token&refresh_token=REDACTED&client_id=c"
+
+
+def test_request_key_ignores_credentials():
+    assert request_key("GET", "https://plex/a?X-Plex-Token=one", None) == \
+        request_key("GET", "https://plex/a?X-Plex-Token=two", None)
+    assert request_key("POST", "https://auth/token", "refresh_token=one") == \
+        request_key("POST", "https://auth/token", b"refresh_token=two")
+    assert request_key("GET", "https://plex/a", None) != request_key("GET", "https://plex/b", None)
@@ -0,0 +1,70 @@
+import threading
+import time
+
+import pytest
+
+from plex_playlist_sync.utils import downloader
+
+
+@pytest.fixture
+def lookups(monkeypatch):
+    """Replace the configured services with the given (service, lookup) pairs."""
+    def configure(*pairs):
+        monkeypatch.setattr(downloader, "_configured_lookups", lambda kind="track": list(pairs))
+    return configure
+
+
+@pytest.fixture
+def cache(monkeypatch):
+    saved = []
+    monkeypatch.setattr(downloader, "get_cached_link", lambda *args, **kwargs: None)
+    monkeypatch.setattr(downloader, "save_link_lookup", lambda *args, **kwargs: saved.append(args))
+    return saved
+
+
+def _miss(title, artist):
+    return None
+
+
+def _error(title, artist):
+    raise ConnectionError("service unreachable")
+
+
+def test_miss_is_cached_when_every_service_answered(lookups, cache):
+    lookups(("tidal", _miss), ("deezer", _miss))
+    assert downloader.find_track_link_cached("Song", "Artist") is None
+    assert cache == [("Song", "Artist", None, None)]
+
+
+def test_miss_is_not_cached_when_a_service_failed(lookups, cache):
+    lookups(("tidal", _error), ("deezer", _miss))
+    assert downloader.find_track_link_cached("Song", "Artist") is None
+    assert cache == []
+
+
+def test_hit_is_cached_even_if_another_service_failed(lookups, cache):
+    lookups(("tidal", _error), ("deezer", lambda title, artist: "https://www.deezer.com/track/1"))
+    assert downloader.find_track_link_cached("Song", "Artist") == "https://www.deezer.com/track/1"
+    assert cache == [("Song", "Artist", "https://www.deezer.com/track/1", "deezer")]
+
+
+def test_timeout_counts_from_when_the_lookup_starts(lookups, monkeypatch):
+    monkeypatch.setattr(downloader, "LINK_LOOKUP_TIMEOUT", 0.3)
+    release = threading.Event()
+    # Keep every lookup thread busy for longer than the timeout before the lookup gets to run
+    busy = [downloader._lookup_executor.submit(release.wait, 5) for _ in range(downloader.LINK_LOOKUP_WORKERS)]
+    threading.Timer(0.5, release.set).start()
+
+    def slow_hit(title, artist):
+        time.sleep(0.1)
+        return "https://listen.tidal.com/track/1"
+
+    lookups(("tidal", slow_hit))
+    assert downloader._resolve_link("track", "Song", "Artist") == ("https://listen.tidal.com/track/1", "tidal", True)
+    assert all(future.result() for future in busy)
+
+
+def test_lookup_running_past_the_timeout_is_inconclusive(lookups, monkeypatch):
+    monkeypatch.setattr(downloader, "LINK_LOOKUP_TIMEOUT", 0.1)
+    lookups(("tidal", lambda title, artist: time.sleep(0.5)))
+    assert downloader._resolve_link("track", "Song", "Artist") == (None, None, False)
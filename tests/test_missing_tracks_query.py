@@ -0,0 +1,18 @@
+from plex_playlist_sync.utils import database
+
+
+def _add(title, artist="Artist"):
+    database.add_missing_track({"title": title, "artist": artist, "source_playlist_title": "Mix", "source_playlist_id": 1})
+
+
+def test_text_filter_matches_wildcards_literally(db):
+    for title in ("100% Pure", "1000 Pure", "a_b", "axb", "back\\slash"):
+        _add(title)
+
+    def titles(text):
+        return sorted(t["title"] for t in database.query_missing_tracks(text=text)[0])
+
+    assert titles("100%") == ["100% Pure"]
+    assert titles("a_b") == ["a_b"]
+    assert titles("k\\s") == ["back\\slash"]
+    assert sorted(r["title"] for r in database.get_missing_tracks_matching(text="_")) == ["a_b"]
@@ -0,0 +1,82 @@
+from datetime import datetime
+from unittest import mock
+
+from plex_playlist_sync.utils import playlist_mirror
+
+
+def _playlist(rating_key, leaf_count):
+    playlist = mock.Mock(ratingKey=rating_key, leafCount=leaf_count, key=f"/playlists/{rating_key}")
+    playlist.title = f"Playlist {rating_key}"
+    return playlist
+
+
+def test_fetch_playlist_page_requests_the_items_endpoint():
+    playlist = _playlist(42, 3)
+    playlist_mirror._fetch_playlist_page(playlist, 500)
+    playlist.fetchItems.assert_called_once_with(
+        "/playlists/42/items", container_start=500, container_size=playlist_mirror.PLAYLIST_SCAN_PAGE_SIZE,
+    )
+
+
+def test_pages_are_requested_from_the_items_endpoint_and_joined_in_order(monkeypatch):
+    monkeypatch.setattr(playlist_mirror, "PLAYLIST_SCAN_PAGE_SIZE", 2)
+    playlist = _playlist(7, 5)
+    tracks = list(range(5))
+    playlist.fetchItems.side_effect = lambda ekey, container_start, container_size: tracks[container_start:container_start + container_size]
+
+    (fetched, items), = list(playlist_mirror._fetch_playlists_items([playlist]))
+
+    assert fetched is playlist
+    assert items == tracks
+    assert sorted(c.kwargs["container_start"] for c in playlist.fetchItems.call_args_list) == [0, 2, 4]
+    assert {c.args[0] for c in playlist.fetchItems.call_args_list} == {"/playlists/7/items"}
+
+
+def _server(*playlists):
+    return mock.Mock(**{"playlists.return_value": list(playlists)})
+
+
+def _with_items(playlist, keys, updated_at):
+    playlist.leafCount = len(keys)
+    playlist.updatedAt = datetime.fromtimestamp(updated_at)
+    playlist.addedAt = datetime.fromtimestamp(1000)
+    playlist.playlistType = "audio"
+    playlist.fetchItems.side_effect = lambda ekey, container_start, container_size: [
+        mock.Mock(ratingKey=k) for k in keys[container_start:container_start + container_size]]
+    return playlist
+
+
+def _new_keys(calls):
+    return [[item.ratingKey for item in new_items] for playlist, items, new_items in calls]
+
+
+def test_refresh_without_check_does_not_hide_new_items_from_the_check(db):
+    playlist = _with_items(_playlist(1, 0), [10, 11], updated_at=2000)
+    calls = []
+    on_changed = lambda *args: calls.append(args)
+    playlist_mirror.sync_playlist_mirror(_server(playlist), "main", on_changed=on_changed)
+
+    _with_items(playlist, [10, 11, 12], updated_at=3000)
+    mirror = playlist_mirror.sync_playlist_mirror(_server(playlist), "main")
+    assert mirror[1]["item_keys"] == [10, 11, 12]
+
+    playlist_mirror.sync_playlist_mirror(_server(playlist), "main", on_changed=on_changed)
+    assert _new_keys(calls) == [[10, 11], [12]]
+
+    playlist_mirror.sync_playlist_mirror(_server(playlist), "main", on_changed=on_changed)
+    assert len(calls) == 2
+
+
+def test_refresh_without_items_keeps_the_mirrored_items(db):
+    playlist = _with_items(_playlist(1, 0), [10, 11], updated_at=2000)
+    playlist_mirror.sync_playlist_mirror(_server(playlist), "main", on_changed=lambda *args: None)
+
+    _with_items(playlist, [10, 11, 12], updated_at=3000)
+    playlist.title = "Renamed"
+    mirror = playlist_mirror.sync_playlist_mirror(_server(playlist), "main", include=lambda p: False)
+    assert mirror[1]["title"] == "Renamed"
+    assert mirror[1]["item_keys"] == [10, 11]
+
+    calls = []
+    playlist_mirror.sync_playlist_mirror(_server(playlist), "main", on_changed=lambda *args: calls.append(args))
+    assert _new_keys(calls) == [[12]]
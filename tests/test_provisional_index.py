@@ -0,0 +1,51 @@
+from plex_playlist_sync.utils import database
+
+
+def _statuses():
+    with database.get_db() as con:
+        return [r[0] for r in con.cursor().execute("SELECT status FROM missing_tracks ORDER BY id")]
+
+
+def _age_provisional_rows(days):
+    with database.get_db() as con:
+        con.cursor().execute("UPDATE plex_library_index SET added_at=datetime('now', ?) WHERE provisional=1", (f"-{days} days",))
+
+
+def test_expired_provisional_entry_reverts_its_missing_tracks(db):
+    database.add_missing_track({"title": "Song", "artist": "Artist", "source_playlist_title": "Mix", "source_playlist_id": 1})
+    assert database.add_provisional_index_entries([{"title": "Song", "artist": "Artist"}]) == (1, 1)
+    assert _statuses() == ["downloaded"]
+
+    assert database.reconcile_provisional_index_entries(7) == (0, 0, 0)
+    _age_provisional_rows(8)
+    assert database.reconcile_provisional_index_entries(7) == (0, 1, 1)
+    assert _statuses() == ["missing"]
+
+
+def test_confirmed_provisional_entry_keeps_its_missing_tracks_downloaded(db):
+    database.add_missing_track({"title": "Song", "artist": "Artist", "source_playlist_title": "Mix", "source_playlist_id": 1})
+    database.add_provisional_index_entries([{"title": "Song", "artist": "Artist", "album": "Single"}])
+    with database.get_db() as con:
+        con.cursor().execute("INSERT INTO plex_library_index (title_clean, artist_clean, album_clean) VALUES ('song','artist','album')")
+    _age_provisional_rows(8)
+
+    assert database.reconcile_provisional_index_entries(7) == (1, 0, 0)
+    assert _statuses() == ["downloaded"]
+
+
+def test_track_back_to_missing_is_planned_and_downloaded_again(db):
+    link = "https://www.deezer.com/track/1"
+    database.add_missing_track({"title": "Song", "artist": "Artist", "source_playlist_title": "Mix", "source_playlist_id": 1})
+    track_id = database.get_missing_tracks_without_download_job()[0][0]
+    job_id = database.enqueue_download_job(link, "deezer", [track_id])["job_id"]
+    assert database.get_missing_tracks_without_download_job() == []
+    database.claim_download_jobs(limit=1)
+    database.complete_download_job(job_id)
+    database.add_provisional_index_entries([{"title": "Song", "artist": "Artist"}])
+
+    _age_provisional_rows(8)
+    assert database.reconcile_provisional_index_entries(7) == (0, 1, 1)
+
+    assert [r[0] for r in database.get_missing_tracks_without_download_job()] == [track_id]
+    result = database.enqueue_download_job(link, "deezer", [track_id])
+    assert (result["job_id"], result["requeued"], result["state"]) == (job_id, True, "pending")
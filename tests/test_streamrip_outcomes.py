@@ -0,0 +1,36 @@
+from plex_playlist_sync.utils import database, downloader
+
+TRACK_OK = "https://www.deezer.com/track/111"
+TRACK_BAD = "https://www.deezer.com/track/222"
+ALBUM = "https://www.deezer.com/album/333"
+
+
+def test_recorded_tracks_succeed_despite_a_failed_batch():
+    outcomes = downloader._parse_streamrip_outcomes(
+        [TRACK_OK, TRACK_BAD, ALBUM], "Error: track 222 is not streamable", 1, {"111"})
+    assert outcomes == {TRACK_OK: True, TRACK_BAD: False, ALBUM: False}
+
+
+def test_links_without_evidence_follow_the_exit_code():
+    outcomes = downloader._parse_streamrip_outcomes([TRACK_OK, ALBUM], "", 0, set())
+    assert outcomes == {TRACK_OK: True, ALBUM: True}
+    assert downloader._parse_streamrip_outcomes([TRACK_OK], "", None, set()) == {TRACK_OK: False}
+
+
+def test_jobs_whose_tracks_were_found_on_disk(db):
+    for title in ("One", "Two"):
+        database.add_missing_track({"title": title, "artist": "Artist", "source_playlist_title": "Mix", "source_playlist_id": 1})
+    found = database.enqueue_download_job(ALBUM, "deezer", [1])["job_id"]
+    missing = database.enqueue_download_job(TRACK_BAD, "deezer", [2])["job_id"]
+    database.add_provisional_index_entries([{"title": "One", "artist": "Artist"}])
+
+    assert database.get_download_jobs_with_tracks_downloaded([found, missing]) == [found]
+
+
+def test_failure_line_only_fails_the_link_with_that_whole_id():
+    prefix = "https://www.deezer.com/track/123"
+    suffix = "https://www.deezer.com/track/4567"
+    failing = "https://www.deezer.com/track/1234567"
+    outcomes = downloader._parse_streamrip_outcomes(
+        [prefix, suffix, failing], "2024-01-01 12:34:56 Error: https://www.deezer.com/track/1234567 failed", 0, set())
+    assert outcomes == {prefix: True, suffix: True, failing: False}
@@ -0,0 +1,34 @@
+from unittest import mock
+
+import pytest
+
+from plex_playlist_sync.utils import tidal
+
+
+@pytest.fixture
+def pool(monkeypatch, tmp_path):
+    monkeypatch.setattr(tidal, "TIDAL_SESSION_FILE", str(tmp_path / "tidal_session.json"))
+    pool = tidal.TidalSessionPool("user", "secret")
+    session = mock.Mock()
+    monkeypatch.setattr(pool, "_new_session", lambda: session)
+    monkeypatch.setattr(pool, "_save", lambda: None)
+    return pool, session
+
+
+def test_failed_login_is_not_retried_during_cooldown(pool, monkeypatch):
+    pool, session = pool
+    session.login.side_effect = RuntimeError("bad credentials")
+    now = [1000.0]
+    monkeypatch.setattr(tidal.time, "time", lambda: now[0])
+
+    with pytest.raises(RuntimeError, match="bad credentials"):
+        pool.get_session()
+    with pytest.raises(tidal.TidalUnavailable):
+        pool.get_session()
+    assert session.login.call_count == 1
+
+    now[0] += tidal.TIDAL_LOGIN_RETRY_SECONDS
+    session.login.side_effect = None
+    assert pool.get_session() is session
+    assert session.login.call_count == 2
+    assert pool.login_retry_at == 0.0